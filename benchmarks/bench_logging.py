@@ -0,0 +1,67 @@
+"""
+Logging overhead of a ClusterSecret fan-out, with debug logging off.
+
+Compares the per-namespace f-string lines of the former sync path with the
+lazy, summarized logging of sync_secret, against an API client that does
+nothing, so only the logging and payload handling is measured.
+
+    python benchmarks/bench_logging.py [namespaces] [payload KiB]
+"""
+import logging
+import os
+import sys
+import timeit
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from kubernetes.client import exceptions  # noqa: E402
+
+from kubernetes_utils import create_secret_body, stamp_namespace, sync_secret  # noqa: E402
+
+
+class NoopApi:
+    """Every child secret is missing and created."""
+
+    def read_namespaced_secret_metadata(self, name, namespace):
+        raise exceptions.ApiException(status=404)
+
+    def create_namespaced_secret(self, namespace, body):
+        return body
+
+
+def main():
+    namespaces = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    body = {
+        'metadata': {'name': 'bench', 'uid': 'bench-uid'},
+        'data': {f'key{i}': 'x' * 1024 for i in range(size)},
+    }
+    names = [f'ns{i}' for i in range(namespaces)]
+    v1 = NoopApi()
+
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, 'w'))
+    logger = logging.getLogger('bench')
+
+    def eager():
+        secret_body = create_secret_body(logger, body, v1)
+        for ns in names:
+            child = stamp_namespace(secret_body, ns)
+            logger.info(f'Re Syncing secret {body["metadata"]["name"]} in ns {ns}')
+            logger.info(f'cloning secret in namespace {ns}')
+            logger.debug(f'V1Secret= {child}')
+            logger.info('Using create_namespaced_secret')
+            logger.debug(f'response is {v1.create_namespaced_secret(ns, child)}')
+
+    def lazy():
+        secret_body = create_secret_body(logger, body, v1)
+        outcomes = Counter(sync_secret(logger, ns, body, v1, secret_body) for ns in names)
+        logger.info('Synced secret %s in %s namespaces: %s', 'bench', len(names), dict(outcomes))
+
+    for name, fn in [('f-strings per namespace', eager), ('lazy and summarized', lazy)]:
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f'{name:<24} {namespaces} namespaces, {size} KiB: {best * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
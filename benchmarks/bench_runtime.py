@@ -0,0 +1,179 @@
+"""
+Throughput and latency of the operator runtime profiles, offline.
+
+Runs each profile of runtime.py in a fresh interpreter, through two scenarios:
+
+- watch stream: the lines of a namespace watch are split and decoded like
+  kopf's watch does, then handed through a queue to a consumer task, on the
+  event loop of the profile. Reports the events per second and the latency
+  from the arrival of a chunk to the handling of each of its events.
+- fan-out: a ClusterSecret is synced into every namespace through
+  SlimCoreV1Api, against a connection pool answering without any I/O: a read
+  of the missing child secret, then its creation, whose body is encoded by
+  the Kubernetes client. Runs in a worker thread, as kopf runs the handlers.
+
+    python benchmarks/bench_runtime.py [events] [namespaces] [payload KiB]
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from runtime import PROFILES, apply_profile  # noqa: E402
+
+
+class Response:
+    """Bare urllib3 response, read with or without preloading."""
+
+    def __init__(self, status, data):
+        self.status = status
+        self.reason = 'Not Found' if status == 404 else 'OK'
+        self.data = data
+
+    def getheaders(self):
+        return {}
+
+    def drain_conn(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class PoolManager:
+    """Every child secret is missing, and its creation echoes nothing."""
+
+    not_found = json.dumps({'kind': 'Status', 'code': 404, 'reason': 'NotFound'}).encode()
+
+    def request(self, method, url, body=None, **kwargs):
+        if method == 'GET':
+            return Response(404, self.not_found)
+        return Response(201, b'{}')
+
+
+class Content:
+    """Response content of a watch, delivering one chunk per turn of the event loop."""
+
+    def __init__(self, chunks, arrivals):
+        self.chunks = chunks
+        self.arrivals = arrivals
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            self.arrivals.append(time.perf_counter())
+            yield chunk
+
+
+def watch_lines(count):
+    lines = []
+    for i in range(count):
+        lines.append(json.dumps({'type': 'MODIFIED', 'object': {
+            'apiVersion': 'v1',
+            'kind': 'Namespace',
+            'metadata': {
+                'name': f'ns{i}',
+                'uid': f'00000000-0000-0000-0000-{i:012d}',
+                'resourceVersion': str(1000 + i),
+                'labels': {'kubernetes.io/metadata.name': f'ns{i}', 'team': f'team{i % 50}'},
+                'annotations': {'owner': f'team{i % 50}@example.com'},
+                'managedFields': [{
+                    'manager': 'kubectl-create',
+                    'operation': 'Update',
+                    'apiVersion': 'v1',
+                    'fieldsType': 'FieldsV1',
+                    'fieldsV1': {'f:metadata': {'f:labels': {'.': {}, 'f:team': {}}}},
+                }],
+            },
+            'spec': {'finalizers': ['kubernetes']},
+            'status': {'phase': 'Active'},
+        }}).encode() + b'\n')
+    return lines
+
+
+async def watch_stream(events):
+    from kopf._cogs.clients import api
+
+    lines = watch_lines(events)
+    # Chunks of 64 events, as they come off the socket.
+    chunks = [b''.join(lines[i:i + 64]) for i in range(0, len(lines), 64)]
+    arrivals = []
+    latencies = []
+    queue = asyncio.Queue()
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            arrived, event = item
+            latencies.append(time.perf_counter() - arrived)
+
+    consumer = asyncio.create_task(consume())
+    started = time.perf_counter()
+    async for line in api.iter_jsonlines(Content(chunks, arrivals)):
+        await queue.put((arrivals[-1], api.json.loads(line.decode('utf-8'))))
+    await queue.put(None)
+    await consumer
+    return time.perf_counter() - started, latencies
+
+
+async def fan_out(namespaces, size):
+    from kubernetes.client import ApiClient
+
+    from kubernetes_utils import create_secret_body, sync_secret
+    from slim_api import SlimCoreV1Api
+
+    api_client = ApiClient()
+    api_client.rest_client.pool_manager = PoolManager()
+    v1 = SlimCoreV1Api(api_client)
+    logger = logging.getLogger('bench')
+    body = {
+        'metadata': {'name': 'bench', 'uid': 'bench-uid'},
+        'data': {f'key{i}': 'eA==' * 256 for i in range(size)},
+    }
+    latencies = []
+
+    def sync():
+        secret_body = create_secret_body(logger, body, v1)
+        for i in range(namespaces):
+            started = time.perf_counter()
+            sync_secret(logger, f'ns{i}', body, v1, secret_body)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.to_thread(sync)
+    return time.perf_counter() - started, latencies
+
+
+def run(profile, events, namespaces, size):
+    installed = apply_profile(profile)
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, 'w'))
+    print(f'{profile} ({", ".join(installed) or "asyncio, json"})')
+    for name, count, scenario in [
+        ('watch stream', events, lambda: watch_stream(events)),
+        ('fan-out', namespaces, lambda: fan_out(namespaces, size)),
+    ]:
+        elapsed, latencies = min((asyncio.run(scenario()) for _ in range(3)), key=lambda result: result[0])
+        p50, p99 = (quantile * 1e6 for quantile in statistics.quantiles(latencies, n=100)[49::49])
+        print(f'  {name:<13} {count / elapsed:10.0f} /s   p50 {p50:8.1f} us   p99 {p99:8.1f} us')
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] in PROFILES:
+        run(args[0], *(int(arg) for arg in args[1:]))
+        return
+    events = args[0] if args else '20000'
+    namespaces = args[1] if len(args) > 1 else '2000'
+    size = args[2] if len(args) > 2 else '16'
+    print(f'{events} watch events, fan-out to {namespaces} namespaces of {size} KiB')
+    for profile in PROFILES:
+        subprocess.run([sys.executable, __file__, profile, events, namespaces, size], check=True)
+
+
+if __name__ == '__main__':
+    main()
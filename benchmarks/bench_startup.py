@@ -0,0 +1,36 @@
+"""
+Import time of the operator, the first cost of every cold start.
+
+Imports kopf alone, then the handlers module, each in a fresh interpreter,
+and reports the best wall time of a few runs. The difference is what the
+operator adds on top of kopf before its startup handlers can run: the kube
+config and the API clients are only built on first use, and opentelemetry
+only imported when tracing is set up.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+import os
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def import_time(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f'import {module}'], cwd=SRC, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = min(import_time('sys') for _ in range(runs))
+    print(f'{"module":<10} {"import ms":>10}')
+    for module in ('kopf', 'handlers'):
+        best = min(import_time(module) for _ in range(runs))
+        print(f'{module:<10} {(best - baseline) * 1000:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Payload and decoding cost of the reads of the operator, client models vs slim records.
+
+Builds the JSON the API server would return for a full NamespaceList and for
+the same list as PartialObjectMetadataList, then times the decoding of each:
+the full list into V1Namespace models as CoreV1Api.list_namespace does, and
+the metadata list into the NamespaceRecords of SlimCoreV1Api. Then does the
+same for as many reads of a child secret, into V1Secret models or SecretRecords.
+
+    python benchmarks/bench_wire.py [namespaces]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from kubernetes.client import ApiClient  # noqa: E402
+
+from slim_api import loads, namespace_records, secret_record  # noqa: E402
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+def namespace(i):
+    metadata = {
+        'name': f'ns{i}',
+        'uid': f'00000000-0000-0000-0000-{i:012d}',
+        'resourceVersion': str(1000 + i),
+        'creationTimestamp': '2024-01-01T00:00:00Z',
+        'labels': {'kubernetes.io/metadata.name': f'ns{i}', 'team': f'team{i % 50}'},
+    }
+    full = dict(metadata, annotations={'owner': f'team{i % 50}@example.com'}, managedFields=[{
+        'manager': 'kubectl-create',
+        'operation': 'Update',
+        'apiVersion': 'v1',
+        'time': '2024-01-01T00:00:00Z',
+        'fieldsType': 'FieldsV1',
+        'fieldsV1': {'f:metadata': {'f:labels': {'.': {}, 'f:kubernetes.io/metadata.name': {}, 'f:team': {}}}},
+    }])
+    return (
+        {'metadata': full, 'spec': {'finalizers': ['kubernetes']}, 'status': {'phase': 'Active'}},
+        {'kind': 'PartialObjectMetadata', 'apiVersion': 'meta.k8s.io/v1', 'metadata': metadata},
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    full_items, metadata_items = zip(*(namespace(i) for i in range(count)))
+    full = json.dumps({'kind': 'NamespaceList', 'apiVersion': 'v1', 'items': full_items}).encode()
+    metadata = json.dumps({
+        'kind': 'PartialObjectMetadataList',
+        'apiVersion': 'meta.k8s.io/v1',
+        'items': metadata_items,
+    }).encode()
+    secret = json.dumps({
+        'kind': 'Secret',
+        'apiVersion': 'v1',
+        'metadata': dict(full_items[0]['metadata'], name='mysecret', namespace='ns0'),
+        'data': {f'key{i}': 'dmFsdWU=' * 16 for i in range(8)},
+        'type': 'Opaque',
+    }).encode()
+    api_client = ApiClient()
+
+    cases = [
+        ('full V1NamespaceList', full, lambda: api_client.deserialize(Response(full), 'V1NamespaceList')),
+        ('metadata records', metadata, lambda: namespace_records(loads(metadata))),
+        (
+            'V1Secret reads',
+            secret,
+            lambda: [api_client.deserialize(Response(secret), 'V1Secret') for _ in range(count)],
+        ),
+        ('SecretRecord reads', secret, lambda: [secret_record(loads(secret)) for _ in range(count)]),
+    ]
+    print(f'{count} namespaces, {count} secret reads')
+    for name, payload, decode in cases:
+        best = min(timeit.repeat(decode, number=1, repeat=5))
+        print(f'{name:<22} {len(payload) / 1024:8.1f} KiB {best * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
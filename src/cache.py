@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from models import BaseClusterSecret
 
@@ -21,6 +21,16 @@ class Cache(ABC):
     def all_cluster_secret(self) -> List[BaseClusterSecret]:
         pass
 
+    @abstractmethod
+    def get_cluster_secrets_by_namespace(self, namespace: str) -> List[BaseClusterSecret]:
+        """Returns the ClusterSecrets currently synced into the given namespace."""
+        pass
+
+    @abstractmethod
+    def get_cluster_secrets_by_source(self, namespace: str, name: str) -> List[BaseClusterSecret]:
+        """Returns the ClusterSecrets reading their data from the given secret with valueFrom."""
+        pass
+
     def has_cluster_secret(self, uid: str) -> bool:
         return self.get_cluster_secret(uid) is not None
 
@@ -28,15 +38,178 @@ class Cache(ABC):
 class MemoryCache(Cache):
     def __init__(self) -> None:
         self.csecs: Dict[str, BaseClusterSecret] = {}
+        # Reverse index: namespace -> UIDs of the ClusterSecrets synced into it.
+        self.namespace_index: Dict[str, Set[str]] = {}
+        # Namespaces each UID was indexed under, so stale entries can be dropped on update.
+        self.indexed_namespaces: Dict[str, Set[str]] = {}
+        # Dependency graph: valueFrom source secret (namespace, name) -> UIDs of the ClusterSecrets reading it.
+        self.source_index: Dict[Tuple[str, str], Set[str]] = {}
+        self.indexed_sources: Dict[str, Tuple[str, str]] = {}
 
     def get_cluster_secret(self, uid: str) -> Optional[BaseClusterSecret]:
         return self.csecs.get(uid, None)
 
     def set_cluster_secret(self, cluster_secret: BaseClusterSecret):
         self.csecs[cluster_secret.uid] = cluster_secret
+        self._unindex(cluster_secret.uid)
+        namespaces = set(cluster_secret.synced_namespace)
+        for namespace in namespaces:
+            self.namespace_index.setdefault(namespace, set()).add(cluster_secret.uid)
+        self.indexed_namespaces[cluster_secret.uid] = namespaces
+        source = cluster_secret.value_from_source()
+        if source is not None:
+            self.source_index.setdefault(source, set()).add(cluster_secret.uid)
+            self.indexed_sources[cluster_secret.uid] = source
 
     def remove_cluster_secret(self, uid: str):
         self.csecs.pop(uid)
+        self._unindex(uid)
 
     def all_cluster_secret(self) -> List[BaseClusterSecret]:
         return list(self.csecs.values())
+
+    def get_cluster_secrets_by_namespace(self, namespace: str) -> List[BaseClusterSecret]:
+        return [self.csecs[uid] for uid in self.namespace_index.get(namespace, ())]
+
+    def get_cluster_secrets_by_source(self, namespace: str, name: str) -> List[BaseClusterSecret]:
+        return [self.csecs[uid] for uid in self.source_index.get((namespace, name), ())]
+
+    def _unindex(self, uid: str):
+        for namespace in self.indexed_namespaces.pop(uid, ()):
+            uids = self.namespace_index.get(namespace)
+            if uids is None:
+                continue
+            uids.discard(uid)
+            if not uids:
+                del self.namespace_index[namespace]
+
+        source = self.indexed_sources.pop(uid, None)
+        if source is not None:
+            uids = self.source_index[source]
+            uids.discard(uid)
+            if not uids:
+                del self.source_index[source]
+
+
+class NamespaceCache(ABC):
+    @abstractmethod
+    def get_labels(self, name: str) -> Optional[Dict[str, str]]:
+        pass
+
+    @abstractmethod
+    def set_namespace(self, name: str, labels: Optional[Dict[str, str]]):
+        pass
+
+    @abstractmethod
+    def remove_namespace(self, name: str):
+        pass
+
+    @abstractmethod
+    def all_namespaces(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def select(self, selector: Dict[str, Any]) -> Set[str]:
+        """Returns the namespaces whose labels match a Kubernetes label selector."""
+        pass
+
+    def has_namespace(self, name: str) -> bool:
+        return self.get_labels(name) is not None
+
+    def replace_all(self, namespaces: Dict[str, Optional[Dict[str, str]]]):
+        for name in set(self.all_namespaces()).difference(namespaces):
+            self.remove_namespace(name)
+        for name, labels in namespaces.items():
+            self.set_namespace(name, labels)
+
+
+class MemoryNamespaceCache(NamespaceCache):
+    def __init__(self) -> None:
+        self.labels: Dict[str, Dict[str, str]] = {}
+        # Label indexes: (key, value) -> namespaces and key -> namespaces.
+        self.label_index: Dict[Tuple[str, str], Set[str]] = {}
+        self.key_index: Dict[str, Set[str]] = {}
+
+    def get_labels(self, name: str) -> Optional[Dict[str, str]]:
+        return self.labels.get(name, None)
+
+    def set_namespace(self, name: str, labels: Optional[Dict[str, str]]):
+        labels = dict(labels or {})
+        if self.labels.get(name) == labels:
+            return
+        self._unindex(name)
+        self.labels[name] = labels
+        for key, value in labels.items():
+            self.label_index.setdefault((key, value), set()).add(name)
+            self.key_index.setdefault(key, set()).add(name)
+
+    def remove_namespace(self, name: str):
+        self._unindex(name)
+
+    def all_namespaces(self) -> List[str]:
+        return list(self.labels.keys())
+
+    def select(self, selector: Dict[str, Any]) -> Set[str]:
+        selected: Set[str] = set(self.labels.keys())
+        for key, value in (selector.get('matchLabels') or {}).items():
+            selected &= self.label_index.get((key, str(value)), set())
+
+        for expression in selector.get('matchExpressions') or []:
+            key = expression.get('key')
+            operator = expression.get('operator')
+            values = expression.get('values') or []
+            with_values = set().union(*(self.label_index.get((key, str(value)), set()) for value in values))
+            if operator == 'In':
+                selected &= with_values
+            elif operator == 'NotIn':
+                selected -= with_values
+            elif operator == 'Exists':
+                selected &= self.key_index.get(key, set())
+            elif operator == 'DoesNotExist':
+                selected -= self.key_index.get(key, set())
+            else:
+                raise ValueError(f'Unknown label selector operator: {operator}')
+        return selected
+
+    def _unindex(self, name: str):
+        for key, value in self.labels.pop(name, {}).items():
+            for index, index_key in ((self.label_index, (key, value)), (self.key_index, key)):
+                names = index.get(index_key)
+                if names is None:
+                    continue
+                names.discard(name)
+                if not names:
+                    del index[index_key]
+
+
+class ChildSecretCache(ABC):
+    @abstractmethod
+    def get_digest(self, namespace: str, name: str) -> Optional[str]:
+        """Returns the digest of the child secret, None if missing or not managed by ClusterSecret."""
+        pass
+
+    @abstractmethod
+    def set_digest(self, namespace: str, name: str, digest: Optional[str]):
+        pass
+
+    @abstractmethod
+    def remove_child(self, namespace: str, name: str):
+        pass
+
+
+class MemoryChildSecretCache(ChildSecretCache):
+    def __init__(self) -> None:
+        # (Namespace, Name) -> Digest of the type and data of the child secret.
+        self.digests: Dict[Tuple[str, str], str] = {}
+
+    def get_digest(self, namespace: str, name: str) -> Optional[str]:
+        return self.digests.get((namespace, name), None)
+
+    def set_digest(self, namespace: str, name: str, digest: Optional[str]):
+        if digest is None:
+            self.remove_child(namespace, name)
+        else:
+            self.digests[(namespace, name)] = digest
+
+    def remove_child(self, namespace: str, name: str):
+        self.digests.pop((namespace, name), None)
@@ -0,0 +1,167 @@
+"""
+Kubernetes API clients built on first use, sharing explicitly configured connection pools.
+
+Loading the kube config and building the clients wait for the first API call,
+so importing the handlers stays cheap, and processes never calling the API,
+like the tests, need no kube config at all.
+
+All the API clients of the operator share one connection pool, and the watches
+of the informers, which hold their connection for minutes, have their own so
+they never starve the fan-out. The pools keep the connections alive with TCP
+keep-alive, may block the requests beyond their size instead of opening
+connections they would discard, and may multiplex the requests over HTTP/2.
+Their utilization is exported as metrics.
+"""
+import logging
+import socket
+import threading
+from functools import cache
+from typing import Any, Callable, Dict, List, Tuple
+
+from kubernetes import client, config
+from kubernetes.client import ApiClient
+from urllib3.connection import HTTPConnection
+
+from metrics import REGISTRY, Registry
+from os_utils import (
+    get_connection_keepalive,
+    get_connection_pool_block,
+    get_connection_pool_maxsize,
+    get_http2_enabled,
+    in_cluster,
+)
+
+# The pool of the API requests, and the pool of the watches.
+API = 'api'
+WATCH = 'watch'
+
+REGISTRY.describe('clustersecret_http_pool_maxsize', 'gauge', 'Connections kept by the pool, by client.')
+REGISTRY.describe(
+    'clustersecret_http_pool_in_use', 'gauge',
+    'Connections in use, or requests in flight over HTTP/2, by client.',
+)
+REGISTRY.describe('clustersecret_http_pool_idle', 'gauge', 'Idle connections kept alive, by client.')
+REGISTRY.describe(
+    'clustersecret_http_pool_connections_opened_total', 'counter',
+    'Connections opened, growing faster than the pool size when connections are discarded.',
+)
+REGISTRY.describe('clustersecret_http_pool_requests_total', 'counter', 'Requests sent through the pool, by client.')
+
+logger = logging.getLogger('clients')
+
+api_clients: Dict[str, ApiClient] = {}
+api_clients_lock = threading.Lock()
+
+
+@cache
+def load_config():
+    """Load the in-cluster or the local kube config, once"""
+    if in_cluster():
+        config.load_incluster_config()
+    else:
+        config.load_kube_config()
+
+
+def keepalive_options(idle: int) -> List[Tuple[int, int, int]]:
+    """Socket options probing a connection idle for ``idle`` seconds, and dropping it after 3 failed probes"""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', idle), ('TCP_KEEPCNT', 3)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def build_api_client(name: str) -> ApiClient:
+    configuration = client.Configuration.get_default_copy()
+    if get_connection_pool_maxsize() is not None:
+        configuration.connection_pool_maxsize = get_connection_pool_maxsize()
+    api_client = ApiClient(configuration)
+
+    # The watches stream over HTTP/1.1: an informer interrupts its watch by closing the connection.
+    if name == API and get_http2_enabled():
+        try:
+            from http2 import Http2PoolManager
+        except ImportError:
+            logger.warning('HTTP/2 is enabled but the httpx packages are not installed')
+        else:
+            api_client.rest_client.pool_manager = Http2PoolManager(
+                configuration,
+                maxsize=configuration.connection_pool_maxsize,
+                keepalive=get_connection_keepalive(),
+            )
+            return api_client
+
+    pool_options: Dict[str, Any] = {'block': name == API and get_connection_pool_block()}
+    if get_connection_keepalive() > 0:
+        pool_options['socket_options'] = (
+            HTTPConnection.default_socket_options + keepalive_options(get_connection_keepalive())
+        )
+    api_client.rest_client.pool_manager.connection_pool_kw.update(pool_options)
+    return api_client
+
+
+def get_api_client(name: str = API) -> ApiClient:
+    """The API client of the pool ``name``, built on first use"""
+    with api_clients_lock:
+        if name not in api_clients:
+            load_config()
+            api_clients[name] = build_api_client(name)
+        return api_clients[name]
+
+
+def pool_stats(pool_manager: Any) -> Dict[str, int]:
+    """Utilization of a urllib3 pool manager, summed over its host pools, or of the HTTP/2 one"""
+    if hasattr(pool_manager, 'stats'):
+        return pool_manager.stats()
+
+    stats = {'maxsize': 0, 'in_use': 0, 'idle': 0, 'opened': 0, 'requests': 0}
+    for key in pool_manager.pools.keys():
+        pool = pool_manager.pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        # The queue holds the idle connections, and a None for each one yet to open.
+        queued = list(pool.pool.queue)
+        stats['maxsize'] += pool.pool.maxsize
+        stats['in_use'] += pool.pool.maxsize - len(queued)
+        stats['idle'] += sum(conn is not None for conn in queued)
+        stats['opened'] += pool.num_connections
+        stats['requests'] += pool.num_requests
+    return stats
+
+
+def collect_pools(registry: Registry):
+    with api_clients_lock:
+        clients = dict(api_clients)
+    for name, api_client in clients.items():
+        stats = pool_stats(api_client.rest_client.pool_manager)
+        for key, metric in (
+            ('maxsize', 'clustersecret_http_pool_maxsize'),
+            ('in_use', 'clustersecret_http_pool_in_use'),
+            ('idle', 'clustersecret_http_pool_idle'),
+            ('opened', 'clustersecret_http_pool_connections_opened_total'),
+            ('requests', 'clustersecret_http_pool_requests_total'),
+        ):
+            if key in stats:
+                registry.set(metric, stats[key], client=name)
+
+
+REGISTRY.add_collector(collect_pools)
+
+
+class LazyApi:
+    """Proxy of a Kubernetes API client, built by ``factory`` on first use with the shared API client."""
+
+    def __init__(self, factory: Callable[[ApiClient], Any]) -> None:
+        self.factory = factory
+        self.api: Any = None
+        self.lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self.api is None:
+            with self.lock:
+                if self.api is None:
+                    self.api = self.factory(get_api_client())
+        return self.api
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
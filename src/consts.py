@@ -1,14 +1,56 @@
 """
 Constants used by the project
 """
+from log_utils import log_level
 
 CREATE_BY_ANNOTATION = 'clustersecret.io/created-by'
 CREATE_BY_AUTHOR = 'ClusterSecrets'
 LAST_SYNC_ANNOTATION = 'clustersecret.io/last-sync'
 VERSION_ANNOTATION = 'clustersecret.io/version'
+ROLLOUT_PAUSED_ANNOTATION = 'clustersecret.io/rollout-paused'
 
 CLUSTER_SECRET_LABEL = "clustersecret.io"
+# Name of the ClusterSecret on its child secrets, shared by all the versions of an immutable one.
+ALIAS_LABEL = 'clustersecret.io/alias'
 
-BLOCKED_ANNOTATIONS = ["kopf.zalando.org", "kubectl.kubernetes.io"]
+# Longest label value, and longest secret name.
+MAX_LABEL_VALUE_LENGTH = 63
+MAX_NAME_LENGTH = 253
+
+# Previous versions of an immutable child secret kept for the pods still mounting them.
+DEFAULT_KEEP_VERSIONS = 1
+
+# Label set by Kubernetes on every namespace to its name.
+NAMESPACE_NAME_LABEL = 'kubernetes.io/metadata.name'
+
+# Prefixes of the annotations never copied to the child secrets, or domain suffixes when starting with a dot:
+# those of kopf, including the per-shard ones, and those controlling the operator.
+BLOCKED_ANNOTATIONS = [
+    "kopf.zalando.org",
+    "kubectl.kubernetes.io",
+    ".shards.clustersecret.io",
+    ROLLOUT_PAUSED_ANNOTATION,
+]
 
 BLOCKED_LABELS = ["app.kubernetes.io"]
+
+# Longest accepted matchNamespace / avoidNamespaces pattern.
+MAX_PATTERN_LENGTH = 256
+
+# Status condition reporting whether the namespace patterns are usable.
+PATTERNS_CONDITION = 'PatternsValid'
+
+# Environment variables overriding kopf settings: env -> ('section.field', type)
+KOPF_SETTINGS_ENV = {
+    'KOPF_MAX_WORKERS': ('execution.max_workers', int),
+    'KOPF_WORKER_LIMIT': ('batching.worker_limit', int),
+    'KOPF_BATCH_WINDOW': ('batching.batch_window', float),
+    'KOPF_IDLE_TIMEOUT': ('batching.idle_timeout', float),
+    'KOPF_WATCH_SERVER_TIMEOUT': ('watching.server_timeout', int),
+    'KOPF_WATCH_CLIENT_TIMEOUT': ('watching.client_timeout', float),
+    'KOPF_WATCH_CONNECT_TIMEOUT': ('watching.connect_timeout', float),
+    'KOPF_WATCH_RECONNECT_BACKOFF': ('watching.reconnect_backoff', float),
+    'KOPF_REQUEST_TIMEOUT': ('networking.request_timeout', float),
+    'KOPF_CONNECT_TIMEOUT': ('networking.connect_timeout', float),
+    'KOPF_POSTING_LEVEL': ('posting.level', log_level),
+}
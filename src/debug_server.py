@@ -0,0 +1,161 @@
+"""
+Opt-in debug HTTP endpoints to look inside the running operator.
+
+Every request needs the ``Authorization: Bearer <token>`` header. The
+endpoints only read the process state, and the costly ones are bounded:
+tracemalloc runs only between an explicit start and stop, and a single
+CPU profile of at most ``max_profile_seconds`` runs at a time.
+
+- ``/debug/tasks``: the stacks of the asyncio tasks.
+- ``/debug/memory``: the tracemalloc top allocations and the size of the caches,
+  ``?tracemalloc=start|stop`` toggles the allocation tracing.
+- ``/debug/profile?seconds=N``: a sampling CPU profile of all the threads, as
+  collapsed stacks for flame graph tools.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from cache import Cache, NamespaceCache
+
+
+def format_tasks(limit: int = 20) -> str:
+    """Name, coroutine and stack of every asyncio task of the running loop"""
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    lines = [f'{len(tasks)} tasks']
+    for task in tasks:
+        coro = task.get_coro()
+        lines.append(f'{task.get_name()}: {getattr(coro, "__qualname__", coro)}')
+        for frame in task.get_stack(limit=limit):
+            lines.append(f'    {frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}')
+    return '\n'.join(lines)
+
+
+def cache_sizes(csecs_cache: Cache, namespaces_cache: NamespaceCache, top: int = 20) -> Dict[str, Any]:
+    """Size of the cached ClusterSecrets, approximated by the length of their JSON bodies"""
+    sizes = []
+    for cluster_secret in csecs_cache.all_cluster_secret():
+        sizes.append({
+            'name': cluster_secret.name,
+            'bytes': len(json.dumps(cluster_secret.body, default=str)),
+            'synced_namespaces': len(cluster_secret.synced_namespace),
+        })
+    sizes.sort(key=lambda size: size['bytes'], reverse=True)
+    return {
+        'cluster_secrets': len(sizes),
+        'cluster_secrets_bytes': sum(size['bytes'] for size in sizes),
+        'namespaces': len(namespaces_cache.all_namespaces()),
+        'largest': sizes[:top],
+    }
+
+
+def top_allocations(limit: int = 20) -> List[str]:
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+    return [str(stat) for stat in snapshot.statistics('lineno')[:limit]]
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> Counter:
+    """Collapsed stacks of all the other threads, sampled every interval for the given seconds"""
+    own = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f'{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            stacks[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+class DebugServer:
+    """aiohttp server of the debug endpoints, authenticated by a bearer token."""
+
+    def __init__(
+        self,
+        token: str,
+        csecs_cache: Cache,
+        namespaces_cache: NamespaceCache,
+        port: int = 8081,
+        max_profile_seconds: float = 30,
+    ) -> None:
+        self.token = token
+        self.csecs_cache = csecs_cache
+        self.namespaces_cache = namespaces_cache
+        self.port = port
+        self.max_profile_seconds = max_profile_seconds
+        self.profiling = asyncio.Lock()
+        self.runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.authenticate])
+        app.router.add_get('/debug/tasks', self.tasks)
+        app.router.add_get('/debug/memory', self.memory)
+        app.router.add_get('/debug/profile', self.profile)
+        return app
+
+    @web.middleware
+    async def authenticate(self, request: web.Request, handler):
+        expected = f'Bearer {self.token}'.encode()
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+
+    async def tasks(self, request: web.Request) -> web.Response:
+        return web.Response(text=format_tasks(int(request.query.get('limit', 20))))
+
+    async def memory(self, request: web.Request) -> web.Response:
+        action = request.query.get('tracemalloc')
+        if action == 'start' and not tracemalloc.is_tracing():
+            tracemalloc.start(int(request.query.get('frames', 1)))
+        elif action == 'stop':
+            tracemalloc.stop()
+
+        limit = int(request.query.get('limit', 20))
+        # ru_maxrss is in KiB on Linux.
+        return web.json_response({
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'tracemalloc': tracemalloc.is_tracing(),
+            'traced_bytes': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+            'top_allocations': top_allocations(limit),
+            'caches': cache_sizes(self.csecs_cache, self.namespaces_cache, limit),
+        })
+
+    async def profile(self, request: web.Request) -> web.Response:
+        seconds = min(float(request.query.get('seconds', 5)), self.max_profile_seconds)
+        if self.profiling.locked():
+            raise web.HTTPConflict(text='A profile is already running')
+        async with self.profiling:
+            # Sampled from another thread, so the event loop keeps running and shows up in the profile.
+            stacks = await asyncio.to_thread(sample_stacks, seconds)
+        return web.Response(text='\n'.join(f'{stack} {count}' for stack, count in stacks.most_common()))
+
+    async def start(self, logger: logging.Logger):
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, port=self.port).start()
+        logger.info('Debug endpoints listening on port %s', self.port)
+
+    async def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,62 @@
+import hashlib
+import json
+from typing import Any, Iterable, Optional
+
+import kopf
+
+# Fields kept in the diff-base as digests instead of their full values.
+DIGESTED_FIELDS = ['data']
+
+
+def value_digest(value: Any) -> str:
+    """Digest of a single value of the ClusterSecret data
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True)
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class DigestDiffBaseStorage(kopf.AnnotationsDiffBaseStorage):
+    """Kopf diff-base annotation storing digests of the secret data, not the data itself.
+
+    Each key of ``data`` is replaced by the digest of its value, so kopf still
+    detects which keys changed while the ``last-handled-configuration``
+    annotation stays small. The handlers must take the values from the body,
+    the ``old`` and ``new`` of the ``data`` field are digests.
+    """
+
+    def build(
+        self,
+        *,
+        body: kopf.Body,
+        extra_fields: Optional[Iterable[Any]] = None,
+    ) -> kopf.BodyEssence:
+        essence = super().build(body=body, extra_fields=extra_fields)
+        for field in DIGESTED_FIELDS:
+            if isinstance(essence.get(field), dict):
+                essence[field] = {key: value_digest(value) for key, value in essence[field].items()}
+        return essence
+
+
+class ReadOnlyDiffBaseStorage(DigestDiffBaseStorage):
+    """Diff-base storage of the replicas standing by, reading the one of the leader but never storing.
+
+    A standby replica storing the diff-base of the changes it sees would make
+    the leader take them as already handled.
+    """
+
+    def store(self, *, body: kopf.Body, patch: kopf.Patch, essence: kopf.BodyEssence) -> None:
+        pass
+
+
+class ReadOnlyProgressStorage(kopf.SmartProgressStorage):
+    """Progress storage of the replicas standing by, reading the one of the leader but never storing."""
+
+    def store(self, *, key: kopf.HandlerId, record: kopf.ProgressRecord, body: kopf.Body, patch: kopf.Patch) -> None:
+        pass
+
+    def purge(self, *, key: kopf.HandlerId, body: kopf.Body, patch: kopf.Patch) -> None:
+        pass
+
+    def touch(self, *, body: kopf.Body, patch: kopf.Patch, value: Optional[str]) -> None:
+        pass
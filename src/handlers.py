@@ -1,34 +1,155 @@
+import asyncio
+import functools
 import logging
-import sys
-from typing import Any, Dict, List, Optional
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
 import kopf
-from kubernetes import client, config
+from kubernetes import client
+from urllib3.exceptions import HTTPError
 
-from cache import Cache, MemoryCache
-from kubernetes_utils import delete_secret, get_ns_list, sync_secret, patch_clustersecret_status, \
-    create_secret_metadata, secret_exists, get_custom_objects_by_kind
+from clients import WATCH, LazyApi, get_api_client
+from cache import Cache, ChildSecretCache, MemoryCache, MemoryChildSecretCache, MemoryNamespaceCache, NamespaceCache
+from consts import ALIAS_LABEL, CREATE_BY_ANNOTATION, PATTERNS_CONDITION
+from debug_server import DebugServer
+from diffbase import DigestDiffBaseStorage, ReadOnlyDiffBaseStorage, ReadOnlyProgressStorage
+from kubernetes_utils import delete_children, get_ns_list, sync_secret, patch_clustersecret_status, prune_versions, \
+    create_data_patch, create_secret_body, get_custom_objects_by_kind, namespace_matches, patterns_condition, \
+    data_digest, is_immutable, child_status, namespace_watch_selector, child_digest, read_data_secret, \
+    secret_metadata, delete_secret
+from informer import Informer
+from log_utils import Count, Redacted, install_sampling
+from metrics import MetricsServer, mark_startup, startup_phases
 from models import BaseClusterSecret
+from patterns import PatternError, validate_patterns
 
 # In-memory dictionary for all ClusterSecrets in the Cluster. UID -> ClusterSecret Body
 csecs_cache: Cache = MemoryCache()
 
-from os_utils import in_cluster
+# In-memory store of the namespaces in the Cluster, indexed by label. Name -> Labels
+namespaces_cache: NamespaceCache = MemoryNamespaceCache()
+
+# Digests of the child secrets, watched when standby replicas are enabled. (Namespace, Name) -> Digest
+children_cache: ChildSecretCache = MemoryChildSecretCache()
+
+from os_utils import get_reconcile_interval, get_reconcile_batch_size, get_reconcile_jitter, \
+    get_reconcile_qps, get_sharding_enabled, get_pod_name, get_pod_namespace, get_shard_lease_duration, \
+    get_kopf_settings, get_tracing_enabled, get_log_sample_burst, get_log_sample_window, \
+    get_debug_token, get_debug_port, get_rollout_waves, get_rollout_concurrency, get_rollout_qps, get_rollout_pause, \
+    get_source_watch_enabled, get_watch_page_size, get_watch_timeout, get_metrics_port, \
+    get_namespace_watch_filter, get_shed_backlog, get_ready_backlog, get_readiness_port, get_standby_enabled, \
+    get_leader_lease_duration
+from reconciler import Reconciler
+from rollout import PausedAnnotationHook, Rollout, RolloutHook
+from sharding import SHARD_ANNOTATION_SUFFIX, SHARD_FINALIZER_PREFIX, STANDBY_FINALIZER, HashRing, LeaderElector, \
+    ShardManager
+from shedding import LoadMonitor, ReadinessServer, StatusFlusher
+from slim_api import SlimCoreV1Api
+from throttling import ThrottledApi
+from tracing import TracedApi, setup_tracing, span, traced
+
+# Built on the first API call, after loading the kube config.
+v1 = LazyApi(SlimCoreV1Api)
+custom_objects_api = LazyApi(client.CustomObjectsApi)
+
+if get_tracing_enabled() and setup_tracing(logging.getLogger(__name__)):
+    v1 = TracedApi(v1)
+    custom_objects_api = TracedApi(custom_objects_api)
+
+# Backlog of the fan-outs, telling when to shed the low-priority work and whether the operator is ready.
+load = LoadMonitor(shed_backlog=get_shed_backlog(), ready_backlog=get_ready_backlog())
+
+# Status patches following namespace events, deferred while overloaded.
+status_flusher = StatusFlusher(load, lambda logger, name, new_status: patch_clustersecret_status(
+    logger=logger,
+    name=name,
+    new_status=new_status,
+    custom_objects_api=custom_objects_api,
+))
+status_flusher_task: Optional[asyncio.Task] = None
+
+# Background task filling the caches and starting the watches.
+warm_up_task: Optional[asyncio.Task] = None
+
+# Background task running the periodic reconciliation sweeps, if enabled.
+reconciler_task: Optional[asyncio.Task] = None
+
+# Membership of the operator replicas when sharding is enabled, and its heartbeat task.
+shards: Optional[ShardManager] = None
+shards_task: Optional[asyncio.Task] = None
+
+# Election of the active replica when standby replicas are enabled, and its renewal task.
+leader: Optional[LeaderElector] = None
+leader_task: Optional[asyncio.Task] = None
+
+# Kopf settings, and the finalizer and storages of the leader, swapped with read-only ones when not leading.
+operator_settings: Optional[kopf.OperatorSettings] = None
+leader_persistence: Optional[Tuple[str, kopf.ProgressStorage, kopf.DiffBaseStorage]] = None
+
+# Digest of the data of the valueFrom source secrets last seen. (Namespace, Name) -> Digest
+source_digests: Dict[Tuple[str, str], str] = {}
+
+# Debug endpoints, served only when a debug token is configured.
+debug_server: Optional[DebugServer] = None
+
+# Metrics endpoint, served only when a metrics port is configured.
+metrics_server: Optional[MetricsServer] = None
+
+# Readiness endpoint, served unless its port is set to 0.
+readiness_server: Optional[ReadinessServer] = None
+
+# Watches of the namespaces and secrets, each running in its own thread.
+informers: List[Informer] = []
+namespace_informer: Optional[Informer] = None
+children_informer: Optional[Informer] = None
 
-if "unittest" not in sys.modules:
-    # Loading kubeconfig
-    if in_cluster():
-        # Loading kubeconfig
-        config.load_incluster_config()
-    else:
-        # Loading using the local kubevonfig.
-        config.load_kube_config()
 
-v1 = client.CoreV1Api()
-custom_objects_api = client.CustomObjectsApi()
+def owned(uid: str, **_) -> bool:
+    """Whether this replica handles the ClusterSecret, always true without sharding nor standby."""
+    if shards is not None:
+        return shards.owns(uid)
+    return leader is None or leader.leading
+
+
+def synced_namespaces(name: str, body: Dict[str, Any]) -> List[str]:
+    """The namespaces a ClusterSecret is synced into, from its deferred status if any, else from its body."""
+    status = status_flusher.get(name) or body.get('status', {})
+    return status.get('create_fn', {}).get('syncedns', [])
+
+
+def matched_namespaces(logger: logging.Logger, name: str, body: Dict[str, Any]) -> List[str]:
+    """get_ns_list, rejecting invalid or too expensive patterns with a status condition
+    """
+    try:
+        validate_patterns(body)
+        with span('get_ns_list', **{'k8s.name': name}) as current:
+            matched = get_ns_list(logger, body, v1, namespaces_cache)
+            if current is not None:
+                current.set_attribute('namespaces', len(matched))
+    except PatternError as e:
+        logger.error('Rejecting the namespace patterns of %s: %s', name, e)
+        patch_clustersecret_status(
+            logger=logger,
+            name=name,
+            new_status={'conditions': [patterns_condition(str(e))]},
+            custom_objects_api=custom_objects_api,
+        )
+        raise kopf.PermanentError(str(e))
+
+    # Clear a previous rejection.
+    conditions = body.get('status', {}).get('conditions', [])
+    if any(c.get('type') == PATTERNS_CONDITION and c.get('status') == 'False' for c in conditions):
+        patch_clustersecret_status(
+            logger=logger,
+            name=name,
+            new_status={'conditions': [patterns_condition()]},
+            custom_objects_api=custom_objects_api,
+        )
+    return matched
 
 
-@kopf.on.delete('clustersecret.io', 'v1', 'clustersecrets')
+@kopf.on.delete('clustersecret.io', 'v1', 'clustersecrets', when=owned)
+@traced
 def on_delete(
     body: Dict[str, Any],
     uid: str,
@@ -36,25 +157,29 @@ def on_delete(
     logger: logging.Logger,
     **_,
 ):
-    syncedns = body.get('status', {}).get('create_fn', {}).get('syncedns', [])
+    syncedns = synced_namespaces(name, body)
     for ns in syncedns:
-        logger.info(f'deleting secret {name} from namespace {ns}')
-        delete_secret(logger, ns, name, v1)
+        delete_children(logger, ns, name, body, v1)
+    logger.info('Deleted secret %s from %s namespaces', name, len(syncedns))
+    status_flusher.discard(name)
 
     # Delete from memory to prevent syncing with new namespaces
     try:
         csecs_cache.remove_cluster_secret(uid)
     except KeyError as k:
-        logger.info(f'This csec were not found in memory, maybe it was created in another run: {k}')
+        logger.info('This csec were not found in memory, maybe it was created in another run: %s', k)
         return
-    logger.debug(f'csec {uid} deleted from memory ok')
+    logger.debug('csec %s deleted from memory ok', uid)
+    refresh_namespace_selector(logger)
 
 
-@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='avoidNamespaces')
-@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='matchNamespace')
+@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='avoidNamespaces', when=owned)
+@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='matchNamespace', when=owned)
+@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='namespaceSelector', when=owned)
+@traced
 def on_fields_avoid_or_match_namespace(
-    old: Optional[List[str]],
-    new: List[str],
+    old: Optional[Any],
+    new: Any,
     name: str,
     body,
     uid: str,
@@ -66,22 +191,27 @@ def on_fields_avoid_or_match_namespace(
         logger.debug('This is a new object: Ignoring.')
         return
 
-    logger.debug(f'Avoid or match namespaces changed: {old} -> {new}')
-    logger.debug(f'Updating Object body == {body}')
+    logger.debug('Avoid or match namespaces changed: %s -> %s', old, new)
+    logger.debug('Updating Object body == %s', Redacted(body))
 
-    syncedns = body.get('status', {}).get('create_fn', {}).get('syncedns', [])
+    syncedns = synced_namespaces(name, body)
 
-    updated_matched = get_ns_list(logger, body, v1)
+    updated_matched = matched_namespaces(logger, name, body)
     to_add = set(updated_matched).difference(set(syncedns))
     to_remove = set(syncedns).difference(set(updated_matched))
 
-    logger.debug(f'Add secret to namespaces: {to_add}, remove from: {to_remove}')
+    logger.debug('Add secret to namespaces: %s, remove from: %s', Count(to_add), Count(to_remove))
 
-    for secret_namespace in to_add:
-        sync_secret(logger, secret_namespace, body, v1)
+    outcomes: Counter = Counter()
+    if to_add:
+        secret_body = create_secret_body(logger, body, v1)
+        with load.fan_out(lambda ns: sync_secret(logger, ns, body, v1, secret_body), len(to_add)) as sync:
+            outcomes.update(sync(secret_namespace) for secret_namespace in to_add)
 
     for secret_namespace in to_remove:
-        delete_secret(logger, secret_namespace, name, v1)
+        delete_children(logger, secret_namespace, name, body, v1)
+    outcomes['deleted'] = len(to_remove)
+    logger.info('Synced secret %s to the new namespace selection: %s', name, dict(outcomes))
 
     cached_cluster_secret = csecs_cache.get_cluster_secret(uid)
     if cached_cluster_secret is None:
@@ -94,9 +224,11 @@ def on_fields_avoid_or_match_namespace(
         body=body,
         synced_namespace=updated_matched,
     ))
+    refresh_namespace_selector(logger)
 
     # Patch synced_ns field
-    logger.debug(f'Patching clustersecret {name}')
+    logger.debug('Patching clustersecret %s', name)
+    status_flusher.discard(name)
     patch_clustersecret_status(
         logger=logger,
         name=name,
@@ -105,12 +237,22 @@ def on_fields_avoid_or_match_namespace(
     )
 
 
-@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='data')
+def new_rollout(hooks: Sequence[RolloutHook] = ()) -> Rollout:
+    return Rollout(
+        waves=get_rollout_waves(),
+        concurrency=get_rollout_concurrency(),
+        qps=get_rollout_qps(),
+        pause=get_rollout_pause(),
+        hooks=hooks,
+    )
+
+
+@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='data', when=owned)
+@traced
 def on_field_data(
-    old: Dict[str, str],
-    new: Dict[str, str],
+    old: Optional[Dict[str, Any]],
+    new: Optional[Dict[str, Any]],
     body: Dict[str, Any],
-    meta: kopf.Meta,
     name: str,
     uid: str,
     logger: logging.Logger,
@@ -121,55 +263,71 @@ def on_field_data(
         logger.debug('This is a new object: Ignoring')
         return
 
-    logger.debug(f'Data changed: {old} -> {new}')
-    logger.debug(f'Updating Object body == {body}')
-    syncedns = body.get('status', {}).get('create_fn', {}).get('syncedns', [])
+    logger.debug('Data changed: keys %s -> %s', Count(old or {}), Count(new or {}))
+    logger.debug('Updating Object body == %s', Redacted(body))
+    syncedns = synced_namespaces(name, body)
 
-    secret_type = body.get('type', 'Opaque')
+    data = body.get('data') or {}
 
     cached_cluster_secret = csecs_cache.get_cluster_secret(uid)
     if cached_cluster_secret is None:
         logger.error('Received an event for an unknown ClusterSecret.')
 
-    updated_syncedns = syncedns.copy()
-    for ns in syncedns:
-        logger.info(f'Re Syncing secret {name} in ns {ns}')
-        ns_sec_body = client.V1Secret(
-            api_version='v1',
-            data={str(key): str(value) for key, value in new.items()},
-            kind='Secret',
-            metadata=create_secret_metadata(
-                name=name,
-                namespace=ns,
-                annotations={str(key): str(value) for key, value in meta.annotations.items()},
-                labels={str(key): str(value) for key, value in meta.labels.items()},
-            ),
-            type=secret_type,
-        )
-        logger.debug(f'body: {ns_sec_body}')
-        # Ensuring the secret still exist.
-        if secret_exists(logger=logger, name=name, namespace=ns, v1=v1):
-            response = v1.replace_namespaced_secret(name=name, namespace=ns, body=ns_sec_body)
+    # Only the changed keys are sent, with one patch body shared by all the namespaces.
+    # Data read from another secret (valueFrom) is resolved and synced as a whole, and
+    # immutable child secrets get a new version.
+    patch_body = None
+    secret_body = None
+    to_sync = syncedns
+    if 'valueFrom' not in data and 'valueFrom' not in (old or {}) and not is_immutable(body):
+        patch_body = create_data_patch(old, new, data)
+        if patch_body is None:
+            logger.debug('No data key changed: nothing to sync')
+            to_sync = []
         else:
-            try:
-                v1.read_namespace(name=ns)
-            except client.exceptions.ApiException as e:
-                if e.status != 404:
-                    raise
-                response = f'Namespace {ns} not found'
-                updated_syncedns.remove(ns)
-                logger.info(f'Namespace {ns} not found while Syncing secret {name}')
-            else:
-                response = v1.create_namespaced_secret(namespace=ns, body=ns_sec_body)
-        logger.debug(response)
-
-    if updated_syncedns != syncedns:
+            logger.debug('Changed data keys: %s', Count(patch_body['data']))
+
+    rollout = new_rollout(hooks=[PausedAnnotationHook(name, custom_objects_api)])
+    throttled_v1 = ThrottledApi(v1, rollout.limiter)
+    if patch_body is None and to_sync:
+        secret_body = create_secret_body(logger, body, v1)
+
+    def resync(ns: str) -> str:
+        if patch_body is None:
+            return sync_secret(logger, ns, body, throttled_v1, secret_body)
+
+        try:
+            throttled_v1.patch_namespaced_secret(name=name, namespace=ns, body=patch_body)
+            return 'patched'
+        except client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+
+        # The secret does not exist anymore: create it again, unless the namespace is gone.
+        try:
+            throttled_v1.read_namespace(name=ns)
+        except client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+            logger.debug('Namespace %s not found while Syncing secret %s', ns, name)
+            return 'pruned'
+        return sync_secret(logger, ns, body, throttled_v1)
+
+    with load.fan_out(resync, len(to_sync)) as tracked_resync:
+        results = rollout.run(logger, name, to_sync, tracked_resync)
+    updated_syncedns = [ns for ns in syncedns if results.get(ns) != 'pruned']
+    if results:
+        logger.info('Re synced secret %s in %s namespaces: %s', name, len(to_sync), dict(Counter(results.values())))
+
+    new_status = child_status(updated_syncedns, secret_body)
+    if new_status != {'syncedns': syncedns}:
         # Patch synced_ns field
-        logger.debug(f'Patching clustersecret {name}')
+        logger.debug('Patching clustersecret %s', name)
+        status_flusher.discard(name)
         body = patch_clustersecret_status(
             logger=logger,
             name=name,
-            new_status={'create_fn': {'syncedns': updated_syncedns}},
+            new_status={'create_fn': new_status},
             custom_objects_api=custom_objects_api,
         )
 
@@ -182,8 +340,71 @@ def on_field_data(
     ))
 
 
-@kopf.on.resume('clustersecret.io', 'v1', 'clustersecrets')
-@kopf.on.create('clustersecret.io', 'v1', 'clustersecrets')
+@kopf.on.field('clustersecret.io', 'v1', 'clustersecrets', field='immutable', when=owned)
+@traced
+def on_field_immutable(
+    old: Optional[bool],
+    new: Optional[bool],
+    body: Dict[str, Any],
+    name: str,
+    uid: str,
+    logger: logging.Logger,
+    reason: kopf.Reason,
+    **_,
+):
+    """Switch the child secrets between a single mutable secret and immutable versions
+
+    The children of the new mode are synced first, then those of the other
+    mode removed: the mutable child when turned on, all the versions when
+    turned off.
+    """
+    if reason == "create" or bool(old) == bool(new):
+        return
+
+    syncedns = synced_namespaces(name, body)
+    secret_body = create_secret_body(logger, body, v1)
+    child_name = secret_body['metadata']['name']
+    logger.info('Switching the child secrets of %s to %s', name, 'immutable versions' if new else 'a mutable secret')
+
+    def switch(ns: str) -> str:
+        outcome = sync_secret(logger, ns, body, v1, secret_body)
+        if outcome == 'failed':
+            return outcome
+        if not new:
+            prune_versions(logger, ns, name, v1, current=child_name, keep=0)
+            return outcome
+        # The mutable child may predate the alias label, it is deleted by name unless not managed.
+        metadata = secret_metadata(logger, name, ns, v1)
+        if metadata is not None and (metadata.annotations or {}).get(CREATE_BY_ANNOTATION) is not None:
+            delete_secret(logger, ns, name, v1)
+        return outcome
+
+    with load.fan_out(switch, len(syncedns)) as tracked_switch:
+        outcomes = Counter(tracked_switch(ns) for ns in syncedns)
+    logger.info('Switched secret %s in %s namespaces: %s', name, len(syncedns), dict(outcomes))
+
+    new_status = child_status(syncedns, secret_body)
+    if not new:
+        # Removed by the merge patch.
+        new_status['secretName'] = None
+    status_flusher.discard(name)
+    body = patch_clustersecret_status(
+        logger=logger,
+        name=name,
+        new_status={'create_fn': new_status},
+        custom_objects_api=custom_objects_api,
+    )
+    csecs_cache.set_cluster_secret(BaseClusterSecret(
+        uid=uid,
+        name=name,
+        body=body,
+        synced_namespace=syncedns,
+    ))
+
+
+@kopf.on.resume('clustersecret.io', 'v1', 'clustersecrets', when=owned)
+@kopf.on.create('clustersecret.io', 'v1', 'clustersecrets', when=owned)
+@traced
 async def create_fn(
     logger: logging.Logger,
     uid: str,
@@ -191,13 +412,33 @@ async def create_fn(
     body: Dict[str, Any],
     **_
 ):
+    mark_startup('first_event')
+    new_status = sync_matched(logger, uid, name, body)
+
+    # kopf patches the status with the returned value, newer than any deferred one.
+    status_flusher.discard(name)
+    # return for what ??? Should be deleted ??
+    return new_status
+
+
+def sync_matched(logger: logging.Logger, uid: str, name: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Sync a ClusterSecret into all the namespaces it matches and cache it, returning the status of its children
+    """
     # get all ns matching.
-    matchedns = get_ns_list(logger, body, v1)
+    matchedns = matched_namespaces(logger, name, body)
 
     # sync in all matched NS
-    logger.info(f'Syncing on Namespaces: {matchedns}')
-    for ns in matchedns:
-        sync_secret(logger, ns, body, v1)
+    logger.debug('Syncing on Namespaces: %s', Count(matchedns))
+    secret_body = None
+    if matchedns:
+        secret_body = create_secret_body(logger, body, v1)
+        fresh = up_to_date(secret_body, matchedns)
+        to_sync = [ns for ns in matchedns if ns not in fresh]
+        with load.fan_out(lambda ns: sync_secret(logger, ns, body, v1, secret_body), len(to_sync)) as sync:
+            outcomes = Counter(sync(ns) for ns in to_sync)
+        if fresh:
+            outcomes['up to date'] = len(fresh)
+        logger.info('Synced secret %s in %s namespaces: %s', name, len(matchedns), dict(outcomes))
 
     # Updating the cache
     csecs_cache.set_cluster_secret(BaseClusterSecret(
@@ -206,47 +447,578 @@ async def create_fn(
         body=body,
         synced_namespace=matchedns,
     ))
+    refresh_namespace_selector(logger)
+    return child_status(matchedns, secret_body)
 
-    # return for what ??? Should be deleted ??
-    return {'syncedns': matchedns}
 
+def take_over(logger: logging.Logger, body: Dict[str, Any]):
+    """Converge a ClusterSecret taken over from another replica, whose last changes may not have been handled
+
+    Syncs it into the namespaces it matches, removes it from those it no longer
+    matches, and patches its status, without relying on kopf to deliver it.
+    """
+    metadata = body['metadata']
+    name = metadata['name']
+    syncedns = synced_namespaces(name, body)
+    try:
+        new_status = sync_matched(logger, metadata['uid'], name, body)
+    except kopf.PermanentError:
+        # Rejected with a status condition.
+        return
 
-@kopf.on.create('', 'v1', 'namespaces')
+    for ns in set(syncedns).difference(new_status['syncedns']):
+        delete_children(logger, ns, name, body, v1)
+    status_flusher.discard(name)
+    if new_status == body.get('status', {}).get('create_fn'):
+        return
+    patch_clustersecret_status(
+        logger=logger,
+        name=name,
+        new_status={'create_fn': new_status},
+        custom_objects_api=custom_objects_api,
+    )
+
+
+def children_synced() -> bool:
+    """Whether the watch of the child secrets has listed them all"""
+    return children_informer is not None and children_informer.synced.is_set()
+
+
+def up_to_date(secret_body: Dict[str, Any], namespaces: List[str]) -> Set[str]:
+    """Namespaces whose child secret already holds the payload, per the watch of the child secrets
+
+    None of them until that watch has listed them all. A child changed within the
+    latency of the watch is left to the periodic reconciliation.
+    """
+    if not children_synced():
+        return set()
+    name = secret_body['metadata']['name']
+    digest = child_digest(secret_body)
+    return {ns for ns in namespaces if children_cache.get_digest(ns, name) == digest}
+
+
+@traced
 async def namespace_watcher(logger: logging.Logger, meta: kopf.Meta, **_):
     """Watch for namespace events
     """
     new_ns = meta.name
-    logger.debug(f'New namespace created: {new_ns} re-syncing')
-    ns_new_list = []
+    labels = dict(meta.labels)
+    logger.debug('New namespace created: %s re-syncing', new_ns)
+    namespaces_cache.set_namespace(new_ns, labels)
     for cluster_secret in csecs_cache.all_cluster_secret():
         obj_body = cluster_secret.body
         name = cluster_secret.name
 
-        matcheddns = cluster_secret.synced_namespace
+        if not owned(cluster_secret.uid):
+            continue
+
+        if new_ns in cluster_secret.synced_namespace or not namespace_matches(obj_body, new_ns, labels):
+            continue
+
+        logger.debug('Cloning secret %s into the new namespace %s', name, new_ns)
+        sync_secret(
+            logger=logger,
+            namespace=new_ns,
+            body=obj_body,
+            v1=v1,
+        )
+
+        # if there is a new matching ns, refresh cache
+        cluster_secret.synced_namespace = cluster_secret.synced_namespace + [new_ns]
+        csecs_cache.set_cluster_secret(cluster_secret)
 
-        logger.debug(f'Old matched namespace: {matcheddns} - name: {name}')
-        ns_new_list = get_ns_list(logger, obj_body, v1)
-        logger.debug(f'new matched list: {ns_new_list}')
-        if new_ns in ns_new_list:
-            logger.debug(f'Cloning secret {name} into the new namespace {new_ns}')
-            sync_secret(
+        # update the synced namespaces on the object
+        new_status = {'create_fn': {'syncedns': cluster_secret.synced_namespace}}
+        if not status_flusher.defer(name, new_status):
+            patch_clustersecret_status(
                 logger=logger,
-                namespace=new_ns,
-                body=obj_body,
-                v1=v1,
+                name=name,
+                new_status=new_status,
+                custom_objects_api=custom_objects_api,
             )
 
-            # if there is a new matching ns, refresh cache
-            cluster_secret.synced_namespace = ns_new_list
-            csecs_cache.set_cluster_secret(cluster_secret)
 
-        # update ns_new_list on the object so then we also delete from there
-        patch_clustersecret_status(
+@traced
+async def namespace_labels_watcher(
+    logger: logging.Logger,
+    event: Dict[str, Any],
+    meta: kopf.Meta,
+    **_,
+):
+    """Keep the namespace store up to date, and add or remove the secrets selected by labels
+    """
+    ns = meta.name
+    if event.get('type') == 'DELETED':
+        namespaces_cache.remove_namespace(ns)
+        return
+
+    labels = dict(meta.labels)
+    known = namespaces_cache.has_namespace(ns)
+    if known and namespaces_cache.get_labels(ns) == labels:
+        return
+    namespaces_cache.set_namespace(ns, labels)
+
+    # New namespaces are handled by namespace_watcher, only label changes are of interest here.
+    if not known or event.get('type') != 'MODIFIED':
+        return
+
+    logger.debug('Labels of namespace %s changed: %s', ns, labels)
+    for cluster_secret in csecs_cache.all_cluster_secret():
+        obj_body = cluster_secret.body
+        if not obj_body.get('namespaceSelector') or not owned(cluster_secret.uid):
+            continue
+
+        synced = ns in cluster_secret.synced_namespace
+        matches = namespace_matches(obj_body, ns, labels)
+        if matches == synced:
+            continue
+
+        if matches:
+            logger.debug('Cloning secret %s into the relabeled namespace %s', cluster_secret.name, ns)
+            sync_secret(logger=logger, namespace=ns, body=obj_body, v1=v1)
+            synced_namespace = cluster_secret.synced_namespace + [ns]
+        else:
+            logger.debug('Removing secret %s from the relabeled namespace %s', cluster_secret.name, ns)
+            delete_children(logger, ns, cluster_secret.name, obj_body, v1)
+            synced_namespace = [synced_ns for synced_ns in cluster_secret.synced_namespace if synced_ns != ns]
+
+        cluster_secret.synced_namespace = synced_namespace
+        csecs_cache.set_cluster_secret(cluster_secret)
+
+        new_status = {'create_fn': {'syncedns': synced_namespace}}
+        if not status_flusher.defer(cluster_secret.name, new_status):
+            patch_clustersecret_status(
+                logger=logger,
+                name=cluster_secret.name,
+                new_status=new_status,
+                custom_objects_api=custom_objects_api,
+            )
+
+
+@traced
+async def namespace_delete_watcher(logger: logging.Logger, meta: kopf.Meta, **_):
+    """Prune a deleted namespace from the synced namespaces of the ClusterSecrets
+    """
+    deleted_ns = meta.name
+    cluster_secrets = [
+        cluster_secret for cluster_secret in csecs_cache.get_cluster_secrets_by_namespace(deleted_ns)
+        if owned(cluster_secret.uid)
+    ]
+    logger.debug('Namespace %s deleted, pruning it from %s ClusterSecrets', deleted_ns, len(cluster_secrets))
+    for cluster_secret in cluster_secrets:
+        synced_namespace = [ns for ns in cluster_secret.synced_namespace if ns != deleted_ns]
+
+        cluster_secret.synced_namespace = synced_namespace
+        csecs_cache.set_cluster_secret(cluster_secret)
+
+        new_status = {'create_fn': {'syncedns': synced_namespace}}
+        if not status_flusher.defer(cluster_secret.name, new_status):
+            patch_clustersecret_status(
+                logger=logger,
+                name=cluster_secret.name,
+                new_status=new_status,
+                custom_objects_api=custom_objects_api,
+            )
+
+
+@traced
+def on_source_event(
+    logger: logging.Logger,
+    namespace: str,
+    name: str,
+    cluster_secrets: List[BaseClusterSecret],
+):
+    """Push a change of a valueFrom source secret to the given ClusterSecrets reading it, in one fan-out
+
+    The source is read once, and its keys projected once per dependent ClusterSecret.
+    An update leaving its data unchanged is ignored. The immutable dependents get
+    the name of their new version in their status.
+    """
+    source = (namespace, name)
+    try:
+        data = dict(read_data_secret(logger, name, namespace, v1) or {})
+    except kopf.TemporaryError as e:
+        logger.warning('Failed to read the source secret %s/%s: %s', namespace, name, e)
+        return
+    digest = data_digest(data)
+    if source_digests.get(source) == digest:
+        return
+    source_digests[source] = digest
+
+    dependents = {cluster_secret.uid: cluster_secret for cluster_secret in cluster_secrets}
+    secret_bodies = {
+        uid: create_secret_body(logger, cluster_secret.body, v1, source_data=data)
+        for uid, cluster_secret in dependents.items()
+    }
+    targets = [(uid, ns) for uid, cluster_secret in dependents.items() for ns in cluster_secret.synced_namespace]
+
+    rollout = new_rollout()
+    throttled_v1 = ThrottledApi(v1, rollout.limiter)
+
+    def resync(target: Tuple[str, str]) -> str:
+        uid, ns = target
+        return sync_secret(logger, ns, dependents[uid].body, throttled_v1, secret_bodies[uid])
+
+    with load.fan_out(resync, len(targets)) as tracked_resync:
+        results = rollout.run(logger, f'{namespace}/{name}', targets, tracked_resync)
+    logger.info(
+        'Source secret changed: synced %s ClusterSecrets in %s namespaces: %s',
+        len(dependents),
+        len(targets),
+        dict(Counter(results.values())),
+    )
+
+    # The immutable dependents have a new version.
+    for uid, cluster_secret in dependents.items():
+        new_status = child_status(cluster_secret.synced_namespace, secret_bodies[uid])
+        synced_status = cluster_secret.body.get('status', {}).get('create_fn', {})
+        if new_status.get('secretName') == synced_status.get('secretName'):
+            continue
+        status_flusher.discard(cluster_secret.name)
+        cluster_secret.body = patch_clustersecret_status(
             logger=logger,
             name=cluster_secret.name,
-            new_status={'create_fn': {'syncedns': ns_new_list}},
+            new_status={'create_fn': new_status},
             custom_objects_api=custom_objects_api,
         )
+        csecs_cache.set_cluster_secret(cluster_secret)
+
+
+def seed_source_digest(logger: logging.Logger, namespace: str, name: str):
+    """Record the digest of a valueFrom source listed at start, for its updates to be compared with
+    """
+    try:
+        data = dict(read_data_secret(logger, name, namespace, v1) or {})
+    except kopf.TemporaryError as e:
+        logger.warning('Failed to read the source secret %s/%s: %s', namespace, name, e)
+        return
+    source_digests.setdefault((namespace, name), data_digest(data))
+
+
+def namespace_exists(name: str) -> bool:
+    try:
+        v1.read_namespace(name=name)
+    except client.exceptions.ApiException as e:
+        if e.status != 404:
+            raise
+        return False
+    return True
+
+
+async def on_namespace_event(logger: logging.Logger, event_type: Optional[str], body: Dict[str, Any]):
+    """Run the namespace handlers on an event of the namespace informer
+    """
+    mark_startup('first_event')
+    meta = kopf.Meta(body)
+    left_selector = 'deletionTimestamp' not in body['metadata'] and namespaces_cache.has_namespace(meta.name)
+    # The deletions replayed by a relist carry no deletionTimestamp either: the namespace is read to tell.
+    if event_type == 'DELETED' and left_selector and await asyncio.to_thread(namespace_exists, meta.name):
+        # Still there but out of the label selector of the watch: unsync it like after a label change.
+        await namespace_labels_watcher(logger=logger, event={'type': 'MODIFIED', 'object': body}, meta=meta)
+    elif event_type == 'DELETED':
+        await namespace_delete_watcher(logger=logger, meta=meta)
+    await namespace_labels_watcher(logger=logger, event={'type': event_type, 'object': body}, meta=meta)
+    if event_type == 'ADDED':
+        await namespace_watcher(logger=logger, meta=meta)
+
+
+def on_secret_event(
+    logger: logging.Logger,
+    event_type: Optional[str],
+    body: Dict[str, Any],
+) -> Optional[asyncio.Future]:
+    """Run the source handler on an update of a valueFrom source, from the metadata of the secret informer
+
+    Runs on the event loop, where the ClusterSecret cache is updated. The source
+    is read and pushed to the ClusterSecrets handled here in a worker thread,
+    whose future is returned. A source listed at start is only read to record
+    the digest of its data, its first update is pushed only if that changed.
+    """
+    metadata = body['metadata']
+    namespace, name = metadata['namespace'], metadata['name']
+    if event_type == 'DELETED':
+        source_digests.pop((namespace, name), None)
+        return None
+    # Added: the create handlers sync it.
+    if event_type == 'ADDED':
+        return None
+
+    dependents = [
+        cluster_secret for cluster_secret in csecs_cache.get_cluster_secrets_by_source(namespace, name)
+        if owned(cluster_secret.uid)
+    ]
+    if not dependents:
+        return None
+    if event_type is None:
+        # Listed at start: the resume handlers sync it, only its digest is recorded.
+        if (namespace, name) in source_digests:
+            return None
+        return asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(seed_source_digest, logger, namespace, name),
+        )
+    return asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(on_source_event, logger, namespace, name, dependents),
+    )
+
+
+async def on_cluster_secret_event(logger: logging.Logger, event_type: Optional[str], body: Dict[str, Any]):
+    """Keep the ClusterSecrets this replica does not handle cached, from the events of their informer
+
+    The handlers keep those it handles cached, with fresher synced namespaces.
+    """
+    metadata = body['metadata']
+    if event_type == 'DELETED':
+        # The deletions replayed by a relist only carry the name.
+        for cluster_secret in csecs_cache.all_cluster_secret():
+            if cluster_secret.name == metadata['name'] and not owned(cluster_secret.uid):
+                csecs_cache.remove_cluster_secret(cluster_secret.uid)
+    elif not owned(metadata['uid']):
+        csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid=metadata['uid'],
+            name=metadata['name'],
+            body=body,
+            synced_namespace=body.get('status', {}).get('create_fn', {}).get('syncedns', []),
+        ))
+    else:
+        return
+    if event_type is not None:
+        refresh_namespace_selector(logger)
+
+
+def on_child_secret_event(event_type: Optional[str], body: Dict[str, Any]):
+    """Keep the digests of the child secrets, from the events of their informer
+    """
+    metadata = body['metadata']
+    if event_type == 'DELETED':
+        children_cache.remove_child(metadata['namespace'], metadata['name'])
+    else:
+        children_cache.set_digest(metadata['namespace'], metadata['name'], child_digest(body))
+
+
+def refresh_namespace_selector(logger: logging.Logger):
+    """Narrow the namespace watch to the namespaces the cached ClusterSecrets may match
+    """
+    if namespace_informer is None or not get_namespace_watch_filter():
+        return
+    selector = namespace_watch_selector(cluster_secret.body for cluster_secret in csecs_cache.all_cluster_secret())
+    if selector != namespace_informer.label_selector:
+        logger.info('Watching the namespaces matching: %s', selector or 'all of them')
+        namespace_informer.set_label_selector(selector)
+
+
+def start_informers(logger: logging.Logger, loop: asyncio.AbstractEventLoop):
+    """Watch the namespaces, the secrets if the valueFrom sources are watched, and with standby
+    replicas the ClusterSecrets and their child secrets
+
+    The namespace and ClusterSecret handlers run on the event loop like the kopf handlers, one event at a time.
+    """
+    def namespace_event(event_type: Optional[str], body: Dict[str, Any]):
+        asyncio.run_coroutine_threadsafe(on_namespace_event(logger, event_type, body), loop).result()
+
+    def cluster_secret_event(event_type: Optional[str], body: Dict[str, Any]):
+        asyncio.run_coroutine_threadsafe(on_cluster_secret_event(logger, event_type, body), loop).result()
+
+    global namespace_informer
+    namespace_informer = Informer(
+        get_api_client(WATCH),
+        '/api/v1/namespaces',
+        namespace_event,
+        resource='namespaces',
+        metadata_only=True,
+        page_size=get_watch_page_size(),
+        timeout=get_watch_timeout(),
+    )
+    informers.append(namespace_informer)
+    refresh_namespace_selector(logger)
+    if get_source_watch_enabled():
+        informers.append(Informer(
+            get_api_client(WATCH),
+            '/api/v1/secrets',
+            lambda event_type, body: loop.call_soon_threadsafe(on_secret_event, logger, event_type, body),
+            resource='secrets',
+            metadata_only=True,
+            page_size=get_watch_page_size(),
+            timeout=get_watch_timeout(),
+        ))
+    if leader is not None:
+        # Kept warm while standing by, so a takeover only syncs what changed.
+        informers.append(Informer(
+            get_api_client(WATCH),
+            '/apis/clustersecret.io/v1/clustersecrets',
+            cluster_secret_event,
+            resource='clustersecrets',
+            page_size=get_watch_page_size(),
+            timeout=get_watch_timeout(),
+        ))
+        global children_informer
+        children_informer = Informer(
+            get_api_client(WATCH),
+            '/api/v1/secrets',
+            on_child_secret_event,
+            resource='childsecrets',
+            page_size=get_watch_page_size(),
+            timeout=get_watch_timeout(),
+        )
+        children_informer.label_selector = ALIAS_LABEL
+        informers.append(children_informer)
+    for informer in informers:
+        informer.start(logger)
+
+
+@kopf.on.startup()
+async def configure_fn(logger: logging.Logger, settings: kopf.OperatorSettings, **_):
+    for field, value in get_kopf_settings().items():
+        section, name = field.split('.')
+        logger.info('Setting kopf %s to %s', field, value)
+        setattr(getattr(settings, section), name, value)
+
+    if get_log_sample_burst() > 0:
+        install_sampling(burst=get_log_sample_burst(), window=get_log_sample_window())
+
+    # Keep only digests of the secret data in kopf's last-handled-configuration annotation.
+    settings.persistence.diffbase_storage = DigestDiffBaseStorage()
+
+    global operator_settings
+    operator_settings = settings
+
+    if get_sharding_enabled():
+        if get_standby_enabled():
+            logger.warning('Standby replicas are ignored with sharding, every replica handles its shard')
+        global shards, shards_task
+        shards = ShardManager(
+            identity=get_pod_name(),
+            namespace=get_pod_namespace(),
+            coordination_api=LazyApi(client.CoordinationV1Api),
+            lease_duration=get_shard_lease_duration(),
+        )
+        await asyncio.to_thread(shards.heartbeat)
+        logger.info('Sharding enabled: %s among %s', shards.identity, sorted(shards.ring.members))
+
+        # Every replica keeps its own finalizer and handling state, so replicas blind to a
+        # ClusterSecret they do not own never touch the state of its owner.
+        settings.peering.standalone = True
+        settings.persistence.finalizer = shards.finalizer
+        settings.persistence.progress_storage = kopf.AnnotationsProgressStorage(prefix=shards.annotation_prefix)
+        settings.persistence.diffbase_storage = DigestDiffBaseStorage(prefix=shards.annotation_prefix)
+        shards_task = asyncio.create_task(shards.run(logger, rebalance_fn))
+
+    elif get_standby_enabled():
+        global leader, leader_task, leader_persistence
+        leader = LeaderElector(
+            identity=get_pod_name(),
+            namespace=get_pod_namespace(),
+            coordination_api=LazyApi(client.CoordinationV1Api),
+            lease_duration=get_leader_lease_duration(),
+        )
+        await asyncio.to_thread(leader.heartbeat)
+        logger.info('Standby enabled: %s is %s', leader.identity, 'leading' if leader.leading else 'standing by')
+
+        settings.peering.standalone = True
+        leader_persistence = (
+            settings.persistence.finalizer,
+            settings.persistence.progress_storage,
+            settings.persistence.diffbase_storage,
+        )
+        set_leader_persistence(leader.leading)
+        leader_task = asyncio.create_task(leader.run(logger, takeover_fn, standby_fn))
+
+
+async def rebalance_fn(previous: HashRing):
+    """Take over the ClusterSecrets that moved to this replica, and drop the finalizers and annotations of gone replicas
+    """
+    logger = logging.getLogger(__name__)
+    cluster_secrets = await asyncio.to_thread(
+        get_custom_objects_by_kind,
+        group='clustersecret.io',
+        version='v1',
+        plural='clustersecrets',
+        custom_objects_api=custom_objects_api,
+    )
+    for item in cluster_secrets:
+        metadata = item.get('metadata')
+        uid = metadata.get('uid')
+        if not shards.owns(uid):
+            continue
+
+        patch: Dict[str, Any] = {}
+        finalizers = metadata.get('finalizers', [])
+        live_finalizers = [
+            finalizer for finalizer in finalizers
+            if not finalizer.startswith(SHARD_FINALIZER_PREFIX)
+            or finalizer[len(SHARD_FINALIZER_PREFIX):] in shards.ring.members
+        ]
+        if live_finalizers != finalizers:
+            patch['finalizers'] = live_finalizers
+
+        # The kopf handling state of the replicas gone, e.g. replaced in a rollout.
+        gone_annotations = {
+            key: None for key in metadata.get('annotations') or {}
+            if key.partition('/')[0].endswith(SHARD_ANNOTATION_SUFFIX)
+            and key.partition('/')[0][:-len(SHARD_ANNOTATION_SUFFIX)] not in shards.ring.members
+        }
+        if gone_annotations:
+            patch['annotations'] = gone_annotations
+
+        if previous.owner(uid) != shards.identity:
+            # Synced right away: the changes made while its previous owner was gone are in no diff-base.
+            logger.info('Taking over ClusterSecret %s', metadata.get("name"))
+            await asyncio.to_thread(take_over, logger, item)
+
+        if patch:
+            await asyncio.to_thread(
+                custom_objects_api.patch_cluster_custom_object,
+                group='clustersecret.io',
+                version='v1',
+                plural='clustersecrets',
+                name=metadata.get('name'),
+                body={'metadata': patch},
+            )
+
+
+def set_leader_persistence(leading: bool):
+    """Give kopf the finalizer and storages of the leader, or read-only ones while standing by
+
+    Blind to the ClusterSecrets, a standby replica would remove the finalizer of
+    the leader, and must not store the handling state of the changes it sees.
+    """
+    persistence = operator_settings.persistence
+    if leading:
+        persistence.finalizer, persistence.progress_storage, persistence.diffbase_storage = leader_persistence
+    else:
+        persistence.finalizer = STANDBY_FINALIZER
+        persistence.progress_storage = ReadOnlyProgressStorage()
+        persistence.diffbase_storage = ReadOnlyDiffBaseStorage()
+
+
+async def takeover_fn():
+    """Converge every ClusterSecret on taking over from the leader, from the caches kept warm
+
+    The changes the previous leader had not handled are in no diff-base, so
+    kopf is not relied upon to deliver them. Only the child secrets missing or
+    holding other data are synced.
+    """
+    logger = logging.getLogger(__name__)
+    set_leader_persistence(True)
+    logger.info(
+        'Took over as leader %s, watching from the resourceVersions %s',
+        leader.identity,
+        {informer.resource: informer.resource_version for informer in informers},
+    )
+    for cluster_secret in csecs_cache.all_cluster_secret():
+        if not leader.leading:
+            return
+        try:
+            await asyncio.to_thread(take_over, logger, cluster_secret.body)
+        except (client.exceptions.ApiException, kopf.TemporaryError) as e:
+            logger.warning('Failed to take over ClusterSecret %s: %s', cluster_secret.name, e)
+
+
+async def standby_fn():
+    """Stop handling the ClusterSecrets on losing the leadership, keeping the caches warm
+    """
+    logger = logging.getLogger(__name__)
+    logger.warning('Lost the leadership as %s, standing by', leader.identity)
+    set_leader_persistence(False)
 
 
 @kopf.on.startup()
@@ -255,21 +1027,86 @@ async def startup_fn(logger: logging.Logger, **_):
         """
       #########################################################################
       # DEBUG MODE ON - NOT FOR PRODUCTION                                    #
-      # On this mode secrets are leaked to stdout, this is not safe!. NO-GO ! #
+      # Secret data is redacted, but names, labels and annotations are not.  #
       #########################################################################
     """,
     )
 
-    cluster_secrets = get_custom_objects_by_kind(
-        group='clustersecret.io',
-        version='v1',
-        plural='clustersecrets',
-        custom_objects_api=custom_objects_api,
-    )
+    # The probes only come up once the startup handlers are done, so the warm-up goes on in the background.
+    global warm_up_task
+    warm_up_task = asyncio.create_task(warm_up(logger))
+
+    if get_reconcile_interval() > 0:
+        global reconciler_task
+        reconciler = Reconciler(
+            csecs_cache=csecs_cache,
+            namespaces_cache=namespaces_cache,
+            v1=v1,
+            custom_objects_api=custom_objects_api,
+            interval=get_reconcile_interval(),
+            batch_size=get_reconcile_batch_size(),
+            jitter=get_reconcile_jitter(),
+            qps=get_reconcile_qps(),
+            owns=owned,
+            shed=load.shed,
+            children_cache=children_cache,
+            children_synced=children_synced,
+        )
+        logger.info('Starting periodic reconciliation every %ss', get_reconcile_interval())
+        reconciler_task = asyncio.create_task(reconciler.run(logger))
+
+    if get_debug_token() is not None:
+        global debug_server
+        debug_server = DebugServer(
+            token=get_debug_token(),
+            csecs_cache=csecs_cache,
+            namespaces_cache=namespaces_cache,
+            port=get_debug_port(),
+        )
+        await debug_server.start(logger)
 
-    logger.info(f'Found {len(cluster_secrets)} existing cluster secrets.')
+    global status_flusher_task
+    status_flusher_task = asyncio.create_task(status_flusher.run(logger))
+
+    if get_metrics_port() > 0:
+        global metrics_server
+        metrics_server = MetricsServer(port=get_metrics_port())
+        await metrics_server.start(logger)
+
+    if get_readiness_port() > 0:
+        global readiness_server
+        readiness_server = ReadinessServer(load, port=get_readiness_port())
+        await readiness_server.start(logger)
+
+    mark_startup('started')
+
+
+async def warm_up(logger: logging.Logger, backoff: float = 1, max_backoff: float = 30):
+    """Fill the ClusterSecret cache, then start the watches and wait for their first listing
+
+    The listing is retried with an exponential backoff, as kopf retries a failed startup handler.
+    """
+    while True:
+        try:
+            cluster_secrets = await asyncio.to_thread(
+                get_custom_objects_by_kind,
+                group='clustersecret.io',
+                version='v1',
+                plural='clustersecrets',
+                custom_objects_api=custom_objects_api,
+            )
+            break
+        except (client.exceptions.ApiException, HTTPError, OSError) as e:
+            logger.warning('Failed to list the cluster secrets, retrying in %ss: %s', backoff, e)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+    logger.info('Found %s existing cluster secrets.', len(cluster_secrets))
     for item in cluster_secrets:
         metadata = item.get('metadata')
+        # The resume handlers may have already cached a fresher body.
+        if csecs_cache.get_cluster_secret(metadata.get('uid')) is not None:
+            continue
         csecs_cache.set_cluster_secret(
             BaseClusterSecret(
                 uid=metadata.get('uid'),
@@ -278,3 +1115,57 @@ async def startup_fn(logger: logging.Logger, **_):
                 synced_namespace=item.get('status', {}).get('create_fn', {}).get('syncedns', []),
             )
         )
+
+    start_informers(logger, asyncio.get_running_loop())
+    while not all(informer.synced.is_set() for informer in informers):
+        await asyncio.sleep(0.1)
+
+    load.synced = True
+    mark_startup('warm')
+    logger.info(
+        'Warmed up, seconds since the process started: %s',
+        {phase: round(seconds, 2) for phase, seconds in startup_phases.items()},
+    )
+
+
+@kopf.on.cleanup()
+async def cleanup_fn(logger: logging.Logger, **_):
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+
+    if reconciler_task is not None:
+        logger.info('Stopping periodic reconciliation')
+        reconciler_task.cancel()
+
+    if status_flusher_task is not None:
+        status_flusher_task.cancel()
+        # Write out the statuses deferred so far, unless still overloaded.
+        await asyncio.to_thread(status_flusher.flush, logger)
+
+    if shards_task is not None:
+        logger.info('Leaving the shards as %s', shards.identity)
+        shards_task.cancel()
+        # Releasing the lease lets the other replicas rebalance right away.
+        shards.release()
+
+    if leader_task is not None:
+        logger.info('Leaving the leader election as %s', leader.identity)
+        leader_task.cancel()
+        # Releasing the lease lets a standby replica take over right away.
+        leader.release()
+
+    for informer in informers:
+        informer.stop()
+
+    if debug_server is not None:
+        await debug_server.stop()
+
+    if metrics_server is not None:
+        await metrics_server.stop()
+
+    if readiness_server is not None:
+        await readiness_server.stop()
+
+
+# Every handler is registered, kopf starts the operator next.
+mark_startup('imported')
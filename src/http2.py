@@ -0,0 +1,148 @@
+"""
+HTTP/2 transport of the Kubernetes API clients, through httpx.
+
+``Http2PoolManager`` stands in for the urllib3 pool manager of the client's
+RESTClientObject, which keeps encoding the requests and raising ApiException.
+The requests are multiplexed as streams over a few connections to the API
+server, instead of taking a connection each. Needs the packages of
+requirements-http2.txt.
+"""
+import ssl
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import certifi
+import httpx
+import urllib3
+from kubernetes.client import Configuration
+
+
+def ssl_context(configuration: Configuration) -> ssl.SSLContext:
+    """TLS settings of the configuration, as RESTClientObject applies them to urllib3"""
+    context = ssl.create_default_context(cafile=configuration.ssl_ca_cert or certifi.where())
+    if configuration.cert_file:
+        context.load_cert_chain(configuration.cert_file, configuration.key_file)
+    if not configuration.verify_ssl:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def http_timeout(timeout: Optional[urllib3.Timeout]) -> httpx.Timeout:
+    if timeout is None:
+        return httpx.Timeout(None)
+    if timeout.total is not None:
+        return httpx.Timeout(timeout.total)
+    return httpx.Timeout(timeout.read_timeout, connect=timeout.connect_timeout)
+
+
+class Http2Response:
+    """The parts of a urllib3 response read by the Kubernetes client and the operator."""
+
+    def __init__(self, response: httpx.Response, preload_content: bool, on_close: Callable[[], None]) -> None:
+        self.response = response
+        self.status = response.status_code
+        self.reason = response.reason_phrase
+        self.on_close = on_close
+        self.closed = False
+        if preload_content:
+            self.drain_conn()
+
+    @property
+    def data(self) -> bytes:
+        try:
+            return self.response.read()
+        finally:
+            self.close()
+
+    def getheaders(self) -> httpx.Headers:
+        return self.response.headers
+
+    def getheader(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.response.headers.get(name, default)
+
+    def stream(self, amt: Optional[int] = None, decode_content: bool = True) -> Iterator[bytes]:
+        yield from self.response.iter_bytes() if decode_content else self.response.iter_raw()
+
+    def drain_conn(self):
+        try:
+            self.response.read()
+        finally:
+            self.close()
+
+    def release_conn(self):
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.response.close()
+            self.on_close()
+
+
+class Http2PoolManager:
+    """Sends the requests of RESTClientObject with an HTTP/2 httpx client.
+
+    At most ``maxsize`` connections are opened, each idle one being closed after
+    ``keepalive`` seconds.
+    """
+
+    def __init__(self, configuration: Configuration, maxsize: int, keepalive: float) -> None:
+        self.maxsize = maxsize
+        self.client = httpx.Client(
+            http2=True,
+            verify=ssl_context(configuration),
+            limits=httpx.Limits(
+                max_connections=maxsize,
+                max_keepalive_connections=maxsize,
+                keepalive_expiry=keepalive or None,
+            ),
+            timeout=None,
+        )
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_use = 0
+
+    def done(self):
+        with self.lock:
+            self.in_use -= 1
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        fields: Any = None,
+        body: Any = None,
+        preload_content: bool = True,
+        timeout: Optional[urllib3.Timeout] = None,
+        headers: Any = None,
+        **kwargs: Any,
+    ) -> Http2Response:
+        # The client passes the query parameters of GET and HEAD as fields, the others are form posts.
+        if fields and method not in ('GET', 'HEAD'):
+            raise ValueError(f'Form fields are not supported over HTTP/2, in {method} {url}')
+        request = self.client.build_request(
+            method,
+            url,
+            params=fields or None,
+            content=body,
+            headers=headers,
+            timeout=http_timeout(timeout),
+        )
+        with self.lock:
+            self.requests += 1
+            self.in_use += 1
+        try:
+            response = self.client.send(request, stream=True)
+        except httpx.TransportError as e:
+            self.done()
+            # Raised as urllib3 errors, which the callers already handle.
+            raise urllib3.exceptions.ProtocolError(str(e)) from e
+        return Http2Response(response, preload_content, self.done)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'in_use': self.in_use, 'maxsize': self.maxsize, 'requests': self.requests}
+
+    def clear(self):
+        self.client.close()
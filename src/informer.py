@@ -0,0 +1,261 @@
+"""
+List then watch of core resources, resuming the watch after a disconnect.
+
+The watch asks the API server for bookmarks, so the last resourceVersion seen
+keeps moving even when nothing changes, and a dropped watch resumes from it
+instead of listing everything again. Only when the API server no longer has
+that resourceVersion (410 Gone) does the informer relist, page by page, and
+replay the differences with what it had seen as events.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+from kubernetes.client import ApiClient, exceptions
+from kubernetes.watch.watch import iter_resp_lines
+from urllib3.exceptions import HTTPError
+
+from metrics import REGISTRY, Registry
+from slim_api import METADATA_ACCEPT, METADATA_LIST_ACCEPT, loads
+
+# Called with the event type, None for the objects of the first listing like kopf does, and the object.
+EventHandler = Callable[[Optional[str], Dict[str, Any]], None]
+
+REGISTRY.describe(
+    'clustersecret_watch_reconnects_total', 'counter',
+    'Reconnections of the watches, by resource and mode: resume from the last resourceVersion or relist.',
+)
+REGISTRY.describe(
+    'clustersecret_watch_reconnect_seconds', 'summary',
+    'Time from the end of a watch to the start of the next one, relist included.',
+)
+REGISTRY.describe('clustersecret_watch_relist_objects_total', 'counter', 'Objects received by the relists.')
+REGISTRY.describe('clustersecret_watch_bookmarks_total', 'counter', 'Bookmarks received by the watches.')
+
+
+class Gone(Exception):
+    """The resourceVersion to resume from is too old, only a relist can recover."""
+
+
+def object_key(obj: Dict[str, Any]) -> str:
+    metadata = obj['metadata']
+    return f'{metadata["namespace"]}/{metadata["name"]}' if metadata.get('namespace') else metadata['name']
+
+
+def key_metadata(key: str) -> Dict[str, str]:
+    namespace, _, name = key.rpartition('/')
+    return {'namespace': namespace, 'name': name} if namespace else {'name': name}
+
+
+class Informer:
+    """Lists then watches the objects at ``path``, calling ``handler`` with their events.
+
+    Meant to run in its own thread. Only the resourceVersion of every object is
+    kept, to tell the added, modified and deleted ones apart after a relist.
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        path: str,
+        handler: EventHandler,
+        resource: str,
+        metadata_only: bool = False,
+        page_size: int = 500,
+        timeout: int = 300,
+        backoff: float = 1,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.api_client = api_client
+        self.path = path
+        self.handler = handler
+        self.resource = resource
+        self.metadata_only = metadata_only
+        self.page_size = page_size
+        self.timeout = timeout
+        self.backoff = backoff
+        self.registry = registry
+        self.label_selector: Optional[str] = None
+        self.selector_changed = False
+        self.resource_version: Optional[str] = None
+        self.versions: Dict[str, str] = {}
+        self.synced = threading.Event()
+        self.stopped = threading.Event()
+        self.response: Any = None
+        self.thread: Optional[threading.Thread] = None
+
+    def get(self, accept: str, **query: Any) -> Any:
+        return self.api_client.call_api(
+            self.path,
+            'GET',
+            query_params=[(key, value) for key, value in query.items() if value is not None],
+            header_params={'Accept': accept},
+            auth_settings=['BearerToken'],
+            _return_http_data_only=True,
+            _preload_content=False,
+        )
+
+    def dispatch(self, logger: logging.Logger, event_type: Optional[str], obj: Dict[str, Any]):
+        try:
+            self.handler(event_type, obj)
+        except Exception as e:
+            logger.exception(
+                'Failed to handle the %s event of %s %s: %s', event_type, self.resource, object_key(obj), e,
+            )
+
+    def relist(self, logger: logging.Logger) -> int:
+        """List all the objects page by page, replaying the differences of each page as events
+
+        Only the keys listed are kept until the end, to replay the deletions.
+        Returns the number of objects listed.
+        """
+        accept = METADATA_LIST_ACCEPT if self.metadata_only else 'application/json'
+        first = not self.synced.is_set()
+        listed: Set[str] = set()
+        token = None
+        while True:
+            try:
+                page = loads(self.get(
+                    accept,
+                    limit=self.page_size,
+                    labelSelector=self.label_selector,
+                    **{'continue': token},
+                ).data)
+            except exceptions.ApiException as e:
+                if e.status != 410 or token is None:
+                    raise
+                # The continue token expired in the middle of the listing, start over.
+                logger.debug('Listing of %s expired, starting over', self.resource)
+                listed, token = set(), None
+                continue
+            for obj in page.get('items') or []:
+                key = object_key(obj)
+                listed.add(key)
+                version = obj['metadata'].get('resourceVersion')
+                previous = self.versions.get(key)
+                self.versions[key] = version
+                if previous is None:
+                    self.dispatch(logger, None if first else 'ADDED', obj)
+                elif previous != version:
+                    self.dispatch(logger, 'MODIFIED', obj)
+            token = page['metadata'].get('continue')
+            if not token:
+                break
+
+        for key in set(self.versions).difference(listed):
+            del self.versions[key]
+            self.dispatch(logger, 'DELETED', {'metadata': key_metadata(key)})
+
+        self.resource_version = page['metadata'].get('resourceVersion')
+        return len(listed)
+
+    def watch(self) -> Any:
+        """Start a watch from the last resourceVersion, returning the streamed response"""
+        try:
+            return self.get(
+                METADATA_ACCEPT if self.metadata_only else 'application/json',
+                watch='true',
+                allowWatchBookmarks='true',
+                resourceVersion=self.resource_version,
+                timeoutSeconds=self.timeout,
+                labelSelector=self.label_selector,
+            )
+        except exceptions.ApiException as e:
+            if e.status == 410:
+                raise Gone(e.reason)
+            raise
+
+    def stream(self, logger: logging.Logger, response: Any):
+        """Handle the events of a watch until it ends"""
+        self.response = response
+        try:
+            for line in iter_resp_lines(response):
+                event = loads(line)
+                event_type, obj = event['type'], event['object']
+                if event_type == 'ERROR':
+                    if obj.get('code') == 410:
+                        raise Gone(obj.get('message'))
+                    raise exceptions.ApiException(status=obj.get('code'), reason=obj.get('message'))
+
+                self.resource_version = obj['metadata'].get('resourceVersion', self.resource_version)
+                if event_type == 'BOOKMARK':
+                    self.registry.inc('clustersecret_watch_bookmarks_total', resource=self.resource)
+                    continue
+
+                key = object_key(obj)
+                if event_type == 'DELETED':
+                    self.versions.pop(key, None)
+                else:
+                    self.versions[key] = self.resource_version
+                self.dispatch(logger, event_type, obj)
+                if self.stopped.is_set() or self.selector_changed:
+                    break
+        finally:
+            self.response = None
+            response.close()
+            response.release_conn()
+
+    def run(self, logger: logging.Logger):
+        """List and watch until stopped"""
+        disconnected: Optional[float] = None
+        relisted: Optional[int] = None
+        while not self.stopped.is_set():
+            try:
+                if self.resource_version is None or self.selector_changed:
+                    self.selector_changed = False
+                    relisted = (relisted or 0) + self.relist(logger)
+                response = self.watch()
+            except Gone:
+                logger.info('Watch of %s cannot resume from %s, relisting', self.resource, self.resource_version)
+                self.resource_version = None
+                continue
+            except (exceptions.ApiException, HTTPError, OSError, ValueError) as e:
+                logger.warning('Failed to watch %s, retrying in %ss: %s', self.resource, self.backoff, e)
+                self.stopped.wait(self.backoff)
+                continue
+
+            if disconnected is not None:
+                mode = 'resume' if relisted is None else 'relist'
+                self.registry.inc('clustersecret_watch_reconnects_total', resource=self.resource, mode=mode)
+                self.registry.observe(
+                    'clustersecret_watch_reconnect_seconds',
+                    time.monotonic() - disconnected,
+                    resource=self.resource,
+                    mode=mode,
+                )
+                if relisted is not None:
+                    self.registry.inc('clustersecret_watch_relist_objects_total', relisted, resource=self.resource)
+            self.synced.set()
+            relisted = None
+
+            try:
+                self.stream(logger, response)
+            except Gone:
+                logger.info('Watch of %s expired at %s, relisting', self.resource, self.resource_version)
+                self.resource_version = None
+            except Exception as e:
+                # Closing the response from another thread fails the read in various ways.
+                if not self.stopped.is_set() and not self.selector_changed:
+                    logger.warning('Watch of %s dropped, resuming from %s: %s', self.resource, self.resource_version, e)
+            disconnected = time.monotonic()
+
+    def start(self, logger: logging.Logger):
+        self.thread = threading.Thread(target=self.run, args=(logger,), name=f'informer-{self.resource}', daemon=True)
+        self.thread.start()
+
+    def interrupt(self):
+        response = self.response
+        if response is not None:
+            # Unblocks the read of the watch in the informer thread.
+            response.close()
+
+    def set_label_selector(self, label_selector: Optional[str]):
+        """Watch the objects matching another label selector, after a relist replaying the differences"""
+        self.label_selector = label_selector
+        self.selector_changed = True
+        self.interrupt()
+
+    def stop(self):
+        self.stopped.set()
+        self.interrupt()
@@ -1,14 +1,19 @@
+import hashlib
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any, List, Mapping, Tuple, Iterator
-import re
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Mapping, Tuple, Iterator, Iterable, Set
 
 import kopf
-from kubernetes.client import CoreV1Api, CustomObjectsApi, exceptions, V1ObjectMeta, rest, V1Secret
+from kubernetes.client import CustomObjectsApi, exceptions, V1ObjectMeta, rest
 
+from cache import MemoryNamespaceCache, NamespaceCache
 from os_utils import get_blocked_labels, get_replace_existing, get_version
 from consts import CREATE_BY_ANNOTATION, LAST_SYNC_ANNOTATION, VERSION_ANNOTATION, BLOCKED_ANNOTATIONS, \
-    CREATE_BY_AUTHOR, CLUSTER_SECRET_LABEL
+    CREATE_BY_AUTHOR, CLUSTER_SECRET_LABEL, PATTERNS_CONDITION, ALIAS_LABEL, DEFAULT_KEEP_VERSIONS, \
+    NAMESPACE_NAME_LABEL, MAX_LABEL_VALUE_LENGTH, MAX_NAME_LENGTH
+from log_utils import Count, Redacted
+from patterns import PatternError, literal_name, match_any, match_names
+from slim_api import SecretMetadata, SlimCoreV1Api
 
 
 def patch_clustersecret_status(
@@ -33,7 +38,7 @@ def patch_clustersecret_status(
 
     # Update the status field
     clustersecret['status'] = new_status
-    logger.debug(f'Updated clustersecret manifest: {clustersecret}')
+    logger.debug('Updated clustersecret manifest: %s', Redacted(clustersecret))
 
     # Perform a patch operation to update the custom resource
     return custom_objects_api.patch_cluster_custom_object(
@@ -48,9 +53,13 @@ def patch_clustersecret_status(
 def get_ns_list(
         logger: logging.Logger,
         body: Dict[str, Any],
-        v1: CoreV1Api,
+        v1: SlimCoreV1Api,
+        namespace_cache: Optional[NamespaceCache] = None,
 ) -> List[str]:
     """Returns a list of namespaces where the secret should be matched
+
+    When given, ``namespace_cache`` is refreshed with the listed namespaces and
+    their labels, and used to evaluate the ``namespaceSelector``.
     """
     # Get matchNamespace or default to all
     match_namespace = body.get('matchNamespace', ['.*'])
@@ -58,15 +67,31 @@ def get_ns_list(
     # Get avoidNamespaces or default to None
     avoid_namespaces = body.get('avoidNamespaces', None)
 
+    # Get namespaceSelector or default to None
+    namespace_selector = body.get('namespaceSelector', None)
+
     # Collect all namespaces names
-    nss = [ns.metadata.name for ns in v1.list_namespace().items]
+    namespaces = v1.list_namespace_metadata()
+    nss = [ns.name for ns in namespaces]
     matched_ns = []
     avoided_ns = []
 
     # Iterate over all matchNamespace
     for match_ns in match_namespace:
-        matched_ns.extend([ns for ns in nss if re.match(match_ns, ns)])
-        logger.debug(f'Matched namespaces: {", ".join(matched_ns)} match pattern: {match_ns}')
+        matched_ns.extend(match_names(match_ns, nss))
+        logger.debug('Matched namespaces: %s match pattern: %s', Count(matched_ns), match_ns)
+
+    # Keep only the namespaces whose labels match the namespaceSelector
+    if namespace_selector:
+        if namespace_cache is None:
+            namespace_cache = MemoryNamespaceCache()
+        namespace_cache.replace_all({ns.name: ns.labels for ns in namespaces})
+        try:
+            selected_ns = namespace_cache.select(namespace_selector)
+        except ValueError as e:
+            raise kopf.PermanentError(f'Invalid namespaceSelector: {e}')
+        matched_ns = [ns for ns in matched_ns if ns in selected_ns]
+        logger.debug('Selected namespaces: %s selector: %s', Count(matched_ns), namespace_selector)
 
     # If avoidNamespaces is None simply return our matched list
     if not avoid_namespaces:
@@ -74,32 +99,145 @@ def get_ns_list(
 
     # Iterate over all avoidNamespaces
     for avoid_ns in avoid_namespaces:
-        avoided_ns.extend([ns for ns in nss if re.match(avoid_ns, ns)])
-        logger.debug(f'Skipping namespaces: {", ".join(avoided_ns)} avoid pattern: {avoid_ns}')
+        avoided_ns.extend(match_names(avoid_ns, nss))
+        logger.debug('Skipping namespaces: %s avoid pattern: %s', Count(avoided_ns), avoid_ns)
 
     return list(set(matched_ns) - set(avoided_ns))
 
 
+def match_label_selector(
+        selector: Dict[str, Any],
+        labels: Optional[Mapping[str, str]],
+) -> bool:
+    """Whether the labels match a Kubernetes label selector
+    """
+    labels = labels or {}
+    for key, value in (selector.get('matchLabels') or {}).items():
+        if labels.get(key) != str(value):
+            return False
+
+    for expression in selector.get('matchExpressions') or []:
+        key = expression.get('key')
+        operator = expression.get('operator')
+        values = [str(value) for value in expression.get('values') or []]
+        if operator == 'In':
+            matched = key in labels and labels[key] in values
+        elif operator == 'NotIn':
+            matched = key not in labels or labels[key] not in values
+        elif operator == 'Exists':
+            matched = key in labels
+        elif operator == 'DoesNotExist':
+            matched = key not in labels
+        else:
+            raise kopf.PermanentError(f'Invalid namespaceSelector: unknown operator {operator}')
+        if not matched:
+            return False
+    return True
+
+
+def namespace_matches(
+        body: Dict[str, Any],
+        namespace: str,
+        labels: Optional[Mapping[str, str]],
+) -> bool:
+    """Whether a single namespace should get the secret, without listing the namespaces
+
+    A ClusterSecret with rejected patterns matches no namespace.
+    """
+    try:
+        if not match_any(body.get('matchNamespace', ['.*']), namespace):
+            return False
+
+        if match_any(body.get('avoidNamespaces', None) or [], namespace):
+            return False
+    except PatternError:
+        return False
+
+    namespace_selector = body.get('namespaceSelector', None)
+    return not namespace_selector or match_label_selector(namespace_selector, labels)
+
+
+def label_requirements(body: Mapping[str, Any]) -> Dict[str, Optional[Set[str]]]:
+    """Labels every namespace matched by the ClusterSecret has: key -> the possible values, None for any value
+
+    Derived from the matchLabels and the In and Exists expressions of the namespaceSelector,
+    and from a matchNamespace made only of exact names, through the name label of the namespaces.
+    """
+    requirements: Dict[str, Optional[Set[str]]] = {}
+
+    def require(key: str, values: Optional[Set[str]]):
+        previous = requirements.get(key)
+        if key not in requirements or previous is None:
+            requirements[key] = values
+        elif values is not None:
+            requirements[key] = previous & values
+
+    namespace_selector = body.get('namespaceSelector', None) or {}
+    for key, value in (namespace_selector.get('matchLabels') or {}).items():
+        require(key, {str(value)})
+    for expression in namespace_selector.get('matchExpressions') or []:
+        if expression.get('operator') == 'In':
+            require(expression.get('key'), {str(value) for value in expression.get('values') or []})
+        elif expression.get('operator') == 'Exists':
+            require(expression.get('key'), None)
+
+    names = [literal_name(pattern) for pattern in body.get('matchNamespace', ['.*']) or []]
+    if names and None not in names:
+        require(NAMESPACE_NAME_LABEL, set(names))
+    return requirements
+
+
+def namespace_watch_selector(bodies: Iterable[Mapping[str, Any]]) -> Optional[str]:
+    """Narrowest label selector of the namespaces any of the ClusterSecrets may match
+
+    The requirements on the labels shared by all the ClusterSecrets are kept, with the union
+    of their values. None when a ClusterSecret may match any namespace, or there is none.
+    """
+    common: Optional[Dict[str, Optional[Set[str]]]] = None
+    for body in bodies:
+        requirements = label_requirements(body)
+        if any(values is not None and not values for values in requirements.values()):
+            # Matches no namespace at all.
+            continue
+        if common is None:
+            common = requirements
+        else:
+            common = {
+                key: None if values is None or requirements[key] is None else values | requirements[key]
+                for key, values in common.items()
+                if key in requirements
+            }
+        if not common:
+            return None
+
+    if not common:
+        return None
+    return ','.join(
+        key if values is None else f'{key} in ({",".join(sorted(values))})'
+        for key, values in sorted(common.items())
+    )
+
+
 def read_data_secret(
         logger: logging.Logger,
         name: str,
         namespace: str,
-        v1: CoreV1Api,
+        v1: SlimCoreV1Api,
 ) -> Dict[str, str]:
     """Gets the data from the 'name' secret in namespace
     """
     data = {}
-    logger.debug(f'Reading {name} from ns {namespace}')
+    logger.debug('Reading %s from ns %s', name, namespace)
     try:
-        secret = v1.read_namespaced_secret(name, namespace)
+        secret = v1.read_namespaced_secret_record(name, namespace)
 
-        logger.debug(f'Obtained secret {secret}')
+        logger.debug('Obtained secret %s', Redacted(secret))
         data = secret.data
     except exceptions.ApiException as e:
         logger.error('Error reading secret')
-        logger.debug(f'error: {e}')
+        logger.debug('error: %s', e)
         if e == '404':
-            logger.error(f'Secret {name} in ns {namespace} not found.')
+            logger.error('Secret %s in ns %s not found.', name, namespace)
         raise kopf.TemporaryError('Error reading secret')
     return data
 
@@ -108,26 +246,26 @@ def delete_secret(
         logger: logging.Logger,
         namespace: str,
         name: str,
-        v1: CoreV1Api,
+        v1: SlimCoreV1Api,
 ):
     """Deletes a given secret from a given namespace
     """
-    logger.info(f'deleting secret {name} from namespace {namespace}')
+    logger.debug('deleting secret %s from namespace %s', name, namespace)
     try:
         v1.delete_namespaced_secret(name, namespace)
     except rest.ApiException as e:
         if e.status == 404:
-            logger.warning(f'The namespace {namespace} may not exist anymore: Not found')
+            logger.warning('The namespace %s may not exist anymore: Not found', namespace)
         else:
             logger.warning('Something weird deleting the secret')
-            logger.debug(f'details: {e}')
+            logger.debug('details: %s', e)
 
 
 def secret_exists(
         logger: logging.Logger,
         name: str,
         namespace: str,
-        v1: CoreV1Api,
+        v1: SlimCoreV1Api,
 ):
     return secret_metadata(
         logger=logger,
@@ -141,25 +279,116 @@ def secret_metadata(
         logger: logging.Logger,
         name: str,
         namespace: str,
-        v1: CoreV1Api,
-) -> Optional[V1ObjectMeta]:
+        v1: SlimCoreV1Api,
+) -> Optional[SecretMetadata]:
     try:
-        secret = v1.read_namespaced_secret(name, namespace)
-        return secret.metadata
+        return v1.read_namespaced_secret_metadata(name, namespace)
     except exceptions.ApiException as e:
         if e.status == 404:
             return None
-        logger.warning(f'Cannot read the secret {e}.')
+        logger.warning('Cannot read the secret %s.', e)
         raise kopf.TemporaryError(f'Error reading secret {e}')
 
 
-def sync_secret(
+def get_secret_data(
         logger: logging.Logger,
-        namespace: str,
         body: Dict[str, Any],
-        v1: CoreV1Api,
-):
-    """Creates a given secret on a given namespace
+        v1: SlimCoreV1Api,
+        source_data: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """Returns the data of the child secrets, reading it from the source secret when using valueFrom
+
+    ``source_data`` is the data of the source secret when already known, to
+    project it without reading the secret again.
+    """
+    if 'data' not in body:
+        raise kopf.TemporaryError('Property data is missing.')
+
+    data: Dict[str, Any] = body['data']
+
+    if 'valueFrom' not in data:
+        return data
+
+    if len(data.keys()) > 1:
+        logger.error('Data keys with ValueFrom error, enable debug for more details')
+        logger.debug('keys: %s  len %s', data.keys(), len(data.keys()))
+        raise kopf.TemporaryError('ValueFrom can not coexist with other keys in the data')
+
+    secret_key_ref: Dict[str, Any] = data.get('valueFrom', {}).get('secretKeyRef', {})
+    ns_from: str = secret_key_ref.get('namespace', None)
+    name_from: str = secret_key_ref.get('name', None)
+    keys: Optional[List[str]] = secret_key_ref.get('keys', None)
+
+    if ns_from is None or name_from is None:
+        logger.error('ERROR reading data from remote secret, enable debug for more details')
+        logger.debug('Deta details: %s', data)
+        raise kopf.TemporaryError('Can not get Values from external secret')
+
+    # Filter the keys in data based on the keys list provided
+    raw_data = source_data if source_data is not None else read_data_secret(logger, name_from, ns_from, v1)
+    if keys is not None:
+        return {key: value for key, value in raw_data.items() if key in keys}
+    return raw_data
+
+
+def data_digest(data: Optional[Mapping[str, str]]) -> str:
+    """Stable digest of secret data, independent of the key order
+    """
+    digest = hashlib.sha256()
+    for key, value in sorted((data or {}).items()):
+        digest.update(f'{key}={value};'.encode())
+    return digest.hexdigest()
+
+
+def child_digest(secret: Mapping[str, Any]) -> Optional[str]:
+    """Digest of the type and data of a child secret, None when not managed by ClusterSecret
+    """
+    annotations = (secret.get('metadata') or {}).get('annotations') or {}
+    if annotations.get(CREATE_BY_ANNOTATION) is None:
+        return None
+    return f"{secret.get('type', 'Opaque')}:{data_digest(secret.get('data'))}"
+
+
+def create_data_patch(
+        old: Optional[Mapping[str, Any]],
+        new: Optional[Mapping[str, Any]],
+        data: Mapping[str, str],
+) -> Optional[Dict[str, Any]]:
+    """Create the merge patch carrying only the keys that changed between old and new
+
+    ``old`` and ``new`` are only compared, the values sent come from ``data``. The
+    same patch body can be sent to every child secret.
+
+    Returns
+    -------
+    Optional[Dict[str, Any]]
+        The patch body, or None when no key changed.
+    """
+    old = old or {}
+    new = new or {}
+    delta: Dict[str, Optional[str]] = {key: data[key] for key in new if key in data and old.get(key) != new[key]}
+    # A null value removes the key from the secret.
+    delta.update({key: None for key in old if key not in new})
+    if not delta:
+        return None
+
+    return {
+        'metadata': {'annotations': {LAST_SYNC_ANNOTATION: datetime.now().isoformat()}},
+        'data': delta,
+    }
+
+
+def create_secret_body(
+        logger: logging.Logger,
+        body: Dict[str, Any],
+        v1: SlimCoreV1Api,
+        source_data: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Create the child secret payload of a ClusterSecret, without namespace
+
+    The payload is built once per fan-out, as a plain dict that the API client
+    serializes without walking model objects, and shared by every namespace
+    through ``stamp_namespace``.
     """
     if 'metadata' not in body:
         raise kopf.TemporaryError('Metadata is required.')
@@ -168,102 +397,242 @@ def sync_secret(
         raise kopf.TemporaryError('Property name is missing in metadata.')
 
     cs_metadata: Dict[str, Any] = body.get('metadata')
-    sec_name = cs_metadata.get('name')
-    annotations = cs_metadata.get('annotations', None)
-    labels = cs_metadata.get('labels', None)
+    metadata = create_secret_metadata(
+        name=cs_metadata.get('name'),
+        namespace=None,
+        annotations=cs_metadata.get('annotations', None),
+        labels=cs_metadata.get('labels', None),
+    )
 
-    if 'data' not in body:
-        raise kopf.TemporaryError('Property data is missing.')
+    data = get_secret_data(logger, body, v1, source_data)
+    logger.debug('Going to create with data keys: %s', Count(data))
+
+    secret_body = {
+        'apiVersion': 'v1',
+        'kind': 'Secret',
+        'metadata': {
+            'name': metadata.name,
+            'annotations': metadata.annotations,
+            'labels': {**metadata.labels, ALIAS_LABEL: alias(metadata.name)},
+        },
+        'type': body.get('type', 'Opaque'),
+        'data': data,
+    }
+    if is_immutable(body):
+        # Kubelets do not watch immutable secrets: a data change creates a new version instead.
+        secret_body['metadata']['name'] = versioned_name(metadata.name, data)
+        secret_body['immutable'] = True
+    return secret_body
 
-    data: Dict[str, Any] = body['data']
 
-    if 'valueFrom' in data:
-        if len(data.keys()) > 1:
-            logger.error('Data keys with ValueFrom error, enable debug for more details')
-            logger.debug(f'keys: {data.keys()}  len {len(data.keys())}')
-            raise kopf.TemporaryError('ValueFrom can not coexist with other keys in the data')
-
-        secret_key_ref: Dict[str, Any] = data.get('valueFrom', {}).get('secretKeyRef', {})
-        ns_from: str = secret_key_ref.get('namespace', None)
-        name_from: str = secret_key_ref.get('name', None)
-        keys: Optional[List[str]] = secret_key_ref.get('keys', None)
-
-        if ns_from is None or name_from is None:
-            logger.error('ERROR reading data from remote secret, enable debug for more details')
-            logger.debug(f'Deta details: {data}')
-            raise kopf.TemporaryError('Can not get Values from external secret')
-
-        # Filter the keys in data based on the keys list provided
-        raw_data = read_data_secret(logger, name_from, ns_from, v1)
-        if keys is not None:
-            data = {key: value for key, value in raw_data.items() if key in keys}
-        else:
-            data = raw_data
+def is_immutable(body: Mapping[str, Any]) -> bool:
+    """Whether a ClusterSecret creates immutable, content-versioned child secrets"""
+    return bool(body.get('immutable'))
 
-    logger.debug(f'Going to create with data: {data}')
-    secret_type = body.get('type', 'Opaque')
 
-    body = V1Secret()
-    body.metadata = create_secret_metadata(
-        name=sec_name,
-        namespace=namespace,
-        annotations=annotations,
-        labels=labels,
+def versioned_name(name: str, data: Optional[Mapping[str, str]]) -> str:
+    """Name of the immutable child secret holding the given data, the name of the ClusterSecret truncated to fit"""
+    return f'{name[:MAX_NAME_LENGTH - 11]}-{data_digest(data)[:10]}'
+
+
+def alias(name: str) -> str:
+    """Value of the alias label of the child secrets of a ClusterSecret
+
+    Names too long for a label value are truncated, with a digest of the full
+    name to keep them apart.
+    """
+    if len(name) <= MAX_LABEL_VALUE_LENGTH:
+        return name
+    digest = hashlib.sha256(name.encode()).hexdigest()[:10]
+    return f'{name[:MAX_LABEL_VALUE_LENGTH - 11]}-{digest}'
+
+
+def stale_versions(
+        namespace: str,
+        name: str,
+        v1: SlimCoreV1Api,
+        current: Optional[str] = None,
+        keep: int = DEFAULT_KEEP_VERSIONS,
+) -> List[str]:
+    """Names of the versions of the child secret older than the ``keep`` most recent ones, besides the current one
+    """
+    secrets = v1.list_namespaced_secret_metadata(namespace, label_selector=f'{ALIAS_LABEL}={alias(name)}')
+    # RFC 3339 timestamps in UTC sort like the times they stand for.
+    previous = sorted(
+        (secret for secret in secrets if secret.name != current),
+        key=lambda secret: secret.creation_timestamp or '',
+        reverse=True,
     )
-    body.type = secret_type
-    body.data = data
-    logger.info(f'cloning secret in namespace {namespace}')
-    logger.debug(f'V1Secret= {body}')
+    return [secret.name for secret in previous[keep:]]
 
-    try:
-        # Get metadata from secrets (if exist)
-        metadata = secret_metadata(logger, name=sec_name, namespace=namespace, v1=v1)
 
-        # If nothing returned, the secret does not exist, creating it then
-        if metadata is None:
-            logger.info('Using create_namespaced_secret')
-            logger.debug(f'response is {v1.create_namespaced_secret(namespace, body)}')
-            return
+def prune_versions(
+        logger: logging.Logger,
+        namespace: str,
+        name: str,
+        v1: SlimCoreV1Api,
+        current: Optional[str] = None,
+        keep: int = DEFAULT_KEEP_VERSIONS,
+) -> int:
+    """Deletes the versions of the child secret older than the ``keep`` most recent ones, besides the current one
+
+    Returns
+    -------
+    int
+        The number of deleted versions.
+    """
+    stale = stale_versions(namespace, name, v1, current, keep)
+    for secret_name in stale:
+        delete_secret(logger, namespace, secret_name, v1)
+    return len(stale)
+
+
+def delete_children(
+        logger: logging.Logger,
+        namespace: str,
+        name: str,
+        body: Mapping[str, Any],
+        v1: SlimCoreV1Api,
+):
+    """Deletes the child secret of a ClusterSecret from a namespace, all its versions when immutable
+    """
+    if is_immutable(body):
+        prune_versions(logger, namespace, name, v1, keep=0)
+    else:
+        delete_secret(logger, namespace, name, v1)
+
+
+def stamp_namespace(secret_body: Dict[str, Any], namespace: str) -> Dict[str, Any]:
+    """Shallow copy of a shared secret payload, targeting the given namespace
+    """
+    return {**secret_body, 'metadata': {**secret_body['metadata'], 'namespace': namespace}}
+
 
-        if metadata.annotations is None:
+def sync_action(
+        logger: logging.Logger,
+        metadata: Optional[SecretMetadata],
+        sec_name: str,
+        namespace: str,
+) -> str:
+    """Decide what syncing does to the child secret with the given metadata: create, replace or skip
+
+    Secrets not managed by ClusterSecret are only replaced with REPLACE_EXISTING.
+    """
+    # If nothing returned, the secret does not exist, creating it then
+    if metadata is None:
+        return 'create'
+
+    if metadata.annotations is None:
+        logger.info(
+            'secret `%s` exist but it does not have annotations, so is not managed by ClusterSecret',
+            sec_name,
+        )
+
+        # If we should not overwrite existing secrets
+        if not get_replace_existing():
             logger.info(
-                f'secret `{sec_name}` exist but it does not have annotations, so is not managed by ClusterSecret',
+                'secret `%s` will not be replaced. '
+                'You can enforce this by setting env REPLACE_EXISTING to true.',
+                sec_name,
             )
+            return 'skip'
+    elif metadata.annotations.get(CREATE_BY_ANNOTATION) is None:
+        logger.error(
+            "secret `%s` already exist in namespace '%s' and is not managed by ClusterSecret",
+            sec_name,
+            namespace,
+        )
 
-            # If we should not overwrite existing secrets
-            if not get_replace_existing():
-                logger.info(
-                    f'secret `{sec_name}` will not be replaced. '
-                    'You can enforce this by setting env REPLACE_EXISTING to true.',
-                )
-                return
-        elif metadata.annotations.get(CREATE_BY_ANNOTATION) is None:
-            logger.error(
-                f"secret `{sec_name}` already exist in namespace '{namespace}' and is not managed by ClusterSecret",
+        if not get_replace_existing():
+            logger.info(
+                'secret `%s` will not be replaced. '
+                'You can enforce this by setting env REPLACE_EXISTING to true.',
+                sec_name,
             )
+            return 'skip'
+    return 'replace'
+
+
+def sync_secret(
+        logger: logging.Logger,
+        namespace: str,
+        body: Dict[str, Any],
+        v1: SlimCoreV1Api,
+        secret_body: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Creates a given secret on a given namespace
+
+    ``secret_body`` is the payload from ``create_secret_body``, to be passed when
+    syncing the same ClusterSecret into many namespaces.
 
-            if not get_replace_existing():
-                logger.info(
-                    f'secret `{sec_name}` will not be replaced. '
-                    'You can enforce this by setting env REPLACE_EXISTING to true.',
-                )
-                return
+    Returns
+    -------
+    str
+        What was done: created, replaced, skipped or failed, for the caller to
+        log one summary of the whole fan-out.
+    """
+    if secret_body is None:
+        secret_body = create_secret_body(logger, body, v1)
+
+    sec_name = secret_body['metadata']['name']
+    data = secret_body['data']
+    keep = body.get('keepVersions', DEFAULT_KEEP_VERSIONS)
+    cluster_secret_name = body['metadata']['name']
+    body = stamp_namespace(secret_body, namespace)
+    logger.debug('cloning secret %s in namespace %s', sec_name, namespace)
+
+    try:
+        # Get metadata from secrets (if exist)
+        metadata = secret_metadata(logger, name=sec_name, namespace=namespace, v1=v1)
 
-        logger.info(f'Replacing secret {sec_name}')
+        action = sync_action(logger, metadata, sec_name, namespace)
+        if action == 'create':
+            v1.create_namespaced_secret(namespace, body)
+            if body.get('immutable'):
+                prune_versions(logger, namespace, cluster_secret_name, v1, sec_name, keep)
+            return 'created'
+        # An existing immutable version holds the same data, by its name.
+        if action == 'skip' or body.get('immutable'):
+            return 'skipped'
+
+        logger.debug('Replacing secret %s in namespace %s', sec_name, namespace)
         v1.replace_namespaced_secret(
             name=sec_name,
             namespace=namespace,
             body=body,
         )
+        return 'replaced'
     except rest.ApiException as e:
         logger.error('Can not create a secret, it is base64 encoded? enable debug for details')
-        logger.debug(f'data: {data}')
-        logger.debug(f'Kube exception {e}')
+        logger.debug('data keys: %s', Count(data))
+        logger.debug('Kube exception %s', e)
+        return 'failed'
+
+
+def child_status(syncedns: List[str], secret_body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Status of the child secrets, with the name of the current version when immutable
+    """
+    status: Dict[str, Any] = {'syncedns': syncedns}
+    if secret_body is not None and secret_body.get('immutable'):
+        status['secretName'] = secret_body['metadata']['name']
+    return status
+
+
+def patterns_condition(error: Optional[str] = None) -> Dict[str, str]:
+    """Status condition telling whether the namespace patterns were accepted
+    """
+    return {
+        'type': PATTERNS_CONDITION,
+        'status': 'False' if error else 'True',
+        'reason': 'InvalidPattern' if error else 'Valid',
+        'message': error or 'All namespace patterns are valid',
+        'lastTransitionTime': datetime.now(timezone.utc).isoformat(),
+    }
 
 
 def create_secret_metadata(
         name: str,
-        namespace: str,
+        namespace: Optional[str],
         annotations: Optional[Mapping[str, str]] = None,
         labels: Optional[Mapping[str, str]] = None,
 ) -> V1ObjectMeta:
@@ -273,7 +642,7 @@ def create_secret_metadata(
     ----------
     name: str
         The name of the Kubernetes secret.
-    namespace: str
+    namespace: Optional[str]
         The namespace where the secret will be place.
     labels: Optional[Dict[str, str]]
         The secret labels.
@@ -297,7 +666,11 @@ def create_secret_metadata(
         if source is not None:
             for item in source.items():
                 key, _ = item
-                if not any(key.startswith(prefix) for prefix in prefixes):
+                domain = key.partition('/')[0]
+                if not any(
+                    domain.endswith(prefix) if prefix.startswith('.') else key.startswith(prefix)
+                    for prefix in prefixes
+                ):
                     yield item
 
     base_labels = {
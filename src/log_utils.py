@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+# Keys whose values are never written to the logs.
+REDACTED_KEYS = frozenset(['data', 'stringData'])
+
+
+def redact(value: Any) -> Any:
+    """Copy of a body or model with the values of the secret keys replaced by their sizes
+    """
+    if hasattr(value, 'to_dict'):
+        value = value.to_dict()
+    elif hasattr(value, '_asdict'):
+        value = value._asdict()
+    if isinstance(value, Mapping):
+        return {
+            key: _redact_data(item) if key in REDACTED_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def _redact_data(data: Any) -> Any:
+    if not isinstance(data, Mapping):
+        return '<redacted>'
+    return {key: f'<redacted {len(str(item or ""))} bytes>' for key, item in data.items()}
+
+
+class Redacted:
+    """Log argument formatting its value redacted, only when the record is emitted.
+
+    >>> logger.debug('Updating Object body == %s', Redacted(body))
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __str__(self) -> str:
+        return str(redact(self.value))
+
+    __repr__ = __str__
+
+
+class Count:
+    """Log argument formatting the size of a collection, with its first items, only when emitted."""
+
+    __slots__ = ('items', 'limit')
+
+    def __init__(self, items: Any, limit: int = 5) -> None:
+        self.items = items
+        self.limit = limit
+
+    def __str__(self) -> str:
+        items = sorted(self.items)
+        shown = ', '.join(str(item) for item in items[:self.limit])
+        if len(items) > self.limit:
+            shown += ', ...'
+        return f'{len(items)} [{shown}]'
+
+    __repr__ = __str__
+
+
+class SampledRepeatsFilter(logging.Filter):
+    """Let through the first ``burst`` records of a message per ``window`` seconds.
+
+    Records are grouped by logger, level and unformatted message, so the
+    same line logged for thousands of namespaces costs a dict lookup once the
+    burst is spent. The first record of the next window tells how many were
+    dropped. Warnings and errors always pass, they may differ by their arguments.
+    """
+
+    def __init__(self, burst: int = 10, window: float = 60) -> None:
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.seen: Dict[Tuple[str, int, Any], Tuple[float, int]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            started, count = self.seen.get(key, (now, 0))
+            if now - started >= self.window:
+                dropped = count - self.burst
+                started, count = now, 0
+                if dropped > 0:
+                    record.msg = f'{record.msg} (repeated {dropped} more times in the last {self.window:g}s)'
+            count += 1
+            self.seen[key] = (started, count)
+        return count <= self.burst
+
+
+def install_sampling(
+        logger: Optional[logging.Logger] = None,
+        burst: int = 10,
+        window: float = 60,
+) -> SampledRepeatsFilter:
+    """Sample the repeated records of a logger, the objects logger of kopf by default"""
+    logger = logger or logging.getLogger('kopf.objects')
+    for existing in logger.filters:
+        if isinstance(existing, SampledRepeatsFilter):
+            return existing
+    sampling = SampledRepeatsFilter(burst, window)
+    logger.addFilter(sampling)
+    return sampling
+
+
+def log_level(value: str) -> int:
+    """Logging level from its number or its name, like ``30`` or ``WARNING``"""
+    if value.strip().isdigit():
+        return int(value)
+    level = logging.getLevelName(value.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f'Unknown logging level {value!r}')
+    return level
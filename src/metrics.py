@@ -0,0 +1,141 @@
+"""
+In-process metrics of the operator, served in the Prometheus text format.
+
+Counters and gauges are kept by name and labels in a registry, and summaries
+as a sum and a count. Collectors set the metrics read from elsewhere right
+before every render. ``MetricsServer`` serves the registry on ``/metrics``.
+"""
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Registry:
+    """Thread-safe store of counters, gauges and summaries."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.types: Dict[str, str] = {}
+        self.helps: Dict[str, str] = {}
+        self.values: Dict[str, Dict[Labels, float]] = {}
+        self.collectors: List[Callable[['Registry'], None]] = []
+
+    def describe(self, name: str, kind: str, help: str) -> None:
+        with self.lock:
+            self.types[name] = kind
+            self.helps[name] = help
+            names = [f'{name}_sum', f'{name}_count'] if kind == 'summary' else [name]
+            for series in names:
+                self.values.setdefault(series, {})
+
+    def _add(self, name: str, labels: Dict[str, str], amount: float) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        self._add(name, labels, amount)
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self.lock:
+            self.values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self._add(f'{name}_sum', labels, value)
+        self._add(f'{name}_count', labels, 1)
+
+    def get(self, name: str, **labels: str) -> float:
+        with self.lock:
+            return self.values.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def add_collector(self, collector: Callable[['Registry'], None]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector(self)
+        lines = []
+        with self.lock:
+            for name, kind in sorted(self.types.items()):
+                lines.append(f'# HELP {name} {self.helps[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+                for series in ([f'{name}_sum', f'{name}_count'] if kind == 'summary' else [name]):
+                    for labels, value in sorted(self.values.get(series, {}).items()):
+                        lines.append(f'{series}{format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+# The registry of the operator, its metrics are described next to the code updating them.
+REGISTRY = Registry()
+
+REGISTRY.describe(
+    'clustersecret_startup_seconds', 'gauge',
+    'Seconds from the start of the process to each phase of the operator start.',
+)
+
+# Seconds since the start of the process at each phase of the operator start, the first time it was reached.
+startup_phases: Dict[str, float] = {}
+
+
+def process_uptime() -> Optional[float]:
+    """Seconds since the process started, read from /proc, None elsewhere than on Linux"""
+    try:
+        with open('/proc/self/stat') as f:
+            # The start time is the 22nd field, the 20th after the command name in parentheses.
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def mark_startup(phase: str, registry: Registry = REGISTRY) -> Optional[float]:
+    """Record when a phase of the start is first reached, returning its time"""
+    if phase not in startup_phases:
+        uptime = process_uptime()
+        if uptime is None:
+            return None
+        startup_phases[phase] = uptime
+        registry.set('clustersecret_startup_seconds', uptime, phase=phase)
+    return startup_phases[phase]
+
+
+class MetricsServer:
+    """Serves the registry on /metrics."""
+
+    def __init__(self, registry: Registry = REGISTRY, port: int = 9090) -> None:
+        self.registry = registry
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/metrics', self.metrics)
+        return app
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self, logger: logging.Logger):
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, port=self.port).start()
+        logger.info('Metrics listening on port %s', self.port)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
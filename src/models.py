@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 from pydantic import BaseModel
 
@@ -8,3 +8,14 @@ class BaseClusterSecret(BaseModel):
     name: str
     body: Dict[str, Any]
     synced_namespace: List[str]
+
+    def value_from_source(self) -> Optional[Tuple[str, str]]:
+        """Namespace and name of the secret the data is read from with valueFrom, if any"""
+        data = self.body.get('data')
+        if not isinstance(data, dict) or not isinstance(data.get('valueFrom'), dict):
+            return None
+        secret_key_ref = data['valueFrom'].get('secretKeyRef') or {}
+        namespace, name = secret_key_ref.get('namespace'), secret_key_ref.get('name')
+        if not namespace or not name:
+            return None
+        return namespace, name
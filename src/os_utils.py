@@ -1,7 +1,9 @@
 import os
+import socket
 from functools import cache
+from typing import Dict, List, Optional, Union
 
-from consts import BLOCKED_LABELS
+from consts import BLOCKED_LABELS, KOPF_SETTINGS_ENV
 
 
 @cache
@@ -32,3 +34,255 @@ def in_cluster() -> bool:
     Whether we are running in cluster (on the pod)  or outside (debug mode.)
     """
     return os.getenv('KUBERNETES_SERVICE_HOST', None) is not None
+
+
+@cache
+def get_reconcile_interval() -> float:
+    """
+    Seconds between two periodic reconciliation sweeps, 0 disables them.
+    """
+    return float(os.getenv('RECONCILE_INTERVAL', '0'))
+
+
+@cache
+def get_reconcile_batch_size() -> int:
+    return int(os.getenv('RECONCILE_BATCH_SIZE', '10'))
+
+
+@cache
+def get_reconcile_jitter() -> float:
+    """
+    Fraction (0-1) of random jitter applied to the reconciliation delays.
+    """
+    return float(os.getenv('RECONCILE_JITTER', '0.2'))
+
+
+@cache
+def get_reconcile_qps() -> float:
+    """
+    Maximum API requests per second issued by the reconciliation sweeps.
+    """
+    return float(os.getenv('RECONCILE_QPS', '5'))
+
+
+@cache
+def get_sharding_enabled() -> bool:
+    """
+    Whether ClusterSecrets are split across the operator replicas.
+    """
+    return os.getenv('SHARDING_ENABLED', 'false').lower() == 'true'
+
+
+@cache
+def get_shard_lease_duration() -> int:
+    return int(os.getenv('SHARD_LEASE_DURATION', '15'))
+
+
+@cache
+def get_standby_enabled() -> bool:
+    """
+    Whether the operator replicas elect one active leader, the others standing by with warm caches.
+    """
+    return os.getenv('STANDBY_ENABLED', 'false').lower() == 'true'
+
+
+@cache
+def get_leader_lease_duration() -> int:
+    """
+    Seconds without renewal after which a standby replica takes over from the leader.
+    """
+    return int(os.getenv('LEADER_LEASE_DURATION', '15'))
+
+
+@cache
+def get_pod_name() -> str:
+    return os.getenv('POD_NAME', socket.gethostname())
+
+
+@cache
+def get_pod_namespace() -> str:
+    return os.getenv('POD_NAMESPACE', 'clustersecret')
+
+
+@cache
+def get_kopf_settings() -> Dict[str, Union[int, float]]:
+    """
+    Kopf settings set through environment variables, as 'section.field' -> value.
+    """
+    settings = {}
+    for env, (field, cast) in KOPF_SETTINGS_ENV.items():
+        if value := os.getenv(env):
+            settings[field] = cast(value)
+    return settings
+
+
+@cache
+def get_connection_pool_maxsize() -> Optional[int]:
+    """
+    Connections kept per host by the Kubernetes API clients, None keeps the client default.
+    """
+    if maxsize := os.getenv('KUBE_CONNECTION_POOL_MAXSIZE'):
+        return int(maxsize)
+    return None
+
+
+@cache
+def get_connection_pool_block() -> bool:
+    """
+    Whether the API requests wait for a pooled connection rather than opening one the pool then discards.
+    """
+    return os.getenv('KUBE_CONNECTION_POOL_BLOCK', 'false').lower() == 'true'
+
+
+@cache
+def get_connection_keepalive() -> int:
+    """
+    Seconds a connection to the API server stays idle before TCP keep-alive probes, 0 disables them.
+    """
+    return int(os.getenv('KUBE_CONNECTION_KEEPALIVE', '30'))
+
+
+@cache
+def get_http2_enabled() -> bool:
+    """
+    Whether to multiplex the API requests over HTTP/2, requires the packages of requirements-http2.txt.
+    """
+    return os.getenv('KUBE_HTTP2', 'false').lower() == 'true'
+
+
+@cache
+def get_tracing_enabled() -> bool:
+    """
+    Whether to export OpenTelemetry traces, requires the packages of requirements-tracing.txt.
+    """
+    return os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+
+
+@cache
+def get_log_sample_burst() -> int:
+    """
+    Records of the same message logged per sampling window, 0 or less disables the sampling.
+    """
+    return int(os.getenv('LOG_SAMPLE_BURST', '0'))
+
+
+@cache
+def get_log_sample_window() -> float:
+    """
+    Seconds of a log sampling window.
+    """
+    return float(os.getenv('LOG_SAMPLE_WINDOW', '60'))
+
+
+@cache
+def get_debug_token() -> Optional[str]:
+    """
+    Bearer token of the debug endpoints, which are only served when it is set.
+    """
+    return os.getenv('DEBUG_TOKEN') or None
+
+
+@cache
+def get_debug_port() -> int:
+    return int(os.getenv('DEBUG_PORT', '8081'))
+
+
+@cache
+def get_rollout_waves() -> List[float]:
+    """
+    Cumulative percentages of the synced namespaces updated by each wave of a data change, e.g. 5,25,100.
+    """
+    return [float(wave) / 100 for wave in os.getenv('ROLLOUT_WAVES', '100').split(',') if wave.strip()]
+
+
+@cache
+def get_rollout_concurrency() -> int:
+    return int(os.getenv('ROLLOUT_CONCURRENCY', '1'))
+
+
+@cache
+def get_rollout_qps() -> float:
+    """
+    Maximum API requests per second of a data change rollout, 0 or less for no limit.
+    """
+    return float(os.getenv('ROLLOUT_QPS', '0'))
+
+
+@cache
+def get_rollout_pause() -> float:
+    """
+    Seconds to wait between two waves of a data change rollout.
+    """
+    return float(os.getenv('ROLLOUT_PAUSE', '0'))
+
+
+@cache
+def get_source_watch_enabled() -> bool:
+    """
+    Whether to watch the secrets, to push the changes of valueFrom sources to the ClusterSecrets reading them.
+    """
+    return os.getenv('SOURCE_WATCH_ENABLED', 'false').lower() == 'true'
+
+
+@cache
+def get_watch_page_size() -> int:
+    """
+    Objects per page when the namespaces or secrets are relisted.
+    """
+    return int(os.getenv('WATCH_PAGE_SIZE', '500'))
+
+
+@cache
+def get_watch_timeout() -> int:
+    """
+    Seconds after which the API server ends a watch, which then resumes from the last resourceVersion.
+    """
+    return int(os.getenv('WATCH_TIMEOUT', '300'))
+
+
+@cache
+def get_namespace_watch_filter() -> bool:
+    """
+    Whether to watch only the namespaces the ClusterSecrets may match, when a label selector can tell them apart.
+    """
+    return os.getenv('NAMESPACE_WATCH_FILTER', 'false').lower() == 'true'
+
+
+@cache
+def get_metrics_port() -> int:
+    """
+    Port of the metrics endpoint, 0 disables it.
+    """
+    return int(os.getenv('METRICS_PORT', '0'))
+
+
+@cache
+def get_runtime_profile() -> str:
+    """
+    Runtime profile of the operator: standard, or fast for uvloop and orjson, see runtime.py.
+    """
+    return os.getenv('RUNTIME_PROFILE', 'standard').lower()
+
+
+@cache
+def get_shed_backlog() -> int:
+    """
+    Namespaces left to sync by the fan-outs past which the periodic and status work is shed, 0 never sheds.
+    """
+    return int(os.getenv('SHED_BACKLOG', '0'))
+
+
+@cache
+def get_ready_backlog() -> int:
+    """
+    Namespaces left to sync by the fan-outs past which the operator is not ready, 0 ignores the backlog.
+    """
+    return int(os.getenv('READY_BACKLOG', '5000'))
+
+
+@cache
+def get_readiness_port() -> int:
+    """
+    Port of the readiness endpoint, 0 disables it.
+    """
+    return int(os.getenv('READINESS_PORT', '0'))
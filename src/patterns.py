@@ -0,0 +1,95 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Pattern
+
+try:
+    import re._parser as sre_parse  # Python >= 3.11
+except ImportError:
+    import sre_parse  # type: ignore
+
+from consts import MAX_PATTERN_LENGTH
+
+# Fields of a ClusterSecret holding namespace name patterns.
+PATTERN_FIELDS = ['matchNamespace', 'avoidNamespaces']
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+# A pattern matching a single namespace name, e.g. "^team-a$".
+_LITERAL_NAME = re.compile(r'\^?([a-z0-9](?:[-a-z0-9]*[a-z0-9])?)\$')
+
+
+class PatternError(ValueError):
+    """A namespace pattern is invalid, or too expensive to evaluate."""
+
+
+def _has_nested_repeat(parsed: Any, in_repeat: bool = False) -> bool:
+    """Whether a repetition is nested in another one, like ``(a+)+``, the main source of catastrophic backtracking
+    """
+    for op, av in parsed:
+        if op in _REPEATS:
+            _, max_repeat, subpattern = av
+            if max_repeat > 1 and in_repeat:
+                return True
+            if _has_nested_repeat(subpattern, in_repeat or max_repeat > 1):
+                return True
+        elif op == sre_parse.SUBPATTERN:
+            if _has_nested_repeat(av[-1], in_repeat):
+                return True
+        elif op == sre_parse.BRANCH:
+            if any(_has_nested_repeat(branch, in_repeat) for branch in av[1]):
+                return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            if _has_nested_repeat(av[1], in_repeat):
+                return True
+    return False
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    """Compile a namespace pattern once, rejecting the invalid and the dangerous ones
+    """
+    if not isinstance(pattern, str):
+        raise PatternError(f'Pattern {pattern!r} is not a string')
+    return _compile_pattern(pattern)
+
+
+@lru_cache(maxsize=1024)
+def _compile_pattern(pattern: str) -> Pattern:
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise PatternError(f'Pattern {pattern[:32]!r}... is longer than {MAX_PATTERN_LENGTH} characters')
+
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        raise PatternError(f'Pattern {pattern!r} is not a valid regular expression: {e}')
+
+    if _has_nested_repeat(sre_parse.parse(pattern)):
+        raise PatternError(f'Pattern {pattern!r} nests repetitions and may backtrack catastrophically')
+
+    return compiled
+
+
+def validate_patterns(body: Dict[str, Any]):
+    """Compile all the namespace patterns of a ClusterSecret, raising PatternError on the first bad one
+    """
+    for field in PATTERN_FIELDS:
+        patterns = body.get(field, None) or []
+        if not isinstance(patterns, list):
+            raise PatternError(f'{field} must be a list of patterns')
+        for pattern in patterns:
+            compile_pattern(pattern)
+
+
+def match_names(pattern: str, names: Iterable[str]) -> List[str]:
+    compiled = compile_pattern(pattern)
+    return [name for name in names if compiled.match(name)]
+
+
+def match_any(patterns: Iterable[str], name: str) -> bool:
+    return any(compile_pattern(pattern).match(name) for pattern in patterns)
+
+
+def literal_name(pattern: str) -> Optional[str]:
+    """The only namespace name the pattern matches, if it is anchored and has no special characters
+    """
+    literal = _LITERAL_NAME.fullmatch(pattern) if isinstance(pattern, str) else None
+    return literal.group(1) if literal else None
@@ -0,0 +1,275 @@
+"""
+Dry-run planner: what syncing ClusterSecrets would do, without changing anything.
+
+For each ClusterSecret, computes the action on every namespace (create,
+replace, skip or delete) with the same code as the operator, and the number
+of API calls it would take. The cluster state is read live, or from offline
+dumps made with ``kubectl get -o json``.
+
+    # Plan a manifest against the live cluster
+    python src/planner.py -f my-clustersecret.yaml
+
+    # Plan all the ClusterSecrets from offline dumps
+    kubectl get namespaces -o json > namespaces.json
+    kubectl get secrets -A -o json > secrets.json
+    kubectl get clustersecrets -o json > clustersecrets.json
+    python src/planner.py --namespaces namespaces.json --secrets secrets.json --clustersecrets clustersecrets.json
+"""
+import argparse
+import json
+import logging
+import sys
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import kopf
+import yaml
+from kubernetes import client, config
+from kubernetes.client import exceptions, V1Namespace, V1ObjectMeta, V1Secret
+
+from cache import Cache, MemoryCache
+from consts import DEFAULT_KEEP_VERSIONS
+from kubernetes_utils import create_secret_body, get_custom_objects_by_kind, get_ns_list, is_immutable, \
+    secret_metadata, stale_versions, sync_action
+from models import BaseClusterSecret
+from patterns import PatternError
+from slim_api import NamespaceRecord, SecretMetadata, SecretRecord
+
+# API calls made per action on a child secret: the read of its metadata, then the write.
+ACTION_CALLS = {'create': 2, 'replace': 2, 'skip': 1, 'delete': 1}
+
+
+class SnapshotApi:
+    """Read-only stand-in of CoreV1Api serving a snapshot of the namespaces and secrets."""
+
+    def __init__(self, namespaces: Iterable[Dict[str, Any]], secrets: Iterable[Dict[str, Any]]) -> None:
+        self.namespaces = [
+            V1Namespace(metadata=V1ObjectMeta(
+                name=namespace['metadata']['name'],
+                labels=namespace['metadata'].get('labels'),
+            ))
+            for namespace in namespaces
+        ]
+        self.secrets = {}
+        for secret in secrets:
+            metadata = secret['metadata']
+            self.secrets[(metadata['namespace'], metadata['name'])] = V1Secret(
+                metadata=V1ObjectMeta(
+                    name=metadata['name'],
+                    namespace=metadata['namespace'],
+                    annotations=metadata.get('annotations'),
+                    labels=metadata.get('labels'),
+                    creation_timestamp=metadata.get('creationTimestamp'),
+                ),
+                data=secret.get('data'),
+                type=secret.get('type'),
+            )
+
+    @classmethod
+    def from_api(cls, v1: client.CoreV1Api) -> 'SnapshotApi':
+        """Snapshot of the live cluster, taken with two list calls"""
+        sanitize = v1.api_client.sanitize_for_serialization
+        return cls(
+            namespaces=sanitize(v1.list_namespace().items),
+            secrets=sanitize(v1.list_secret_for_all_namespaces().items),
+        )
+
+    def list_namespace_metadata(self) -> List[NamespaceRecord]:
+        return [NamespaceRecord(ns.metadata.name, ns.metadata.labels or {}) for ns in self.namespaces]
+
+    def read_namespaced_secret(self, name: str, namespace: str) -> V1Secret:
+        secret = self.secrets.get((namespace, name))
+        if secret is None:
+            raise exceptions.ApiException(status=404, reason='Not Found')
+        return secret
+
+    def read_namespaced_secret_metadata(self, name: str, namespace: str) -> SecretMetadata:
+        metadata = self.read_namespaced_secret(name, namespace).metadata
+        return SecretMetadata(
+            metadata.name, metadata.namespace, metadata.annotations, metadata.labels, metadata.creation_timestamp,
+        )
+
+    def read_namespaced_secret_record(self, name: str, namespace: str) -> SecretRecord:
+        secret = self.read_namespaced_secret(name, namespace)
+        return SecretRecord(
+            secret.metadata.name, secret.metadata.namespace, secret.metadata.annotations, secret.data,
+            secret.type or 'Opaque',
+        )
+
+    def list_namespaced_secret_metadata(
+        self,
+        namespace: str,
+        label_selector: Optional[str] = None,
+    ) -> List[SecretMetadata]:
+        """Metadata of the secrets of a namespace, selected by a single ``key=value`` label selector"""
+        key, _, value = (label_selector or '').partition('=')
+        return [
+            self.read_namespaced_secret_metadata(name, ns)
+            for ns, name in self.secrets
+            if ns == namespace and (not key or (self.secrets[(ns, name)].metadata.labels or {}).get(key) == value)
+        ]
+
+
+def plan_cluster_secret(
+        logger: logging.Logger,
+        body: Dict[str, Any],
+        synced_namespaces: List[str],
+        v1: SnapshotApi,
+) -> Dict[str, Any]:
+    """Plan of syncing one ClusterSecret, as the create and resume handlers do
+
+    Immutable ClusterSecrets are planned on the version holding their current
+    data, with the older versions that syncing would prune.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The action per namespace, the versions pruned per namespace, the count per
+        action and the predicted API calls, or the error rejecting the ClusterSecret.
+    """
+    name = body['metadata']['name']
+    plan: Dict[str, Any] = {'name': name, 'namespaces': {}, 'pruned': {}, 'actions': {}, 'api_calls': 0}
+    immutable = is_immutable(body)
+    child_name = name
+    try:
+        expected = get_ns_list(logger, body, v1)
+        if immutable:
+            child_name = create_secret_body(logger, body, v1)['metadata']['name']
+    except (PatternError, kopf.PermanentError, kopf.TemporaryError) as e:
+        plan['error'] = str(e)
+        return plan
+
+    keep = body.get('keepVersions', DEFAULT_KEEP_VERSIONS)
+    actions = {}
+    pruned = {}
+    for ns in sorted(expected):
+        action = sync_action(logger, secret_metadata(logger, child_name, ns, v1), child_name, ns)
+        # An existing immutable version holds the same data, by its name.
+        if immutable and action == 'replace':
+            action = 'skip'
+        actions[ns] = action
+        if immutable and action == 'create':
+            pruned[ns] = stale_versions(ns, name, v1, child_name, keep)
+    for ns in sorted(set(synced_namespaces).difference(expected)):
+        actions[ns] = 'delete'
+        if immutable:
+            pruned[ns] = stale_versions(ns, name, v1, keep=0)
+
+    # Listing the namespaces, reading the source secret of valueFrom, and patching the status.
+    api_calls = 1 + ('valueFrom' in (body.get('data') or {}))
+    api_calls += sum(ACTION_CALLS[action] for ns, action in actions.items() if ns not in pruned or action != 'delete')
+    # Listing the versions, then deleting the pruned ones.
+    api_calls += sum(1 + len(versions) for versions in pruned.values())
+    api_calls += set(expected) != set(synced_namespaces)
+
+    plan['namespaces'] = actions
+    plan['pruned'] = {ns: versions for ns, versions in pruned.items() if versions}
+    plan['actions'] = dict(Counter(actions.values()))
+    plan['api_calls'] = api_calls
+    if immutable:
+        plan['secretName'] = child_name
+    return plan
+
+
+def plan(
+        logger: logging.Logger,
+        csecs_cache: Cache,
+        v1: SnapshotApi,
+        manifests: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Plans of the given manifests, or of all the cached ClusterSecrets
+
+    A manifest named like a cached ClusterSecret is planned as an update of it.
+    """
+    cluster_secrets = csecs_cache.all_cluster_secret()
+    if manifests is None:
+        return [
+            plan_cluster_secret(logger, cluster_secret.body, cluster_secret.synced_namespace, v1)
+            for cluster_secret in cluster_secrets
+        ]
+
+    synced = {cluster_secret.name: cluster_secret.synced_namespace for cluster_secret in cluster_secrets}
+    return [
+        plan_cluster_secret(logger, body, synced.get(body['metadata']['name'], []), v1)
+        for body in manifests
+    ]
+
+
+def load_items(path: str) -> List[Dict[str, Any]]:
+    """Objects of a YAML or JSON file, either documents or kubectl lists"""
+    with open(path) as f:
+        documents = [document for document in yaml.safe_load_all(f) if document]
+    items = []
+    for document in documents:
+        items.extend(document['items'] if document.get('kind', '').endswith('List') else [document])
+    return items
+
+
+def load_cache(cluster_secrets: Iterable[Dict[str, Any]]) -> Cache:
+    csecs_cache = MemoryCache()
+    for item in cluster_secrets:
+        metadata = item['metadata']
+        csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid=metadata.get('uid', metadata['name']),
+            name=metadata['name'],
+            body=item,
+            synced_namespace=item.get('status', {}).get('create_fn', {}).get('syncedns', []),
+        ))
+    return csecs_cache
+
+
+def format_plans(plans: List[Dict[str, Any]], details: bool = False) -> str:
+    lines = []
+    for cluster_secret_plan in plans:
+        if 'error' in cluster_secret_plan:
+            lines.append(f'{cluster_secret_plan["name"]}: rejected: {cluster_secret_plan["error"]}')
+            continue
+        actions = ', '.join(f'{action} {count}' for action, count in sorted(cluster_secret_plan['actions'].items()))
+        lines.append(
+            f'{cluster_secret_plan["name"]}: {len(cluster_secret_plan["namespaces"])} namespaces '
+            f'({actions or "nothing to do"}), {cluster_secret_plan["api_calls"]} API calls',
+        )
+        if details:
+            lines.extend(f'  {action:<8} {ns}' for ns, action in cluster_secret_plan['namespaces'].items())
+            lines.extend(
+                f'  {"prune":<8} {ns}/{version}'
+                for ns, versions in cluster_secret_plan.get('pruned', {}).items()
+                for version in versions
+            )
+    lines.append(f'Total: {sum(p["api_calls"] for p in plans)} API calls')
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Plan the sync of ClusterSecrets without changing anything.')
+    parser.add_argument('-f', '--file', action='append', help='ClusterSecret manifests, all the existing ones if unset')
+    parser.add_argument('--namespaces', help='Namespaces dump (kubectl get namespaces -o json), the cluster if unset')
+    parser.add_argument('--secrets', help='Secrets dump (kubectl get secrets -A -o json)')
+    parser.add_argument('--clustersecrets', help='ClusterSecrets dump (kubectl get clustersecrets -o json)')
+    parser.add_argument('--details', action='store_true', help='Show the action on every namespace')
+    parser.add_argument('--json', action='store_true', help='Print the plans as JSON')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger('planner')
+
+    if args.namespaces:
+        v1 = SnapshotApi(load_items(args.namespaces), load_items(args.secrets) if args.secrets else [])
+        cluster_secrets = load_items(args.clustersecrets) if args.clustersecrets else []
+    else:
+        config.load_kube_config()
+        v1 = SnapshotApi.from_api(client.CoreV1Api())
+        cluster_secrets = get_custom_objects_by_kind(
+            group='clustersecret.io',
+            version='v1',
+            plural='clustersecrets',
+            custom_objects_api=client.CustomObjectsApi(),
+        )
+
+    manifests = [item for path in args.file for item in load_items(path)] if args.file else None
+    plans = plan(logger, load_cache(cluster_secrets), v1, manifests)
+    print(json.dumps(plans, indent=2) if args.json else format_plans(plans, args.details))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import random
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from kubernetes.client import CustomObjectsApi, exceptions
+
+from cache import Cache, ChildSecretCache, NamespaceCache
+from consts import CREATE_BY_ANNOTATION
+from kubernetes_utils import child_digest, child_status, create_secret_body, delete_children, namespace_matches, \
+    patch_clustersecret_status, sync_secret
+from models import BaseClusterSecret
+from patterns import PatternError, validate_patterns
+from slim_api import SlimCoreV1Api
+from throttling import RateLimiter, ThrottledApi
+
+
+class Reconciler:
+    """Periodically walks the cached ClusterSecrets and corrects their child secrets.
+
+    Each sweep goes through the ClusterSecrets in small slices separated by
+    jittered pauses. The matching namespaces are computed from the namespace
+    store and every API call goes through a shared rate limiter, so a sweep
+    costs a steady, bounded amount of API requests. Sweeps are low-priority
+    work: when ``shed`` says so, a sweep is skipped or stopped between slices.
+
+    With ``children_cache``, the child secrets are compared with their digest
+    from the watch of the child secrets once ``children_synced``, and only read
+    from the API when missing from it.
+    """
+
+    def __init__(
+        self,
+        csecs_cache: Cache,
+        namespaces_cache: NamespaceCache,
+        v1: SlimCoreV1Api,
+        custom_objects_api: CustomObjectsApi,
+        interval: float,
+        batch_size: int = 10,
+        jitter: float = 0.2,
+        qps: float = 5,
+        owns: Callable[[str], bool] = lambda uid: True,
+        shed: Callable[[str], bool] = lambda work: False,
+        children_cache: Optional[ChildSecretCache] = None,
+        children_synced: Callable[[], bool] = lambda: False,
+    ) -> None:
+        self.csecs_cache = csecs_cache
+        self.namespaces_cache = namespaces_cache
+        limiter = RateLimiter(qps)
+        self.v1 = ThrottledApi(v1, limiter)
+        self.custom_objects_api = ThrottledApi(custom_objects_api, limiter)
+        self.interval = interval
+        self.batch_size = max(batch_size, 1)
+        self.jitter = jitter
+        self.owns = owns
+        self.shed = shed
+        self.children_cache = children_cache
+        self.children_synced = children_synced
+
+    def jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def run(self, logger: logging.Logger):
+        """Sweep forever, until cancelled."""
+        while True:
+            await asyncio.sleep(self.jittered(self.interval))
+            await self.sweep(logger)
+
+    async def sweep(self, logger: logging.Logger):
+        if not self.namespaces_cache.all_namespaces():
+            logger.debug('Namespace store is empty, skipping the reconciliation sweep')
+            return
+
+        cluster_secrets = [
+            cluster_secret for cluster_secret in self.csecs_cache.all_cluster_secret()
+            if self.owns(cluster_secret.uid)
+        ]
+        logger.debug('Reconciling %s ClusterSecrets', len(cluster_secrets))
+        # Spread the slices over a tenth of the interval, leaving room until the next sweep.
+        slice_delay = self.interval / 10 / max(len(cluster_secrets) / self.batch_size, 1)
+        for start in range(0, len(cluster_secrets), self.batch_size):
+            if start:
+                await asyncio.sleep(self.jittered(slice_delay))
+            if self.shed('resync'):
+                logger.info('Overloaded, reconciliation sweep stopped after %s ClusterSecrets', start)
+                return
+            for cluster_secret in cluster_secrets[start:start + self.batch_size]:
+                try:
+                    await asyncio.to_thread(self.reconcile_cluster_secret, logger, cluster_secret)
+                except Exception as e:
+                    logger.warning('Failed to reconcile ClusterSecret %s: %s', cluster_secret.name, e)
+
+    def expected_namespaces(self, cluster_secret: BaseClusterSecret) -> List[str]:
+        return [
+            ns for ns in self.namespaces_cache.all_namespaces()
+            if namespace_matches(cluster_secret.body, ns, self.namespaces_cache.get_labels(ns))
+        ]
+
+    def child_is_outdated(self, logger: logging.Logger, secret_body: Dict[str, Any], namespace: str) -> bool:
+        name = secret_body['metadata']['name']
+        digest = child_digest(secret_body)
+        if self.children_cache is not None and self.children_synced():
+            cached = self.children_cache.get_digest(namespace, name)
+            if cached is not None:
+                return cached != digest
+
+        try:
+            secret = self.v1.read_namespaced_secret_record(name, namespace)
+        except exceptions.ApiException as e:
+            if e.status == 404:
+                return True
+            raise
+
+        annotations = secret.annotations or {}
+        if annotations.get(CREATE_BY_ANNOTATION) is None:
+            # Not managed by ClusterSecret, sync_secret decides what to do with it.
+            return False
+        read = {'metadata': {'annotations': annotations}, 'type': secret.type, 'data': secret.data}
+        return child_digest(read) != digest
+
+    def reconcile_cluster_secret(self, logger: logging.Logger, cluster_secret: BaseClusterSecret) -> bool:
+        """Corrects the discrepancies of one ClusterSecret, returns whether anything changed."""
+        # The ClusterSecret may have been deleted or updated since the sweep started.
+        cluster_secret = self.csecs_cache.get_cluster_secret(cluster_secret.uid)
+        if cluster_secret is None:
+            return False
+
+        name = cluster_secret.name
+        body = cluster_secret.body
+        try:
+            validate_patterns(body)
+        except PatternError as e:
+            # Rejected with a status condition: its children are left as they are.
+            logger.debug('Not reconciling ClusterSecret %s with rejected patterns: %s', name, e)
+            return False
+
+        expected = self.expected_namespaces(cluster_secret)
+        secret_body = create_secret_body(logger, body, self.v1)
+
+        outcomes: Counter = Counter()
+        for ns in expected:
+            if self.child_is_outdated(logger, secret_body, ns):
+                logger.debug('Reconciling secret %s in namespace %s', name, ns)
+                outcomes[sync_secret(logger, ns, body, self.v1, secret_body)] += 1
+
+        for ns in set(cluster_secret.synced_namespace).difference(expected):
+            if self.namespaces_cache.has_namespace(ns):
+                logger.debug('Reconciling: removing secret %s from namespace %s', name, ns)
+                delete_children(logger, ns, name, body, self.v1)
+                outcomes['deleted'] += 1
+            else:
+                outcomes['pruned'] += 1
+
+        changed = bool(outcomes)
+        if changed:
+            logger.info('Reconciled secret %s: %s', name, dict(outcomes))
+
+        status = child_status(expected, secret_body)
+        synced_status = body.get('status', {}).get('create_fn', {})
+        if set(expected) == set(cluster_secret.synced_namespace) and \
+                status.get('secretName') == synced_status.get('secretName'):
+            return changed
+
+        cluster_secret.synced_namespace = expected
+        if 'secretName' in status:
+            cluster_secret.body = {**body, 'status': {**body.get('status', {}), 'create_fn': status}}
+        self.csecs_cache.set_cluster_secret(cluster_secret)
+        patch_clustersecret_status(
+            logger=logger,
+            name=name,
+            new_status={'create_fn': status},
+            custom_objects_api=self.custom_objects_api,
+        )
+        return True
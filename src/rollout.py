@@ -0,0 +1,116 @@
+import contextvars
+import logging
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Sequence
+
+from kubernetes.client import CustomObjectsApi
+
+from consts import ROLLOUT_PAUSED_ANNOTATION
+from throttling import RateLimiter
+
+# Called before each wave but the first, with the index of the wave and the results so far.
+RolloutHook = Callable[[logging.Logger, int, Dict[Hashable, str]], None]
+
+
+class Rollout:
+    """Applies a change to namespaces in waves of increasing size.
+
+    ``waves`` are the cumulative fractions of the namespaces done at the end of
+    each wave, like ``[0.05, 0.25, 1]``. Within a wave, ``concurrency`` namespaces
+    are updated at once, and the API calls made through ``limiter`` are held to
+    ``qps``. Between two waves, the rollout waits ``pause`` seconds and then runs
+    the hooks, which may block to hold the rollout or raise to stop it.
+    """
+
+    def __init__(
+        self,
+        waves: Sequence[float] = (1,),
+        concurrency: int = 1,
+        qps: float = 0,
+        pause: float = 0,
+        hooks: Sequence[RolloutHook] = (),
+    ) -> None:
+        self.waves = sorted(min(max(wave, 0), 1) for wave in waves)
+        if not self.waves or self.waves[-1] < 1:
+            self.waves.append(1)
+        self.concurrency = max(concurrency, 1)
+        self.limiter = RateLimiter(qps, burst=self.concurrency)
+        self.pause = pause
+        self.hooks = list(hooks)
+
+    def split(self, namespaces: Sequence[Hashable]) -> List[List[Hashable]]:
+        """The namespaces of every wave, leaving out the empty ones"""
+        waves = []
+        start = 0
+        for fraction in self.waves:
+            # The first wave has at least one namespace, however small its fraction.
+            end = min(max(math.ceil(fraction * len(namespaces)), start + (not waves)), len(namespaces))
+            if end > start:
+                waves.append(list(namespaces[start:end]))
+                start = end
+        return waves
+
+    def run(
+        self,
+        logger: logging.Logger,
+        name: str,
+        namespaces: Sequence[Hashable],
+        apply: Callable[[Any], str],
+    ) -> Dict[Hashable, str]:
+        """Apply to every namespace, returning what apply returned for each of them
+
+        The items are usually namespace names, or any key the apply function understands.
+        """
+        results: Dict[Hashable, str] = {}
+        waves = self.split(namespaces)
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='rollout') as executor:
+            for index, wave in enumerate(waves):
+                if index:
+                    if self.pause:
+                        time.sleep(self.pause)
+                    for hook in self.hooks:
+                        hook(logger, index, results)
+
+                # Each call runs in a copy of the current context, keeping the tracing span.
+                futures = [executor.submit(contextvars.copy_context().run, apply, ns) for ns in wave]
+                results.update(zip(wave, (future.result() for future in futures)))
+                if len(waves) > 1:
+                    logger.info(
+                        'Rollout of %s: wave %s/%s done on %s namespaces: %s',
+                        name,
+                        index + 1,
+                        len(waves),
+                        len(wave),
+                        dict(Counter(results[ns] for ns in wave)),
+                    )
+        return results
+
+
+class PausedAnnotationHook:
+    """Holds the rollout while the ClusterSecret has the rollout-paused annotation set to true."""
+
+    def __init__(self, name: str, custom_objects_api: CustomObjectsApi, poll: float = 10) -> None:
+        self.name = name
+        self.custom_objects_api = custom_objects_api
+        self.poll = poll
+
+    def paused(self) -> bool:
+        cluster_secret = self.custom_objects_api.get_cluster_custom_object(
+            group='clustersecret.io',
+            version='v1',
+            plural='clustersecrets',
+            name=self.name,
+        )
+        annotations = cluster_secret.get('metadata', {}).get('annotations') or {}
+        return annotations.get(ROLLOUT_PAUSED_ANNOTATION, '').lower() == 'true'
+
+    def __call__(self, logger: logging.Logger, index: int, results: Dict[Hashable, str]):
+        if not self.paused():
+            return
+        logger.info('Rollout of %s paused before wave %s, after %s namespaces', self.name, index + 1, len(results))
+        while self.paused():
+            time.sleep(self.poll)
+        logger.info('Rollout of %s resumed', self.name)
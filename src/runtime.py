@@ -0,0 +1,79 @@
+"""
+Entry point of the operator: kopf's command line, run with a runtime profile.
+
+    RUNTIME_PROFILE=fast python /src/runtime.py run --liveness=http://0.0.0.0:8080/healthz -A /src/handlers.py
+
+The ``standard`` profile runs kopf on the asyncio event loop, with the json
+module of the standard library. The ``fast`` profile runs it on uvloop, and
+swaps in orjson for the modules decoding the watch streams of kopf and
+encoding the request bodies of the Kubernetes client. It needs an image built
+with --build-arg EXTRA_REQUIREMENTS=requirements-speedups.txt.
+"""
+import importlib
+import logging
+import sys
+from types import SimpleNamespace
+from typing import List
+
+from os_utils import get_runtime_profile
+
+PROFILES = ('standard', 'fast')
+
+# Modules reading or writing the API payloads through their global json module.
+JSON_MODULES = (
+    'kopf._cogs.clients.api',  # the lines of the watch streams
+    'kubernetes.client.rest',  # the request bodies
+    'kubernetes.client.api_client',  # the responses deserialized into models
+)
+
+logger = logging.getLogger('runtime')
+
+
+def install_uvloop() -> bool:
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning('The fast profile is selected but uvloop is not installed')
+        return False
+    import asyncio
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def install_orjson() -> bool:
+    try:
+        import orjson
+    except ImportError:
+        logger.warning('The fast profile is selected but orjson is not installed')
+        return False
+
+    codec = SimpleNamespace(
+        loads=orjson.loads,
+        # Encodes to bytes, which urllib3 sends as is.
+        dumps=lambda obj, **kwargs: orjson.dumps(obj),
+        JSONDecodeError=orjson.JSONDecodeError,
+    )
+    for name in JSON_MODULES:
+        importlib.import_module(name).json = codec
+    return True
+
+
+def apply_profile(profile: str) -> List[str]:
+    """Install the speedups of the profile, returning the ones installed"""
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown runtime profile {profile!r}, expected one of {", ".join(PROFILES)}')
+    if profile == 'standard':
+        # kopf's command line picks uvloop whenever it can be imported.
+        sys.modules['uvloop'] = None
+        return []
+    return [name for name, install in (('uvloop', install_uvloop), ('orjson', install_orjson)) if install()]
+
+
+def main():
+    apply_profile(get_runtime_profile())
+    from kopf.cli import main as kopf_main
+    return kopf_main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
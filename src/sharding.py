@@ -0,0 +1,313 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from kubernetes.client import CoordinationV1Api, V1Lease, V1LeaseSpec, V1ObjectMeta, exceptions
+from urllib3.exceptions import HTTPError
+
+SHARD_LABEL = 'clustersecret.io/shard-group'
+
+# Finalizer and annotation prefix of each shard, suffixed or prefixed by its identity.
+SHARD_FINALIZER_PREFIX = 'shards.clustersecret.io/'
+SHARD_ANNOTATION_SUFFIX = '.shards.clustersecret.io'
+
+# Finalizer of the standby replicas, never added: they must not remove the one of the leader.
+STANDBY_FINALIZER = 'standby.clustersecret.io/finalizer'
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto members, with virtual nodes.
+
+    Adding or removing a member only moves the keys of its neighbours on the ring.
+    """
+
+    def __init__(self, members: Set[str], vnodes: int = 64) -> None:
+        self.members = frozenset(members)
+        self.ring: List[int] = []
+        self.owners: Dict[int, str] = {}
+        for member in sorted(self.members):
+            for vnode in range(vnodes):
+                point = _hash(f'{member}#{vnode}')
+                self.owners[point] = member
+                bisect.insort(self.ring, point)
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.ring, _hash(key)) % len(self.ring)
+        return self.owners[self.ring[index]]
+
+
+class ShardManager:
+    """Lease-based membership of the operator replicas, splitting ClusterSecrets by UID.
+
+    Every replica renews its own Lease in the operator namespace. The live
+    members are the Leases of the group renewed within their lease duration,
+    and each ClusterSecret is owned by the member its UID hashes to. A replica
+    failing to renew its Lease owns nothing once its lease duration is over,
+    as the other replicas take its ClusterSecrets over.
+    """
+
+    def __init__(
+        self,
+        identity: str,
+        namespace: str,
+        coordination_api: CoordinationV1Api,
+        lease_duration: int = 15,
+        group: str = 'clustersecret',
+    ) -> None:
+        self.identity = identity
+        self.namespace = namespace
+        self.coordination_api = coordination_api
+        self.lease_duration = lease_duration
+        self.group = group
+        self.ring = HashRing(set())
+        self.renewed: Optional[float] = None
+
+    @property
+    def lease_name(self) -> str:
+        return f'{self.group}-shard-{self.identity}'
+
+    @property
+    def finalizer(self) -> str:
+        return f'{SHARD_FINALIZER_PREFIX}{self.identity}'
+
+    @property
+    def annotation_prefix(self) -> str:
+        return f'{self.identity}{SHARD_ANNOTATION_SUFFIX}'
+
+    def owns(self, uid: str) -> bool:
+        return self.ring.owner(uid) == self.identity
+
+    def renew(self):
+        now = datetime.now(timezone.utc)
+        lease = V1Lease(
+            metadata=V1ObjectMeta(name=self.lease_name, labels={SHARD_LABEL: self.group}),
+            spec=V1LeaseSpec(
+                holder_identity=self.identity,
+                lease_duration_seconds=self.lease_duration,
+                renew_time=now,
+            ),
+        )
+        try:
+            self.coordination_api.replace_namespaced_lease(self.lease_name, self.namespace, lease)
+        except exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+            lease.spec.acquire_time = now
+            self.coordination_api.create_namespaced_lease(self.namespace, lease)
+
+    def live_members(self) -> Set[str]:
+        now = datetime.now(timezone.utc)
+        leases = self.coordination_api.list_namespaced_lease(
+            self.namespace,
+            label_selector=f'{SHARD_LABEL}={self.group}',
+        ).items
+        members = set()
+        for lease in leases:
+            spec = lease.spec
+            if not spec.holder_identity or spec.renew_time is None:
+                continue
+            if spec.renew_time + timedelta(seconds=spec.lease_duration_seconds or self.lease_duration) > now:
+                members.add(spec.holder_identity)
+        return members
+
+    def heartbeat(self) -> Optional[HashRing]:
+        """Renew the own Lease and refresh the members.
+
+        Returns the previous ring when the membership changed, None otherwise.
+        """
+        self.renew()
+        self.renewed = time.monotonic()
+        members = self.live_members() | {self.identity}
+        if members == self.ring.members:
+            return None
+        previous, self.ring = self.ring, HashRing(members)
+        return previous
+
+    def expire(self) -> Optional[HashRing]:
+        """Own nothing if the Lease was not renewed within its duration.
+
+        Returns the previous ring when dropped, None otherwise.
+        """
+        if not self.ring.members or self.renewed is None or time.monotonic() - self.renewed < self.lease_duration:
+            return None
+        previous, self.ring = self.ring, HashRing(set())
+        return previous
+
+    def release(self):
+        try:
+            self.coordination_api.delete_namespaced_lease(self.lease_name, self.namespace)
+        except exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+
+    async def run(
+        self,
+        logger: logging.Logger,
+        on_rebalance: Callable[[HashRing], Awaitable[None]],
+    ):
+        """Heartbeat until cancelled, calling on_rebalance with the previous ring on membership changes.
+
+        A failed rebalance restores the previous ring, to be retried on the next heartbeat.
+        """
+        while True:
+            await asyncio.sleep(self.lease_duration / 3)
+            try:
+                previous = await asyncio.to_thread(self.heartbeat)
+            except (exceptions.ApiException, HTTPError, OSError) as e:
+                logger.warning('Failed to renew the shard lease %s: %s', self.lease_name, e)
+                if self.expire() is not None:
+                    logger.warning('Shard lease %s expired, owning no ClusterSecret until renewed', self.lease_name)
+                continue
+            if previous is None:
+                continue
+            logger.info('Shard members changed: %s -> %s', sorted(previous.members), sorted(self.ring.members))
+            try:
+                await on_rebalance(previous)
+            except Exception as e:
+                logger.exception('Failed to rebalance the shards, retrying on the next heartbeat: %s', e)
+                self.ring = previous
+
+
+class LeaderElector:
+    """Election of one active replica through a single Lease, the others standing by.
+
+    The Lease is taken when free or expired, and renewed by its holder. Every
+    write carries the resourceVersion read, so of two replicas taking an
+    expired Lease at once only one succeeds. A leader failing to renew steps
+    down once its lease duration is over, before any standby may take over.
+    """
+
+    def __init__(
+        self,
+        identity: str,
+        namespace: str,
+        coordination_api: CoordinationV1Api,
+        lease_duration: int = 15,
+        group: str = 'clustersecret',
+    ) -> None:
+        self.identity = identity
+        self.namespace = namespace
+        self.coordination_api = coordination_api
+        self.lease_duration = lease_duration
+        self.group = group
+        self.leading = False
+        self.holder: Optional[str] = None
+        self.renewed: Optional[float] = None
+
+    @property
+    def lease_name(self) -> str:
+        return f'{self.group}-leader'
+
+    def try_acquire(self) -> bool:
+        """Take or renew the Lease, returning whether this replica holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = self.coordination_api.read_namespaced_lease(self.lease_name, self.namespace)
+        except exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+            lease = V1Lease(
+                metadata=V1ObjectMeta(name=self.lease_name),
+                spec=V1LeaseSpec(
+                    holder_identity=self.identity,
+                    lease_duration_seconds=self.lease_duration,
+                    acquire_time=now,
+                    renew_time=now,
+                ),
+            )
+            try:
+                self.coordination_api.create_namespaced_lease(self.namespace, lease)
+            except exceptions.ApiException as e:
+                if e.status != 409:
+                    raise
+                return False
+            self.holder = self.identity
+            return True
+
+        spec = lease.spec
+        if spec.holder_identity and spec.holder_identity != self.identity and spec.renew_time is not None:
+            expiry = spec.renew_time + timedelta(seconds=spec.lease_duration_seconds or self.lease_duration)
+            if expiry > now:
+                self.holder = spec.holder_identity
+                return False
+
+        if spec.holder_identity != self.identity:
+            spec.holder_identity = self.identity
+            spec.acquire_time = now
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+        spec.lease_duration_seconds = self.lease_duration
+        spec.renew_time = now
+        try:
+            self.coordination_api.replace_namespaced_lease(self.lease_name, self.namespace, lease)
+        except exceptions.ApiException as e:
+            # Another replica wrote the Lease since it was read.
+            if e.status != 409:
+                raise
+            return False
+        self.holder = self.identity
+        return True
+
+    def heartbeat(self) -> bool:
+        """Take or renew the Lease, returning whether the leadership changed"""
+        leading = self.try_acquire()
+        if leading:
+            self.renewed = time.monotonic()
+        changed, self.leading = leading != self.leading, leading
+        return changed
+
+    def expire(self) -> bool:
+        """Step down if the Lease was not renewed within its duration, returning whether the leadership changed"""
+        if not self.leading or self.renewed is None or time.monotonic() - self.renewed < self.lease_duration:
+            return False
+        self.leading = False
+        return True
+
+    def release(self):
+        """Free the Lease if held, for a standby to take over without waiting for it to expire"""
+        if not self.leading:
+            return
+        self.leading = False
+        try:
+            lease = self.coordination_api.read_namespaced_lease(self.lease_name, self.namespace)
+            if lease.spec.holder_identity != self.identity:
+                return
+            lease.spec.holder_identity = None
+            lease.spec.renew_time = None
+            self.coordination_api.replace_namespaced_lease(self.lease_name, self.namespace, lease)
+        except exceptions.ApiException as e:
+            if e.status not in (404, 409):
+                raise
+
+    async def run(
+        self,
+        logger: logging.Logger,
+        on_started_leading: Callable[[], Awaitable[None]],
+        on_stopped_leading: Callable[[], Awaitable[None]],
+    ):
+        """Take or renew the Lease until cancelled, calling back on every change of leadership."""
+        while True:
+            await asyncio.sleep(self.lease_duration / 3)
+            try:
+                changed = await asyncio.to_thread(self.heartbeat)
+            except (exceptions.ApiException, HTTPError, OSError) as e:
+                logger.warning('Failed to renew the leader lease %s: %s', self.lease_name, e)
+                changed = self.expire()
+            if not changed:
+                continue
+            try:
+                if self.leading:
+                    await on_started_leading()
+                else:
+                    await on_stopped_leading()
+            except Exception as e:
+                logger.exception('Failed to handle the change of leadership: %s', e)
@@ -0,0 +1,176 @@
+"""
+Readiness and load shedding, from the backlog of the fan-outs.
+
+The backlog is the number of namespaces the running fan-outs still have to
+sync. Past ``shed_backlog``, the low-priority work is shed so the changes made
+by users go first: the periodic reconciliation sweeps are skipped, and the
+status patches following namespace events are deferred, the last one of each
+ClusterSecret being flushed once the backlog is back under the threshold.
+Past ``ready_backlog``, or until its caches are synced, the operator reports
+itself not ready on ``/readyz``.
+"""
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from aiohttp import web
+from kubernetes.client import exceptions
+
+from metrics import REGISTRY, Registry
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Patches the status of a ClusterSecret: called with the logger, its name and the new status.
+StatusPatch = Callable[[logging.Logger, str, Dict[str, Any]], Any]
+
+REGISTRY.describe('clustersecret_backlog', 'gauge', 'Namespaces the running fan-outs still have to sync.')
+REGISTRY.describe('clustersecret_shed_total', 'counter', 'Low-priority work shed under load, by kind of work.')
+
+
+class LoadMonitor:
+    """Backlog of the fan-outs, telling when to shed work and whether the operator is ready.
+
+    A threshold of 0 disables the shedding, or the readiness check of the backlog.
+    """
+
+    def __init__(self, shed_backlog: int = 500, ready_backlog: int = 5000, registry: Registry = REGISTRY) -> None:
+        self.shed_backlog = shed_backlog
+        self.ready_backlog = ready_backlog
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.backlog = 0
+        self.synced = False
+
+    def add(self, count: int):
+        with self.lock:
+            self.backlog += count
+            self.registry.set('clustersecret_backlog', self.backlog)
+
+    @contextmanager
+    def fan_out(self, fn: Callable[[T], R], count: int) -> Iterator[Callable[[T], R]]:
+        """Count ``count`` namespaces in the backlog, each until synced by the returned wrapper of ``fn``
+
+        Those left at the end of the fan-out, after a failure, leave the backlog as well.
+        """
+        remaining = [count]
+        self.add(count)
+
+        def tracked(item: T) -> R:
+            try:
+                return fn(item)
+            finally:
+                with self.lock:
+                    done = remaining[0] > 0
+                    remaining[0] -= done
+                if done:
+                    self.add(-1)
+
+        try:
+            yield tracked
+        finally:
+            self.add(-remaining[0])
+
+    def overloaded(self) -> bool:
+        return 0 < self.shed_backlog <= self.backlog
+
+    def shed(self, work: str) -> bool:
+        """Whether to shed a low-priority ``work``, counting it when shed"""
+        if not self.overloaded():
+            return False
+        self.registry.inc('clustersecret_shed_total', work=work)
+        return True
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        backlog_ok = self.ready_backlog <= 0 or self.backlog < self.ready_backlog
+        return self.synced and backlog_ok, {
+            'synced': self.synced,
+            'backlog': self.backlog,
+            'shedding': self.overloaded(),
+        }
+
+
+class StatusFlusher:
+    """Defers the status patches of the ClusterSecrets while overloaded, then flushes them.
+
+    Only the last deferred status of a ClusterSecret is kept. A status patched
+    right away by a handler must discard the deferred one, which is older.
+    """
+
+    def __init__(self, load: LoadMonitor, patch: StatusPatch, interval: float = 5) -> None:
+        self.load = load
+        self.patch = patch
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+
+    def defer(self, name: str, new_status: Dict[str, Any]) -> bool:
+        """Keep the status to flush later if overloaded, returning whether it was deferred"""
+        if not self.load.shed('status'):
+            self.discard(name)
+            return False
+        with self.lock:
+            self.pending[name] = new_status
+        return True
+
+    def discard(self, name: str):
+        with self.lock:
+            self.pending.pop(name, None)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the deferred status of a ClusterSecret, newer than the one of its body, if any"""
+        with self.lock:
+            return self.pending.get(name)
+
+    def flush(self, logger: logging.Logger) -> int:
+        """Patch the deferred statuses unless still overloaded, returning how many were patched"""
+        if self.load.overloaded():
+            return 0
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for name, new_status in pending.items():
+            try:
+                self.patch(logger, name, new_status)
+            except exceptions.ApiException as e:
+                if e.status != 404:
+                    logger.warning('Failed to flush the status of ClusterSecret %s: %s', name, e)
+        if pending:
+            logger.info('Flushed the deferred status of %s ClusterSecrets', len(pending))
+        return len(pending)
+
+    async def run(self, logger: logging.Logger):
+        """Flush every ``interval`` seconds, until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.pending:
+                await asyncio.to_thread(self.flush, logger)
+
+
+class ReadinessServer:
+    """Serves the readiness of the operator on /readyz, 503 when not ready."""
+
+    def __init__(self, load: LoadMonitor, port: int = 8082) -> None:
+        self.load = load
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/readyz', self.readyz)
+        return app
+
+    async def readyz(self, request: web.Request) -> web.Response:
+        ready, report = self.load.readiness()
+        return web.json_response(report, status=200 if ready else 503)
+
+    async def start(self, logger: logging.Logger):
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, port=self.port).start()
+        logger.info('Readiness listening on port %s', self.port)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,136 @@
+"""
+Raw JSON reads and writes of core resources, decoded into slim records.
+
+The API server serves any object or list as its metadata alone
+(PartialObjectMetadata) when asked through the Accept header. Together with
+skipping the model deserialization of the client, this cuts both the bytes on
+the wire and the decoding CPU of the namespace listings and of the child
+secret reads, which only look at names, labels and annotations.
+
+The responses are decoded with orjson when it is installed, and the responses
+of the secret writes, which nobody reads, are drained without being decoded.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from kubernetes.client import CoreV1Api
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+METADATA_ACCEPT = 'application/json;as=PartialObjectMetadata;g=meta.k8s.io;v=v1,application/json'
+METADATA_LIST_ACCEPT = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json'
+
+
+class NamespaceRecord(NamedTuple):
+    name: str
+    labels: Dict[str, str]
+
+
+class SecretMetadata(NamedTuple):
+    name: str
+    namespace: str
+    annotations: Optional[Dict[str, str]]
+    labels: Optional[Dict[str, str]]
+    creation_timestamp: Optional[str] = None
+
+
+class SecretRecord(NamedTuple):
+    name: str
+    namespace: str
+    annotations: Optional[Dict[str, str]]
+    data: Optional[Dict[str, str]]
+    type: str = 'Opaque'
+
+
+def namespace_records(namespace_list: Dict[str, Any]) -> List[NamespaceRecord]:
+    return [
+        NamespaceRecord(item['metadata']['name'], item['metadata'].get('labels') or {})
+        for item in namespace_list.get('items') or []
+    ]
+
+
+def secret_metadata_record(secret: Dict[str, Any]) -> SecretMetadata:
+    metadata = secret['metadata']
+    return SecretMetadata(
+        metadata['name'],
+        metadata.get('namespace'),
+        metadata.get('annotations'),
+        metadata.get('labels'),
+        metadata.get('creationTimestamp'),
+    )
+
+
+def secret_record(secret: Dict[str, Any]) -> SecretRecord:
+    metadata = secret['metadata']
+    return SecretRecord(
+        metadata['name'], metadata.get('namespace'), metadata.get('annotations'), secret.get('data'),
+        secret.get('type') or 'Opaque',
+    )
+
+
+def drain(response: Any) -> None:
+    """Read and drop a raw response, returning its connection to the pool"""
+    response.drain_conn()
+    response.release_conn()
+
+
+class SlimCoreV1Api(CoreV1Api):
+    """CoreV1Api with reads decoded straight from the JSON into records.
+
+    The writes of secrets return None: their responses are drained unread.
+    """
+
+    def get_json(self, path: str, accept: str = 'application/json', **query: Any) -> Dict[str, Any]:
+        """GET a resource or a list as JSON, raising ApiException like the generated methods"""
+        response = self.api_client.call_api(
+            path,
+            'GET',
+            query_params=[(key, value) for key, value in query.items() if value is not None],
+            header_params={'Accept': accept},
+            auth_settings=['BearerToken'],
+            _return_http_data_only=True,
+            _preload_content=False,
+        )
+        return loads(response.data)
+
+    def list_namespace_metadata(self, label_selector: Optional[str] = None) -> List[NamespaceRecord]:
+        return namespace_records(self.get_json(
+            '/api/v1/namespaces',
+            METADATA_LIST_ACCEPT,
+            labelSelector=label_selector,
+        ))
+
+    def read_namespaced_secret_metadata(self, name: str, namespace: str) -> SecretMetadata:
+        return secret_metadata_record(self.get_json(
+            f'/api/v1/namespaces/{namespace}/secrets/{name}',
+            METADATA_ACCEPT,
+        ))
+
+    def read_namespaced_secret_record(self, name: str, namespace: str) -> SecretRecord:
+        return secret_record(self.get_json(f'/api/v1/namespaces/{namespace}/secrets/{name}'))
+
+    def list_namespaced_secret_metadata(
+        self,
+        namespace: str,
+        label_selector: Optional[str] = None,
+    ) -> List[SecretMetadata]:
+        secret_list = self.get_json(
+            f'/api/v1/namespaces/{namespace}/secrets',
+            METADATA_LIST_ACCEPT,
+            labelSelector=label_selector,
+        )
+        return [secret_metadata_record(item) for item in secret_list.get('items') or []]
+
+    def create_namespaced_secret(self, namespace: str, body: Any, **kwargs: Any) -> None:
+        drain(super().create_namespaced_secret(namespace, body, _preload_content=False, **kwargs))
+
+    def replace_namespaced_secret(self, name: str, namespace: str, body: Any, **kwargs: Any) -> None:
+        drain(super().replace_namespaced_secret(name, namespace, body, _preload_content=False, **kwargs))
+
+    def patch_namespaced_secret(self, name: str, namespace: str, body: Any, **kwargs: Any) -> None:
+        drain(super().patch_namespaced_secret(name, namespace, body, _preload_content=False, **kwargs))
+
+    def delete_namespaced_secret(self, name: str, namespace: str, **kwargs: Any) -> None:
+        drain(super().delete_namespaced_secret(name, namespace, _preload_content=False, **kwargs))
@@ -0,0 +1,124 @@
+import json
+import socket
+import unittest
+from unittest.mock import Mock, patch
+
+import urllib3
+from kubernetes.client import ApiClient, ApiException, Configuration
+
+from clients import API, WATCH, LazyApi, build_api_client, collect_pools, get_api_client, pool_stats
+from metrics import Registry
+from slim_api import SlimCoreV1Api
+
+try:
+    import httpx
+
+    from http2 import Http2PoolManager
+except ImportError:
+    httpx = None
+
+
+class TestLazyApi(unittest.TestCase):
+
+    def test_built_on_first_use(self):
+        """The kube config is loaded and the client built on the first call, once.
+        """
+        api = Mock()
+        factory = Mock(return_value=api)
+        with patch("clients.load_config") as load_config, \
+                patch("clients.build_api_client") as build, \
+                patch.dict("clients.api_clients", clear=True):
+            lazy = LazyApi(factory)
+            factory.assert_not_called()
+            load_config.assert_not_called()
+
+            lazy.read_namespace("default")
+            lazy.read_namespace("kube-system")
+
+            load_config.assert_called_once_with()
+            build.assert_called_once_with(API)
+            factory.assert_called_once_with(build.return_value)
+            self.assertEqual(api.read_namespace.call_count, 2)
+            self.assertIs(get_api_client(), build.return_value)
+
+
+class TestPools(unittest.TestCase):
+
+    def build(self, name, block=True, keepalive=30):
+        with patch("clients.client.Configuration.get_default_copy", return_value=Configuration()), \
+                patch("clients.get_connection_pool_maxsize", return_value=3), \
+                patch("clients.get_connection_pool_block", return_value=block), \
+                patch("clients.get_connection_keepalive", return_value=keepalive), \
+                patch("clients.get_http2_enabled", return_value=False):
+            return build_api_client(name)
+
+    def test_pool_options(self):
+        """Only the API requests block, both pools keep their connections alive
+        """
+        api_pool = self.build(API).rest_client.pool_manager.connection_from_host("localhost", 443, "https")
+        watch_pool = self.build(WATCH).rest_client.pool_manager.connection_from_host("localhost", 443, "https")
+
+        self.assertEqual(api_pool.pool.maxsize, 3)
+        self.assertTrue(api_pool.block)
+        self.assertFalse(watch_pool.block)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), api_pool.conn_kw["socket_options"])
+
+    def test_pool_stats(self):
+        pool_manager = self.build(API, block=False).rest_client.pool_manager
+        self.assertEqual(pool_stats(pool_manager)["maxsize"], 0)
+
+        pool = pool_manager.connection_from_host("localhost", 443, "https")
+        conn = pool._get_conn()
+        self.assertEqual(pool_stats(pool_manager), {"maxsize": 3, "in_use": 1, "idle": 0, "opened": 1, "requests": 0})
+
+        pool._put_conn(conn)
+        self.assertEqual(pool_stats(pool_manager), {"maxsize": 3, "in_use": 0, "idle": 1, "opened": 1, "requests": 0})
+
+    def test_collect(self):
+        registry = Registry()
+        api_client = self.build(API)
+        api_client.rest_client.pool_manager.connection_from_host("localhost", 443, "https")
+        with patch.dict("clients.api_clients", {API: api_client}, clear=True):
+            collect_pools(registry)
+        self.assertEqual(registry.get("clustersecret_http_pool_maxsize", client=API), 3)
+        self.assertEqual(registry.get("clustersecret_http_pool_in_use", client=API), 0)
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class TestHttp2PoolManager(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        secret = {"metadata": {"name": "s", "namespace": "ns", "annotations": {}}, "data": {"k": "dg=="}}
+
+        def handle(request):
+            self.requests.append(request)
+            if request.url.path.endswith("/missing"):
+                return httpx.Response(404, json={"kind": "Status", "code": 404})
+            return httpx.Response(200, json=secret)
+
+        self.manager = Http2PoolManager(Configuration(), maxsize=2, keepalive=30)
+        self.manager.client = httpx.Client(transport=httpx.MockTransport(handle))
+        api_client = ApiClient(Configuration())
+        api_client.rest_client.pool_manager = self.manager
+        self.v1 = SlimCoreV1Api(api_client)
+
+    def test_requests(self):
+        """The client encodes the requests and raises ApiException as over urllib3
+        """
+        self.assertEqual(self.v1.read_namespaced_secret_record("s", "ns").data, {"k": "dg=="})
+        with self.assertRaises(ApiException) as e:
+            self.v1.read_namespaced_secret_record("missing", "ns")
+        self.assertEqual(e.exception.status, 404)
+        self.v1.create_namespaced_secret("ns", {"metadata": {"name": "s"}})
+        self.v1.list_namespaced_secret_metadata("ns", label_selector="a=b")
+
+        self.assertEqual(json.loads(self.requests[2].content), {"metadata": {"name": "s"}})
+        self.assertEqual(self.requests[3].url.params["labelSelector"], "a=b")
+        self.assertEqual(self.manager.stats(), {"in_use": 0, "maxsize": 2, "requests": 4})
+
+    def test_transport_error(self):
+        self.manager.client = httpx.Client(transport=httpx.MockTransport(Mock(side_effect=httpx.ConnectError("down"))))
+        with self.assertRaises(urllib3.exceptions.HTTPError):
+            self.v1.read_namespaced_secret_record("s", "ns")
+        self.assertEqual(self.manager.stats()["in_use"], 0)
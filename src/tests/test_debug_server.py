@@ -0,0 +1,90 @@
+import threading
+import time
+import tracemalloc
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from cache import MemoryCache, MemoryNamespaceCache
+from debug_server import DebugServer, sample_stacks
+from models import BaseClusterSecret
+
+
+class TestDebugServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        csecs_cache = MemoryCache()
+        csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "data": {"key": "dmFsdWU="}},
+            synced_namespace=["default", "kube-system"],
+        ))
+        namespaces_cache = MemoryNamespaceCache()
+        namespaces_cache.set_namespace("default", {})
+        self.server = DebugServer("s3cr3t", csecs_cache, namespaces_cache, max_profile_seconds=0.05)
+        self.client = TestClient(TestServer(self.server.make_app()))
+        await self.client.start_server()
+        self.headers = {"Authorization": "Bearer s3cr3t"}
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    async def test_authentication(self):
+        for headers in [{}, {"Authorization": "Bearer wrong"}]:
+            response = await self.client.get("/debug/tasks", headers=headers)
+            self.assertEqual(response.status, 401)
+
+    async def test_tasks(self):
+        response = await self.client.get("/debug/tasks", headers=self.headers)
+        self.assertEqual(response.status, 200)
+        self.assertIn("tasks", await response.text())
+
+    async def test_memory(self):
+        """tracemalloc only runs between start and stop, the cache sizes are always there.
+        """
+        response = await self.client.get("/debug/memory", headers=self.headers)
+        report = await response.json()
+        self.assertFalse(report["tracemalloc"])
+        self.assertEqual(report["caches"]["cluster_secrets"], 1)
+        self.assertEqual(report["caches"]["namespaces"], 1)
+        self.assertEqual(report["caches"]["largest"][0]["synced_namespaces"], 2)
+
+        response = await self.client.get("/debug/memory?tracemalloc=start", headers=self.headers)
+        self.assertTrue((await response.json())["tracemalloc"])
+
+        await self.client.get("/debug/memory?tracemalloc=stop", headers=self.headers)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    async def test_profile(self):
+        """The duration is capped, and a single profile runs at a time.
+        """
+        await self.server.profiling.acquire()
+        response = await self.client.get("/debug/profile?seconds=10", headers=self.headers)
+        self.assertEqual(response.status, 409)
+        self.server.profiling.release()
+
+        started = time.monotonic()
+        response = await self.client.get("/debug/profile?seconds=10", headers=self.headers)
+        self.assertEqual(response.status, 200)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class TestSampleStacks(unittest.TestCase):
+
+    def test_samples_other_threads(self):
+        stop = threading.Event()
+
+        def busy_loop():
+            while not stop.is_set():
+                pass
+
+        thread = threading.Thread(target=busy_loop)
+        thread.start()
+        try:
+            stacks = sample_stacks(0.05, interval=0.005)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertTrue(any("busy_loop" in stack for stack in stacks))
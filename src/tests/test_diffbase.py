@@ -0,0 +1,49 @@
+import json
+import unittest
+
+import kopf
+
+from diffbase import DigestDiffBaseStorage, value_digest
+from kubernetes_utils import create_data_patch
+
+
+class TestDigestDiffBaseStorage(unittest.TestCase):
+
+    def body(self, data):
+        return kopf.Body({
+            "apiVersion": "clustersecret.io/v1",
+            "kind": "ClusterSecret",
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "matchNamespace": ["team-*"],
+            "data": data,
+        })
+
+    def test_build(self):
+        """The data values must be stored as digests, the patterns as they are.
+        """
+        bundle = "Y2VydA==" * 10000
+        essence = DigestDiffBaseStorage().build(body=self.body({"tls.crt": bundle, "tls.key": "a2V5"}))
+
+        self.assertEqual(essence["matchNamespace"], ["team-*"])
+        self.assertEqual(essence["data"], {"tls.crt": value_digest(bundle), "tls.key": value_digest("a2V5")})
+        self.assertLess(len(json.dumps(essence)), 500)
+
+    def test_build_value_from(self):
+        data = {"valueFrom": {"secretKeyRef": {"name": "source", "namespace": "default"}}}
+        essence = DigestDiffBaseStorage().build(body=self.body(data))
+        self.assertEqual(list(essence["data"].keys()), ["valueFrom"])
+
+    def test_delta_from_digests(self):
+        """The per-key delta must work on the digested old and new data.
+        """
+        storage = DigestDiffBaseStorage()
+        old_data = {"key": "oldvalue", "unchanged": "value", "removed": "value"}
+        new_data = {"key": "newvalue", "unchanged": "value", "added": "value"}
+
+        patch = create_data_patch(
+            storage.build(body=self.body(old_data))["data"],
+            storage.build(body=self.body(new_data))["data"],
+            new_data,
+        )
+
+        self.assertEqual(patch["data"], {"key": "newvalue", "added": "value", "removed": None})
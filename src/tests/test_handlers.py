@@ -3,12 +3,19 @@ import kopf
 import logging
 import unittest
 
-from kubernetes.client import V1ObjectMeta, V1Secret, ApiException
-from unittest.mock import ANY, Mock, patch
-
-from handlers import create_fn, custom_objects_api, csecs_cache, namespace_watcher, on_field_data, startup_fn
-from kubernetes_utils import create_secret_metadata
+from kubernetes.client import V1ObjectMeta, ApiException
+from unittest.mock import ANY, AsyncMock, Mock, patch
+
+import handlers
+from consts import ALIAS_LABEL, CREATE_BY_ANNOTATION
+from handlers import configure_fn, create_fn, custom_objects_api, csecs_cache, namespace_delete_watcher, namespace_labels_watcher, \
+    namespace_watcher, namespaces_cache, on_field_data, on_namespace_event, on_secret_event, source_digests, startup_fn, \
+    children_cache, on_child_secret_event, on_cluster_secret_event, on_field_immutable
+from diffbase import DigestDiffBaseStorage, ReadOnlyDiffBaseStorage, ReadOnlyProgressStorage
 from models import BaseClusterSecret
+from sharding import STANDBY_FINALIZER
+from kubernetes_utils import versioned_name
+from slim_api import NamespaceRecord, SecretMetadata
 
 
 class TestClusterSecretHandler(unittest.TestCase):
@@ -17,6 +24,8 @@ class TestClusterSecretHandler(unittest.TestCase):
         self.logger = logging.getLogger(__name__)
         for cluster_secret in csecs_cache.all_cluster_secret():
             csecs_cache.remove_cluster_secret(cluster_secret.uid)
+        for namespace in namespaces_cache.all_namespaces():
+            namespaces_cache.remove_namespace(namespace)
 
     def test_on_field_data_cache(self):
         """New data should be written into the cache.
@@ -39,7 +48,6 @@ class TestClusterSecretHandler(unittest.TestCase):
             old={"key": "oldvalue"},
             new={"key": "newvalue"},
             body=new_body,
-            meta=kopf.Meta({"metadata": {"name": "mysecret"}}),
             name="mysecret",
             uid="mysecretuid",
             logger=self.logger,
@@ -53,33 +61,21 @@ class TestClusterSecretHandler(unittest.TestCase):
         )
 
     def test_on_field_data_sync(self):
-        """Must sync secret data changes to the namespaces.
+        """Must sync only the changed data keys to the namespaces, with a shared patch body.
         """
 
         mock_v1 = Mock()
 
-        # Old data in the namespaced secret of the myns namespace.
-        mock_v1.read_namespaced_secret.return_value = V1Secret(
-            api_version='v1',
-            data={"key": "oldvalue"},
-            kind='Secret',
-            metadata=create_secret_metadata(
-                name="mysecret",
-                namespace="myns",
-            ),
-            type="Opaque",
-        )
-
         # Old data in the cache.
         csec = BaseClusterSecret(
             uid="mysecretuid",
             name="mysecret",
             body={
                 "metadata": {"name": "mysecret", "uid": "mysecretuid"},
-                "data": {"key": "oldvalue"},
-                "status": {"create_fn": {"syncedns": ["myns"]}},
+                "data": {"key": "oldvalue", "unchanged": "value", "removed": "value"},
+                "status": {"create_fn": {"syncedns": ["myns", "myns2"]}},
             },
-            synced_namespace=["myns"],
+            synced_namespace=["myns", "myns2"],
         )
 
         csecs_cache.set_cluster_secret(csec)
@@ -87,104 +83,91 @@ class TestClusterSecretHandler(unittest.TestCase):
         # New data coming into the callback.
         new_body = {
             "metadata": {"name": "mysecret", "uid": "mysecretuid"},
-            "data": {"key": "newvalue"},
-            "status": {"create_fn": {"syncedns": ["myns"]}},
+            "data": {"key": "newvalue", "unchanged": "value", "added": "value"},
+            "status": {"create_fn": {"syncedns": ["myns", "myns2"]}},
         }
 
         with patch("handlers.v1", mock_v1):
             on_field_data(
-                old={"key": "oldvalue"},
-                new={"key": "newvalue"},
+                old={"key": "oldvalue", "unchanged": "value", "removed": "value"},
+                new={"key": "newvalue", "unchanged": "value", "added": "value"},
                 body=new_body,
-                meta=kopf.Meta({"metadata": {"name": "mysecret"}}),
                 name="mysecret",
                 uid="mysecretuid",
                 logger=self.logger,
                 reason="update",
             )
 
-        # Namespaced secret should be updated.
-        mock_v1.replace_namespaced_secret.assert_called_once_with(
-            name=csec.name,
-            namespace="myns",
-            body=ANY,
+        # Namespaced secrets should be patched, not read nor replaced.
+        mock_v1.read_namespaced_secret_record.assert_not_called()
+        mock_v1.replace_namespaced_secret.assert_not_called()
+        self.assertCountEqual(
+            [call.kwargs.get("namespace") for call in mock_v1.patch_namespaced_secret.call_args_list],
+            ["myns", "myns2"],
         )
 
-        # Namespaced secret should be updated with the new data.
+        # Only the delta is sent, and the same body is shared by all the namespaces.
+        bodies = [call.kwargs.get("body") for call in mock_v1.patch_namespaced_secret.call_args_list]
+        self.assertIs(bodies[0], bodies[1])
         self.assertEqual(
-            mock_v1.replace_namespaced_secret.call_args.kwargs.get("body").data,
-            {"key": "newvalue"},
+            bodies[0].get("data"),
+            {"key": "newvalue", "added": "value", "removed": None},
         )
 
-    def test_on_field_data_ns_deleted(self):
-        """Don't fail the sync if one of the namespaces was deleted.
+    def test_on_field_data_deferred_status(self):
+        """Must sync to the namespaces of a deferred status, newer than the one of the body.
         """
 
         mock_v1 = Mock()
 
-        def read_namespaced_secret(name, namespace, **kwargs):
-            if namespace == "myns2":
-                # Old data in the namespaced secret of the myns namespace.
-                return V1Secret(
-                    api_version='v1',
-                    data={"key": "oldvalue"},
-                    kind='Secret',
-                    metadata=create_secret_metadata(
-                        name="mysecret",
-                        namespace="myns2",
-                    ),
-                    type="Opaque",
-                )
-            else:
-                # Deleted namespace.
-                raise ApiException(status=404, reason="Not Found")
-
-        mock_v1.read_namespaced_secret = read_namespaced_secret
-
-        create_namespaced_secret_called_count_for_ns2 = 0
+        csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret", "uid": "mysecretuid"}, "data": {"key": "oldvalue"}},
+            synced_namespace=["myns", "myns2"],
+        ))
 
-        def create_namespaced_secret(namespace, body, **kwargs):
-            if namespace == "myns2":
-                nonlocal create_namespaced_secret_called_count_for_ns2
-                create_namespaced_secret_called_count_for_ns2 += 1
-            else:
-                # Deleted namespace.
-                raise ApiException(status=404, reason="Not Found")
+        # The namespace handler synced myns2, but the status patch was deferred.
+        new_body = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "data": {"key": "newvalue"},
+            "status": {"create_fn": {"syncedns": ["myns"]}},
+        }
+        pending = {"mysecret": {"create_fn": {"syncedns": ["myns", "myns2"]}}}
 
-        mock_v1.create_namespaced_secret = create_namespaced_secret
+        with patch("handlers.v1", mock_v1), patch.dict(handlers.status_flusher.pending, pending):
+            on_field_data(
+                old={"key": "oldvalue"},
+                new={"key": "newvalue"},
+                body=new_body,
+                name="mysecret",
+                uid="mysecretuid",
+                logger=self.logger,
+                reason="update",
+            )
 
-        replace_namespaced_secret_called_count_for_ns2 = 0
+        self.assertCountEqual(
+            [call.kwargs.get("namespace") for call in mock_v1.patch_namespaced_secret.call_args_list],
+            ["myns", "myns2"],
+        )
 
-        def replace_namespaced_secret(name, namespace, body, **kwargs):
-            if namespace == "myns2":
-                nonlocal replace_namespaced_secret_called_count_for_ns2
-                replace_namespaced_secret_called_count_for_ns2 += 1
-                self.assertEqual(name, csec.name)
+    def test_on_field_data_ns_deleted(self):
+        """Don't fail the sync if one of the namespaces was deleted.
+        """
 
-                # Namespaced secret should be updated with the new data.
-                self.assertEqual(
-                    body.data,
-                    {"key": "newvalue"},
-                )
+        mock_v1 = Mock()
 
-                return V1Secret(
-                    api_version='v1',
-                    data=body.data,
-                    kind='Secret',
-                    metadata=create_secret_metadata(
-                        name="mysecret",
-                        namespace="myns2",
-                    ),
-                    type="Opaque",
-                )
-            else:
+        def patch_namespaced_secret(name, namespace, body, **kwargs):
+            if namespace == "myns1":
                 # Deleted namespace.
                 raise ApiException(status=404, reason="Not Found")
+            self.assertEqual(name, csec.name)
+            self.assertEqual(body.get("data"), {"key": "newvalue"})
 
-        mock_v1.replace_namespaced_secret = replace_namespaced_secret
+        mock_v1.patch_namespaced_secret = Mock(side_effect=patch_namespaced_secret)
 
         def read_namespace(name, **kwargs):
-            if name != "myns2":
+            if name == "myns1":
                 # Deleted namespace.
                 raise ApiException(status=404, reason="Not Found")
 
@@ -219,21 +202,21 @@ class TestClusterSecretHandler(unittest.TestCase):
         }
 
         with patch("handlers.v1", mock_v1), \
-             patch("handlers.patch_clustersecret_status", patch_clustersecret_status):
+             patch("handlers.patch_clustersecret_status", patch_clustersecret_status), \
+             patch("handlers.sync_secret") as sync_secret:
             on_field_data(
                 old={"key": "oldvalue"},
                 new={"key": "newvalue"},
                 body=new_body,
-                meta=kopf.Meta({"metadata": {"name": "mysecret"}}),
                 name="mysecret",
                 uid="mysecretuid",
                 logger=self.logger,
                 reason="update",
             )
 
-        # Namespaced secret should be updated with the new data.
-        self.assertEqual(replace_namespaced_secret_called_count_for_ns2, 1)
-        self.assertEqual(create_namespaced_secret_called_count_for_ns2, 0)
+        # Namespaced secret should be updated with the new data, nothing re-created.
+        self.assertEqual(mock_v1.patch_namespaced_secret.call_count, 2)
+        sync_secret.assert_not_called()
 
         # The namespace should be deleted from the syncedns status of the clustersecret.
         patch_clustersecret_status.assert_called_once_with(
@@ -253,6 +236,68 @@ class TestClusterSecretHandler(unittest.TestCase):
             ["myns2"],
         )
 
+    def test_on_field_immutable_on(self):
+        """Turning immutable on must sync the versioned children, delete the mutable ones, and record the version.
+        """
+
+        mock_v1 = Mock()
+        mock_v1.read_namespaced_secret_metadata.side_effect = lambda name, namespace: SecretMetadata(
+            name, namespace, {CREATE_BY_ANNOTATION: "ClusterSecrets"}, None,
+        )
+        body = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "immutable": True,
+            "data": {"key": "value"},
+            "status": {"create_fn": {"syncedns": ["myns", "myns2"]}},
+        }
+        version = versioned_name("mysecret", {"key": "value"})
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.sync_secret", return_value="created") as sync_secret, \
+             patch("handlers.patch_clustersecret_status", return_value=body) as patch_clustersecret_status:
+            on_field_immutable(
+                old=None, new=True, body=body, name="mysecret", uid="mysecretuid", logger=self.logger, reason="update",
+            )
+
+        self.assertEqual([call.args[4]["metadata"]["name"] for call in sync_secret.call_args_list], [version] * 2)
+        self.assertCountEqual(
+            [call.args for call in mock_v1.delete_namespaced_secret.call_args_list],
+            [("mysecret", "myns"), ("mysecret", "myns2")],
+        )
+        mock_v1.list_namespaced_secret_metadata.assert_not_called()
+        self.assertEqual(
+            patch_clustersecret_status.call_args.kwargs["new_status"],
+            {"create_fn": {"syncedns": ["myns", "myns2"], "secretName": version}},
+        )
+
+    def test_on_field_immutable_off(self):
+        """Turning immutable off must sync the mutable children, delete all the versions, and clear the version.
+        """
+
+        mock_v1 = Mock()
+        mock_v1.list_namespaced_secret_metadata.side_effect = lambda namespace, label_selector: [
+            SecretMetadata(name, namespace, None, {ALIAS_LABEL: "mysecret"}) for name in ["mysecret", "mysecret-v1"]
+        ]
+        body = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "data": {"key": "value"},
+            "status": {"create_fn": {"syncedns": ["myns"], "secretName": "mysecret-v1"}},
+        }
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.sync_secret", return_value="created") as sync_secret, \
+             patch("handlers.patch_clustersecret_status", return_value=body) as patch_clustersecret_status:
+            on_field_immutable(
+                old=True, new=False, body=body, name="mysecret", uid="mysecretuid", logger=self.logger, reason="update",
+            )
+
+        self.assertEqual(sync_secret.call_args.args[4]["metadata"]["name"], "mysecret")
+        mock_v1.delete_namespaced_secret.assert_called_once_with("mysecret-v1", "myns")
+        self.assertEqual(
+            patch_clustersecret_status.call_args.kwargs["new_status"],
+            {"create_fn": {"syncedns": ["myns"], "secretName": None}},
+        )
+
     def test_create_fn(self):
         """Namespace name must be correct in the cache.
         """
@@ -268,10 +313,10 @@ class TestClusterSecretHandler(unittest.TestCase):
         }
 
         # Define the predefined list of namespaces you want to use in the test
-        predefined_nss = [Mock(metadata=V1ObjectMeta(name=ns)) for ns in ["default", "myns"]]
+        predefined_nss = [NamespaceRecord(ns, {}) for ns in ["default", "myns"]]
 
-        # Configure the mock's behavior to return the predefined namespaces when list_namespace is called
-        mock_v1.list_namespace.return_value.items = predefined_nss
+        # Configure the mock's behavior to return the predefined namespaces when list_namespace_metadata is called
+        mock_v1.list_namespace_metadata.return_value = predefined_nss
 
         with patch("handlers.v1", mock_v1), \
              patch("handlers.sync_secret"):
@@ -290,6 +335,221 @@ class TestClusterSecretHandler(unittest.TestCase):
             ["default", "myns"],
         )
 
+    def test_create_fn_up_to_date(self):
+        """Only the missing or outdated child secrets must be synced, once the child secrets are watched.
+        """
+
+        mock_v1 = Mock()
+        mock_v1.list_namespace_metadata.return_value = [NamespaceRecord(ns, {}) for ns in ["default", "myns", "other"]]
+
+        body = {
+            "metadata": {
+                "name": "mysecret",
+                "uid": "mysecretuid"
+            },
+            "data": {"key": "value"}
+        }
+
+        children_informer = Mock()
+        children_informer.synced.is_set.return_value = True
+        child = {
+            "metadata": {"namespace": "default", "name": "mysecret", "annotations": {CREATE_BY_ANNOTATION: "ClusterSecrets"}},
+            "type": "Opaque",
+            "data": {"key": "value"},
+        }
+        on_child_secret_event(None, child)
+        on_child_secret_event(None, {**child, "metadata": {**child["metadata"], "namespace": "myns"}, "data": {"key": "old"}})
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.children_informer", children_informer), \
+             patch("handlers.sync_secret", return_value="replaced") as sync_secret:
+            asyncio.run(
+                create_fn(
+                    logger=self.logger,
+                    uid="mysecretuid",
+                    name="mysecret",
+                    body=body,
+                )
+            )
+
+        self.assertEqual(sorted(call.args[1] for call in sync_secret.call_args_list), ["myns", "other"])
+        self.assertEqual(
+            csecs_cache.get_cluster_secret("mysecretuid").synced_namespace,
+            ["default", "myns", "other"],
+        )
+
+        on_child_secret_event("DELETED", child)
+        self.assertIsNone(children_cache.get_digest("default", "mysecret"))
+
+    def test_cluster_secret_event_standby(self):
+        """A standby replica must cache the ClusterSecrets from their watch, without handling them.
+        """
+
+        leader = Mock(leading=False)
+        body = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "status": {"create_fn": {"syncedns": ["default"]}},
+        }
+
+        with patch("handlers.leader", leader):
+            self.assertFalse(handlers.owned("mysecretuid"))
+            asyncio.run(on_cluster_secret_event(self.logger, None, body))
+            self.assertEqual(csecs_cache.get_cluster_secret("mysecretuid").synced_namespace, ["default"])
+
+            # Replayed by a relist, with the name only.
+            asyncio.run(on_cluster_secret_event(self.logger, "DELETED", {"metadata": {"name": "mysecret"}}))
+            self.assertIsNone(csecs_cache.get_cluster_secret("mysecretuid"))
+
+            # The leader's handlers keep the cache.
+            leader.leading = True
+            asyncio.run(on_cluster_secret_event(self.logger, "ADDED", body))
+            self.assertIsNone(csecs_cache.get_cluster_secret("mysecretuid"))
+
+    def test_rebalance_takes_over(self):
+        """A ClusterSecret moved to this replica must be converged right away, not left to a kopf event.
+        """
+
+        mock_v1 = Mock()
+        mock_v1.list_namespace_metadata.return_value = [NamespaceRecord(ns, {}) for ns in ["default", "myns"]]
+        item = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "data": {"key": "value"},
+            "status": {"create_fn": {"syncedns": ["default", "gone-from-match"]}},
+        }
+        shards = Mock(identity="pod-a", ring=Mock(members={"pod-a"}))
+        shards.owns.return_value = True
+        previous = Mock()
+        previous.owner.return_value = "pod-b"
+        patch_clustersecret_status = Mock()
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.shards", shards), \
+             patch("handlers.get_custom_objects_by_kind", return_value=[item]), \
+             patch("handlers.patch_clustersecret_status", patch_clustersecret_status), \
+             patch("handlers.delete_children") as delete_children, \
+             patch("handlers.sync_secret", return_value="created") as sync_secret:
+            asyncio.run(handlers.rebalance_fn(previous))
+
+        self.assertEqual(sorted(call.args[1] for call in sync_secret.call_args_list), ["default", "myns"])
+        delete_children.assert_called_once_with(ANY, "gone-from-match", "mysecret", item, mock_v1)
+        patch_clustersecret_status.assert_called_once_with(
+            logger=ANY,
+            name="mysecret",
+            new_status={"create_fn": {"syncedns": ["default", "myns"]}},
+            custom_objects_api=ANY,
+        )
+        self.assertEqual(csecs_cache.get_cluster_secret("mysecretuid").synced_namespace, ["default", "myns"])
+
+    def test_rebalance_gone_replicas(self):
+        """The finalizers and kopf annotations of the replicas gone must be removed, not those of the live ones.
+        """
+
+        item = {
+            "metadata": {
+                "name": "mysecret",
+                "uid": "mysecretuid",
+                "finalizers": ["shards.clustersecret.io/pod-a", "shards.clustersecret.io/pod-gone"],
+                "annotations": {
+                    "pod-a.shards.clustersecret.io/last-handled-configuration": "{}",
+                    "pod-gone.shards.clustersecret.io/last-handled-configuration": "{}",
+                    "pod-gone.shards.clustersecret.io/create_fn": "{}",
+                    "team": "a",
+                },
+            },
+            "data": {"key": "value"},
+        }
+        shards = Mock(identity="pod-a", ring=Mock(members={"pod-a"}))
+        shards.owns.return_value = True
+        previous = Mock()
+        previous.owner.return_value = "pod-a"
+        mock_custom_objects_api = Mock()
+
+        with patch("handlers.shards", shards), \
+             patch("handlers.custom_objects_api", mock_custom_objects_api), \
+             patch("handlers.get_custom_objects_by_kind", return_value=[item]), \
+             patch("handlers.take_over") as take_over:
+            asyncio.run(handlers.rebalance_fn(previous))
+
+        take_over.assert_not_called()
+        mock_custom_objects_api.patch_cluster_custom_object.assert_called_once_with(
+            group="clustersecret.io",
+            version="v1",
+            plural="clustersecrets",
+            name="mysecret",
+            body={"metadata": {
+                "finalizers": ["shards.clustersecret.io/pod-a"],
+                "annotations": {
+                    "pod-gone.shards.clustersecret.io/last-handled-configuration": None,
+                    "pod-gone.shards.clustersecret.io/create_fn": None,
+                },
+            }},
+        )
+
+    def test_standby_takeover(self):
+        """A standby replica must never store kopf state, and converge every ClusterSecret on taking over.
+        """
+
+        settings = kopf.OperatorSettings()
+        finalizer = settings.persistence.finalizer
+        leader = Mock(identity="pod-a", leading=False)
+        leader.run = AsyncMock()
+        body = {"metadata": {"name": "mysecret", "uid": "mysecretuid"}, "data": {"key": "value"}}
+        csecs_cache.set_cluster_secret(BaseClusterSecret(uid="mysecretuid", name="mysecret", body=body, synced_namespace=[]))
+
+        async def configure_then_take_over():
+            await configure_fn(logger=self.logger, settings=settings)
+            self.assertEqual(settings.persistence.finalizer, STANDBY_FINALIZER)
+            self.assertIsInstance(settings.persistence.diffbase_storage, ReadOnlyDiffBaseStorage)
+            self.assertIsInstance(settings.persistence.progress_storage, ReadOnlyProgressStorage)
+
+            leader.leading = True
+            await handlers.takeover_fn()
+
+        with patch("handlers.get_kopf_settings", return_value={}), \
+             patch("handlers.get_sharding_enabled", return_value=False), \
+             patch("handlers.get_standby_enabled", return_value=True), \
+             patch("handlers.LeaderElector", return_value=leader), \
+             patch("handlers.leader", None), \
+             patch("handlers.leader_task", None), \
+             patch("handlers.take_over") as take_over:
+            asyncio.run(configure_then_take_over())
+
+        self.assertEqual(settings.persistence.finalizer, finalizer)
+        self.assertIsInstance(settings.persistence.diffbase_storage, DigestDiffBaseStorage)
+        self.assertNotIsInstance(settings.persistence.diffbase_storage, ReadOnlyDiffBaseStorage)
+        take_over.assert_called_once_with(ANY, body)
+
+    def test_create_fn_rejected_pattern(self):
+        """A dangerous pattern must be rejected with a status condition, without listing namespaces.
+        """
+
+        mock_v1 = Mock()
+        patch_clustersecret_status = Mock()
+
+        body = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "matchNamespace": ["(a+)+$"],
+            "data": {"key": "value"},
+        }
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.patch_clustersecret_status", patch_clustersecret_status), \
+             self.assertRaises(kopf.PermanentError):
+            asyncio.run(
+                create_fn(
+                    logger=self.logger,
+                    uid="mysecretuid",
+                    name="mysecret",
+                    body=body,
+                )
+            )
+
+        mock_v1.list_namespace_metadata.assert_not_called()
+        condition = patch_clustersecret_status.call_args.kwargs["new_status"]["conditions"][0]
+        self.assertEqual(condition["type"], "PatternsValid")
+        self.assertEqual(condition["status"], "False")
+        self.assertIsNone(csecs_cache.get_cluster_secret("mysecretuid"))
+
     def test_ns_create(self):
         """A new namespace must get the cluster secrets.
         """
@@ -297,10 +557,10 @@ class TestClusterSecretHandler(unittest.TestCase):
         mock_v1 = Mock()
 
         # Define the predefined list of namespaces you want to use in the test
-        predefined_nss = [Mock(metadata=V1ObjectMeta(name=ns)) for ns in ["default", "myns"]]
+        predefined_nss = [NamespaceRecord(ns, {}) for ns in ["default", "myns"]]
 
-        # Configure the mock's behavior to return the predefined namespaces when list_namespace is called
-        mock_v1.list_namespace.return_value.items = predefined_nss
+        # Configure the mock's behavior to return the predefined namespaces when list_namespace_metadata is called
+        mock_v1.list_namespace_metadata.return_value = predefined_nss
 
         patch_clustersecret_status = Mock()
 
@@ -343,6 +603,241 @@ class TestClusterSecretHandler(unittest.TestCase):
             ["default", "myns"],
         )
 
+    def test_ns_delete(self):
+        """A deleted namespace must be pruned only from the ClusterSecrets synced into it.
+        """
+
+        patch_clustersecret_status = Mock()
+
+        csec = BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "data": "mydata"},
+            synced_namespace=["default", "myns"],
+        )
+        other_csec = BaseClusterSecret(
+            uid="othersecretuid",
+            name="othersecret",
+            body={"metadata": {"name": "othersecret"}, "data": "mydata"},
+            synced_namespace=["default"],
+        )
+
+        csecs_cache.set_cluster_secret(csec)
+        csecs_cache.set_cluster_secret(other_csec)
+
+        with patch("handlers.patch_clustersecret_status", patch_clustersecret_status):
+            asyncio.run(
+                namespace_delete_watcher(
+                    logger=self.logger,
+                    meta=kopf.Meta({"metadata": {"name": "myns"}}),
+                )
+            )
+
+        # Only the ClusterSecret synced into the namespace gets a status write.
+        patch_clustersecret_status.assert_called_once_with(
+            logger=self.logger,
+            name=csec.name,
+            new_status={'create_fn': {'syncedns': ["default"]}},
+            custom_objects_api=custom_objects_api,
+        )
+
+        self.assertEqual(csecs_cache.get_cluster_secret("mysecretuid").synced_namespace, ["default"])
+        self.assertEqual(csecs_cache.get_cluster_secrets_by_namespace("myns"), [])
+
+    def test_ns_labels_change(self):
+        """Relabeling a namespace must add or remove only the secrets selected by labels.
+        """
+
+        mock_v1 = Mock()
+        patch_clustersecret_status = Mock()
+
+        selected_csec = BaseClusterSecret(
+            uid="selecteduid",
+            name="selected",
+            body={"metadata": {"name": "selected"}, "data": "mydata",
+                  "namespaceSelector": {"matchLabels": {"team": "a"}}},
+            synced_namespace=[],
+        )
+        unselected_csec = BaseClusterSecret(
+            uid="unselecteduid",
+            name="unselected",
+            body={"metadata": {"name": "unselected"}, "data": "mydata",
+                  "namespaceSelector": {"matchLabels": {"team": "b"}}},
+            synced_namespace=["myns"],
+        )
+        pattern_csec = BaseClusterSecret(
+            uid="patternuid",
+            name="pattern",
+            body={"metadata": {"name": "pattern"}, "data": "mydata"},
+            synced_namespace=["myns"],
+        )
+
+        for csec in [selected_csec, unselected_csec, pattern_csec]:
+            csecs_cache.set_cluster_secret(csec)
+        namespaces_cache.set_namespace("myns", {"team": "b"})
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.patch_clustersecret_status", patch_clustersecret_status):
+            asyncio.run(
+                namespace_labels_watcher(
+                    logger=self.logger,
+                    event={"type": "MODIFIED"},
+                    meta=kopf.Meta({"metadata": {"name": "myns", "labels": {"team": "a"}}}),
+                )
+            )
+
+        # No re-listing of the namespaces.
+        mock_v1.list_namespace_metadata.assert_not_called()
+
+        mock_v1.replace_namespaced_secret.assert_called_once_with(name="selected", namespace="myns", body=ANY)
+        mock_v1.delete_namespaced_secret.assert_called_once_with("unselected", "myns")
+        self.assertEqual(patch_clustersecret_status.call_count, 2)
+
+        self.assertEqual(csecs_cache.get_cluster_secret("selecteduid").synced_namespace, ["myns"])
+        self.assertEqual(csecs_cache.get_cluster_secret("unselecteduid").synced_namespace, [])
+        self.assertEqual(csecs_cache.get_cluster_secret("patternuid").synced_namespace, ["myns"])
+        self.assertEqual(namespaces_cache.select({"matchLabels": {"team": "a"}}), {"myns"})
+
+    def test_namespace_left_selector(self):
+        """A namespace leaving the label selector of the watch is unsynced, a deleted one only pruned.
+        """
+        mock_v1 = Mock()
+        patch_clustersecret_status = Mock()
+
+        for ns in ["myns", "gonens"]:
+            csecs_cache.set_cluster_secret(BaseClusterSecret(
+                uid=f"{ns}uid",
+                name=ns,
+                body={"metadata": {"name": ns}, "data": "mydata",
+                      "namespaceSelector": {"matchLabels": {"team": "a"}}},
+                synced_namespace=[ns],
+            ))
+            namespaces_cache.set_namespace(ns, {"team": "a"})
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.patch_clustersecret_status", patch_clustersecret_status):
+            asyncio.run(on_namespace_event(
+                self.logger, "DELETED", {"metadata": {"name": "myns", "labels": {"team": "b"}}},
+            ))
+            asyncio.run(on_namespace_event(
+                self.logger, "DELETED", {"metadata": {"name": "gonens", "deletionTimestamp": "2024-01-01T00:00:00Z"}},
+            ))
+
+        mock_v1.delete_namespaced_secret.assert_called_once_with("myns", "myns")
+        self.assertEqual(csecs_cache.get_cluster_secret("mynsuid").synced_namespace, [])
+        self.assertEqual(csecs_cache.get_cluster_secret("gonensuid").synced_namespace, [])
+        self.assertEqual(list(namespaces_cache.all_namespaces()), [])
+
+    def test_namespace_left_selector_kept(self):
+        """A namespace leaving the watch selector stays synced, unless a relisted deletion is a real one.
+        """
+        mock_v1 = Mock()
+
+        csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "data": "mydata", "matchNamespace": ["myns", "gonens"]},
+            synced_namespace=["myns", "gonens"],
+        ))
+        for ns in ["myns", "gonens"]:
+            namespaces_cache.set_namespace(ns, {"team": "a"})
+
+        def read_namespace(name):
+            if name != "myns":
+                raise ApiException(status=404, reason="Not Found")
+
+        mock_v1.read_namespace.side_effect = read_namespace
+
+        with patch("handlers.v1", mock_v1), patch("handlers.patch_clustersecret_status"):
+            asyncio.run(on_namespace_event(self.logger, "DELETED", {"metadata": {"name": "myns"}}))
+            asyncio.run(on_namespace_event(self.logger, "DELETED", {"metadata": {"name": "gonens"}}))
+
+        mock_v1.delete_namespaced_secret.assert_not_called()
+        self.assertEqual(csecs_cache.get_cluster_secret("mysecretuid").synced_namespace, ["myns"])
+
+    def test_source_change(self):
+        """A source change is read once and pushed to every dependent, projected by its keys.
+        """
+
+        def dependent(uid, keys, synced_namespace):
+            return BaseClusterSecret(
+                uid=uid,
+                name=uid,
+                body={"metadata": {"name": uid}, "data": {"valueFrom": {"secretKeyRef": {
+                    "namespace": "source-ns", "name": "source", "keys": keys,
+                }}}},
+                synced_namespace=synced_namespace,
+            )
+
+        csecs_cache.set_cluster_secret(dependent("first", ["a"], ["ns1", "ns2"]))
+        csecs_cache.set_cluster_secret(dependent("second", ["b"], ["ns1"]))
+        source_digests.clear()
+
+        mock_v1 = Mock()
+        mock_v1.read_namespaced_secret_record.side_effect = [
+            Mock(data={"a": "b2xk", "b": "b2xk"}),
+            Mock(data={"a": "b2xk", "b": "b2xk"}),
+            Mock(data={"a": "YQ==", "b": "Yg=="}),
+            Mock(data={"a": "YQ==", "b": "Yg=="}),
+        ]
+        mock_sync_secret = Mock(return_value="replaced")
+        source = {"metadata": {"name": "source", "namespace": "source-ns"}}
+
+        async def events():
+            # The sync at start is left to the resume handlers, only the digest of the listed
+            # source is recorded. Then an update leaving the data unchanged is ignored, a change
+            # is pushed, and an update leaving the data unchanged is ignored again.
+            for event_type in [None, "MODIFIED", "MODIFIED", "MODIFIED"]:
+                pushed = on_secret_event(self.logger, event_type, source)
+                if pushed is not None:
+                    await pushed
+
+        with patch("handlers.v1", mock_v1), patch("handlers.sync_secret", mock_sync_secret):
+            asyncio.run(events())
+
+        self.assertEqual(mock_v1.read_namespaced_secret_record.call_count, 4)
+        synced = sorted(
+            (call.args[1], call.args[2]["metadata"]["name"], call.args[4]["data"])
+            for call in mock_sync_secret.call_args_list
+        )
+        self.assertEqual(synced, [
+            ("ns1", "first", {"a": "YQ=="}),
+            ("ns1", "second", {"b": "Yg=="}),
+            ("ns2", "first", {"a": "YQ=="}),
+        ])
+
+    def test_source_change_immutable(self):
+        """An immutable dependent of a changed source gets the name of its new version in its status.
+        """
+
+        body = {"metadata": {"name": "mysecret"}, "immutable": True, "data": {"valueFrom": {"secretKeyRef": {
+            "namespace": "source-ns", "name": "source",
+        }}}, "status": {"create_fn": {"syncedns": ["ns1"], "secretName": "mysecret-old"}}}
+        csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid", name="mysecret", body=body, synced_namespace=["ns1"],
+        ))
+        source_digests.clear()
+
+        mock_v1 = Mock()
+        mock_v1.read_namespaced_secret_record.return_value = Mock(data={"a": "YQ=="})
+        patched = {**body, "status": {"create_fn": {"syncedns": ["ns1"], "secretName": "mysecret-new"}}}
+
+        async def change():
+            await on_secret_event(self.logger, "MODIFIED", {"metadata": {"name": "source", "namespace": "source-ns"}})
+
+        with patch("handlers.v1", mock_v1), \
+             patch("handlers.sync_secret", return_value="created"), \
+             patch("handlers.patch_clustersecret_status", return_value=patched) as patch_clustersecret_status:
+            asyncio.run(change())
+
+        patch_clustersecret_status.assert_called_once_with(
+            logger=ANY,
+            name="mysecret",
+            new_status={"create_fn": {"syncedns": ["ns1"], "secretName": versioned_name("mysecret", {"a": "YQ=="})}},
+            custom_objects_api=ANY,
+        )
+        self.assertEqual(csecs_cache.get_cluster_secret("mysecretuid").body, patched)
+
     def test_startup_fn(self):
         """Must not fail on empty namespace in ClusterSecret metadata (it's cluster-wide after all).
         """
@@ -358,11 +853,53 @@ class TestClusterSecretHandler(unittest.TestCase):
 
         get_custom_objects_by_kind.return_value = [csec.body]
 
-        with patch("handlers.get_custom_objects_by_kind", get_custom_objects_by_kind):
-            asyncio.run(startup_fn(logger=self.logger))
+        async def start():
+            await startup_fn(logger=self.logger)
+            # The cache is filled in the background, with the watches.
+            await handlers.warm_up_task
+
+        with patch("handlers.get_custom_objects_by_kind", get_custom_objects_by_kind), \
+             patch("handlers.get_readiness_port", return_value=0), \
+             patch("handlers.start_informers") as start_informers:
+            asyncio.run(start())
+
+        start_informers.assert_called_once()
+        self.assertTrue(handlers.load.synced)
 
         # The secret should be in the cache.
         self.assertEqual(
             csecs_cache.get_cluster_secret("mysecretuid"),
             csec,
         )
+
+    def test_warm_up_retried(self):
+        """A failed listing of the ClusterSecrets must be retried, not end the warm-up.
+        """
+
+        get_custom_objects_by_kind = Mock(side_effect=[ApiException(status=500), []])
+        handlers.load.synced = False
+
+        with patch("handlers.get_custom_objects_by_kind", get_custom_objects_by_kind), \
+             patch("handlers.start_informers") as start_informers:
+            asyncio.run(handlers.warm_up(self.logger, backoff=0))
+
+        self.assertEqual(get_custom_objects_by_kind.call_count, 2)
+        start_informers.assert_called_once()
+        self.assertTrue(handlers.load.synced)
+
+    def test_configure_fn(self):
+        """Kopf settings from the environment must be applied at startup.
+        """
+
+        settings = kopf.OperatorSettings()
+
+        with patch("handlers.get_kopf_settings", return_value={
+            "batching.worker_limit": 8,
+            "execution.max_workers": 4,
+            "watching.server_timeout": 300,
+        }):
+            asyncio.run(configure_fn(logger=self.logger, settings=settings))
+
+        self.assertEqual(settings.batching.worker_limit, 8)
+        self.assertEqual(settings.execution.max_workers, 4)
+        self.assertEqual(settings.watching.server_timeout, 300)
@@ -0,0 +1,137 @@
+import json
+import logging
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client import ApiException
+
+from informer import Gone, Informer
+from metrics import Registry
+
+logger = logging.getLogger("test_informer")
+
+
+def namespace(name, version):
+    return {"metadata": {"name": name, "resourceVersion": version}}
+
+
+def page(items, version, token=None):
+    return Mock(data=json.dumps({"metadata": {"resourceVersion": version, "continue": token}, "items": items}))
+
+
+def stream(*events):
+    response = Mock()
+    response.stream.return_value = [json.dumps(event).encode() + b"\n" for event in events]
+    return response
+
+
+class TestInformer(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.api_client = Mock()
+        self.registry = Registry()
+        self.informer = Informer(
+            self.api_client,
+            "/api/v1/namespaces",
+            lambda event_type, obj: self.events.append((event_type, obj["metadata"]["name"])),
+            resource="namespaces",
+            page_size=2,
+            registry=self.registry,
+        )
+
+    def query(self, call):
+        return dict(call.kwargs["query_params"])
+
+    def test_relist_paginated(self):
+        """The first listing is replayed as events without type, page by page.
+        """
+        pages = iter([
+            page([namespace("a", "1"), namespace("b", "2")], "10", token="next"),
+            page([namespace("c", "3")], "10"),
+        ])
+        replayed_before_fetch = []
+
+        def call_api(*args, **kwargs):
+            replayed_before_fetch.append(len(self.events))
+            return next(pages)
+
+        self.api_client.call_api.side_effect = call_api
+
+        self.assertEqual(self.informer.relist(logger), 3)
+        # Each page is replayed before the next one is fetched.
+        self.assertEqual(replayed_before_fetch, [0, 2])
+
+        self.assertEqual(self.events, [(None, "a"), (None, "b"), (None, "c")])
+        self.assertEqual(self.informer.resource_version, "10")
+        self.assertEqual(self.query(self.api_client.call_api.call_args_list[1])["continue"], "next")
+
+    def test_relist_replays_differences(self):
+        """After the first listing, a relist replays what changed while the watch was down.
+        """
+        self.informer.versions = {"a": "1", "b": "2"}
+        self.informer.synced.set()
+        self.api_client.call_api.return_value = page([namespace("a", "1"), namespace("b", "5"), namespace("c", "6")], "20")
+
+        self.informer.relist(logger)
+
+        self.assertEqual(self.events, [("MODIFIED", "b"), ("ADDED", "c")])
+
+        self.api_client.call_api.return_value = page([namespace("c", "6")], "30")
+        self.events.clear()
+        self.informer.relist(logger)
+
+        self.assertEqual(sorted(self.events), [("DELETED", "a"), ("DELETED", "b")])
+
+    def test_stream_bookmarks(self):
+        """Bookmarks move the resourceVersion without events, the watch resumes from it.
+        """
+        self.informer.resource_version = "10"
+        self.informer.stream(logger, stream(
+            {"type": "ADDED", "object": namespace("a", "11")},
+            {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "42"}}},
+        ))
+
+        self.assertEqual(self.events, [("ADDED", "a")])
+        self.assertEqual(self.informer.resource_version, "42")
+        self.assertEqual(self.registry.get("clustersecret_watch_bookmarks_total", resource="namespaces"), 1)
+
+        self.api_client.call_api.return_value = stream()
+        self.informer.watch()
+        query = self.query(self.api_client.call_api.call_args)
+        self.assertEqual(query["resourceVersion"], "42")
+        self.assertEqual(query["allowWatchBookmarks"], "true")
+
+    def test_stream_gone(self):
+        with self.assertRaises(Gone):
+            self.informer.stream(logger, stream({"type": "ERROR", "object": {"code": 410, "message": "too old"}}))
+
+        self.api_client.call_api.side_effect = ApiException(status=410)
+        with self.assertRaises(Gone):
+            self.informer.watch()
+
+    def test_run_resumes_then_relists(self):
+        """A dropped watch resumes without a relist, an expired one relists, and both are measured.
+        """
+        def stop_after(response):
+            def close():
+                if self.api_client.call_api.call_count == 5:
+                    self.informer.stopped.set()
+            response.close.side_effect = close
+            return response
+
+        self.api_client.call_api.side_effect = [
+            page([namespace("a", "1")], "10"),
+            stream({"type": "ADDED", "object": namespace("b", "11")}),
+            stream({"type": "ERROR", "object": {"code": 410, "message": "too old"}}),
+            page([namespace("a", "1"), namespace("b", "11"), namespace("c", "12")], "20"),
+            stop_after(stream()),
+        ]
+
+        self.informer.run(logger)
+
+        self.assertEqual(self.events, [(None, "a"), ("ADDED", "b"), ("ADDED", "c")])
+        self.assertEqual(self.registry.get("clustersecret_watch_reconnects_total", resource="namespaces", mode="resume"), 1)
+        self.assertEqual(self.registry.get("clustersecret_watch_reconnects_total", resource="namespaces", mode="relist"), 1)
+        self.assertEqual(self.registry.get("clustersecret_watch_relist_objects_total", resource="namespaces"), 3)
+        self.assertEqual(self.registry.get("clustersecret_watch_reconnect_seconds_count", resource="namespaces", mode="relist"), 1)
@@ -4,12 +4,14 @@ import unittest
 from typing import Tuple, Callable, Union
 from unittest.mock import Mock
 
-from kubernetes.client import V1ObjectMeta
+from kubernetes.client import ApiException, V1ObjectMeta
 
 from consts import CREATE_BY_ANNOTATION, LAST_SYNC_ANNOTATION, VERSION_ANNOTATION, BLOCKED_ANNOTATIONS, \
-    CREATE_BY_AUTHOR, CLUSTER_SECRET_LABEL
-from kubernetes_utils import get_ns_list, create_secret_metadata
+    CREATE_BY_AUTHOR, CLUSTER_SECRET_LABEL, ALIAS_LABEL, ROLLOUT_PAUSED_ANNOTATION
+from kubernetes_utils import get_ns_list, create_secret_metadata, namespace_matches, create_secret_body, \
+    stamp_namespace, sync_secret, prune_versions, namespace_watch_selector
 from os_utils import get_version, get_blocked_labels
+from slim_api import NamespaceRecord, SecretMetadata
 
 USER_NAMESPACE_COUNT = 10
 initial_namespaces = ['default', 'kube-node-lease', 'kube-public', 'kube-system']
@@ -31,10 +33,10 @@ class TestClusterSecret(unittest.TestCase):
         mock_v1 = Mock()
 
         # Define the predefined list of namespaces you want to use in the test
-        predefined_nss = [Mock(metadata=V1ObjectMeta(name=ns)) for ns in initial_namespaces + user_namespaces]
+        predefined_nss = [NamespaceRecord(ns, {}) for ns in initial_namespaces + user_namespaces]
 
-        # Configure the mock's behavior to return the predefined namespaces when list_namespace is called
-        mock_v1.list_namespace.return_value.items = predefined_nss
+        # Configure the mock's behavior to return the predefined namespaces when list_namespace_metadata is called
+        mock_v1.list_namespace_metadata.return_value = predefined_nss
 
         cases = [
             {
@@ -85,6 +87,74 @@ class TestClusterSecret(unittest.TestCase):
                 msg=case['name'],
             )
 
+    def test_get_ns_list_namespace_selector(self):
+        mock_v1 = Mock()
+
+        labels = {
+            'default': None,
+            'team-a': {'team': 'a', 'tier': 'prod'},
+            'team-a-dev': {'team': 'a', 'tier': 'dev'},
+            'team-b': {'team': 'b', 'tier': 'prod'},
+            'shared': {'shared': 'true'},
+        }
+        mock_v1.list_namespace_metadata.return_value = [
+            NamespaceRecord(ns, ns_labels or {}) for ns, ns_labels in labels.items()
+        ]
+
+        cases = [
+            {
+                'name': 'matchLabels',
+                'body': {'namespaceSelector': {'matchLabels': {'team': 'a'}}},
+                'expected': ['team-a', 'team-a-dev'],
+            },
+            {
+                'name': 'matchLabels and matchExpressions',
+                'body': {'namespaceSelector': {
+                    'matchLabels': {'team': 'a'},
+                    'matchExpressions': [{'key': 'tier', 'operator': 'NotIn', 'values': ['dev']}],
+                }},
+                'expected': ['team-a'],
+            },
+            {
+                'name': 'In and Exists',
+                'body': {'namespaceSelector': {
+                    'matchExpressions': [
+                        {'key': 'team', 'operator': 'In', 'values': ['a', 'b']},
+                        {'key': 'tier', 'operator': 'Exists'},
+                    ],
+                }},
+                'expected': ['team-a', 'team-a-dev', 'team-b'],
+            },
+            {
+                'name': 'DoesNotExist combined with name patterns',
+                'body': {
+                    'matchNamespace': ['team-*', 'shared', 'default'],
+                    'avoidNamespaces': ['team-b'],
+                    'namespaceSelector': {'matchExpressions': [{'key': 'tier', 'operator': 'DoesNotExist'}]},
+                },
+                'expected': ['shared', 'default'],
+            },
+        ]
+
+        for case in cases:
+            self.assertListEqual(
+                list1=sorted(case['expected']),
+                list2=sorted(get_ns_list(
+                    logger=logging.getLogger(__name__),
+                    body=case['body'],
+                    v1=mock_v1,
+                )),
+                msg=case['name'],
+            )
+
+            # A single namespace evaluated on its own must agree with the listing.
+            for ns, ns_labels in labels.items():
+                self.assertEqual(
+                    namespace_matches(case['body'], ns, ns_labels),
+                    ns in case['expected'],
+                    msg=f"{case['name']}: {ns}",
+                )
+
     def test_create_secret_metadata(self) -> None:
 
         expected_base_label_key = CLUSTER_SECRET_LABEL
@@ -168,3 +238,125 @@ class TestClusterSecret(unittest.TestCase):
                     expr=validator(value),
                     msg=f'expected base annotation with key {key} is present and its value {value} is as expected'
                 )
+
+    def test_create_secret_metadata_control_annotations(self):
+        """The annotations of kopf, per shard too, and those controlling the operator are not copied.
+        """
+        subject = create_secret_metadata(
+            name='test_secret',
+            namespace=None,
+            annotations={
+                'pod-a.shards.clustersecret.io/last-handled-configuration': '{}',
+                'kopf.zalando.org/last-handled-configuration': '{}',
+                ROLLOUT_PAUSED_ANNOTATION: 'true',
+                'team': 'platform',
+            },
+        )
+
+        self.assertEqual(
+            sorted(subject.annotations),
+            sorted([CREATE_BY_ANNOTATION, VERSION_ANNOTATION, LAST_SYNC_ANNOTATION, 'team']),
+        )
+
+    def test_create_secret_body_shared(self):
+        body = {
+            'metadata': {'name': 'mysecret', 'labels': {'team': 'a'}},
+            'type': 'kubernetes.io/tls',
+            'data': {'tls.crt': 'Y3J0', 'tls.key': 'a2V5'},
+        }
+
+        secret_body = create_secret_body(logging.getLogger(__name__), body, Mock())
+        self.assertNotIn('namespace', secret_body['metadata'])
+        self.assertEqual(secret_body['type'], 'kubernetes.io/tls')
+        self.assertEqual(secret_body['metadata']['labels']['team'], 'a')
+        self.assertEqual(secret_body['metadata']['labels'][CLUSTER_SECRET_LABEL], 'true')
+
+        stamped = [stamp_namespace(secret_body, ns) for ns in ['ns1', 'ns2']]
+        self.assertEqual([sec['metadata']['namespace'] for sec in stamped], ['ns1', 'ns2'])
+
+        # The payload is shared, not copied, and the template is left untouched.
+        self.assertIs(stamped[0]['data'], stamped[1]['data'])
+        self.assertIs(stamped[0]['metadata']['annotations'], secret_body['metadata']['annotations'])
+        self.assertNotIn('namespace', secret_body['metadata'])
+
+    def test_immutable_versions(self):
+        """Immutable child secrets are named after their content, and a new version prunes the old ones.
+        """
+        logger = logging.getLogger(__name__)
+        body = {'metadata': {'name': 'mysecret'}, 'immutable': True, 'keepVersions': 1, 'data': {'key': 'djE='}}
+        secret_body = create_secret_body(logger, body, Mock())
+        name = secret_body['metadata']['name']
+
+        self.assertTrue(secret_body['immutable'])
+        self.assertTrue(name.startswith('mysecret-'))
+        self.assertEqual(secret_body['metadata']['labels'][ALIAS_LABEL], 'mysecret')
+        self.assertNotEqual(create_secret_body(logger, {**body, 'data': {'key': 'djI='}}, Mock())['metadata']['name'], name)
+
+        def version(version_name, day):
+            return SecretMetadata(version_name, 'myns', None, {ALIAS_LABEL: 'mysecret'}, f'2024-01-{day:02}T00:00:00Z')
+
+        mock_v1 = Mock()
+        mock_v1.read_namespaced_secret_metadata.side_effect = ApiException(status=404)
+        mock_v1.list_namespaced_secret_metadata.return_value = [
+            version('mysecret', 1), version('mysecret-old', 2), version('mysecret-previous', 3), version(name, 4),
+        ]
+
+        self.assertEqual(sync_secret(logger, 'myns', body, mock_v1, secret_body), 'created')
+
+        mock_v1.list_namespaced_secret_metadata.assert_called_once_with('myns', label_selector=f'{ALIAS_LABEL}=mysecret')
+        deleted = [call.args[0] for call in mock_v1.delete_namespaced_secret.call_args_list]
+        self.assertEqual(deleted, ['mysecret-old', 'mysecret'])
+
+        # An existing version already holds the data.
+        mock_v1.read_namespaced_secret_metadata.side_effect = None
+        mock_v1.read_namespaced_secret_metadata.return_value = SecretMetadata(
+            name, 'myns', {CREATE_BY_ANNOTATION: CREATE_BY_AUTHOR}, None,
+        )
+        self.assertEqual(sync_secret(logger, 'myns', body, mock_v1, secret_body), 'skipped')
+        mock_v1.replace_namespaced_secret.assert_not_called()
+
+        # Deleting all the versions.
+        mock_v1.delete_namespaced_secret.reset_mock()
+        self.assertEqual(prune_versions(logger, 'myns', 'mysecret', mock_v1, keep=0), 4)
+
+    def test_long_names(self):
+        """Child secrets of long ClusterSecret names fit the limits of names and label values.
+        """
+        logger = logging.getLogger(__name__)
+        name = 'a' * 253
+        body = {'metadata': {'name': name}, 'immutable': True, 'data': {'key': 'djE='}}
+        secret_body = create_secret_body(logger, body, Mock())
+
+        self.assertEqual(len(secret_body['metadata']['name']), 253)
+        alias_value = secret_body['metadata']['labels'][ALIAS_LABEL]
+        self.assertEqual(len(alias_value), 63)
+        self.assertNotEqual(alias_value, create_secret_body(logger, {**body, 'metadata': {'name': name[:-1]}}, Mock())[
+            'metadata']['labels'][ALIAS_LABEL])
+
+        mutable_body = create_secret_body(logger, {**body, 'immutable': False}, Mock())
+        self.assertEqual(mutable_body['metadata']['name'], name)
+        self.assertEqual(mutable_body['metadata']['labels'][ALIAS_LABEL], alias_value)
+
+    def test_namespace_watch_selector(self):
+        """The label requirements shared by all the ClusterSecrets, with the union of their values.
+        """
+        team_a = {'namespaceSelector': {'matchLabels': {'team': 'a', 'env': 'prod'}}}
+        team_b = {'namespaceSelector': {'matchExpressions': [
+            {'key': 'team', 'operator': 'In', 'values': ['b', 'c']},
+            {'key': 'env', 'operator': 'Exists'},
+        ]}}
+        named = {'matchNamespace': ['^team-a$', 'team-b$'], 'namespaceSelector': {'matchLabels': {'team': 'd'}}}
+        nothing = {'namespaceSelector': {'matchExpressions': [{'key': 'team', 'operator': 'In', 'values': []}]}}
+
+        self.assertEqual(namespace_watch_selector([team_a]), 'env in (prod),team in (a)')
+        self.assertEqual(namespace_watch_selector([team_a, team_b, nothing]), 'env,team in (a,b,c)')
+        self.assertEqual(
+            namespace_watch_selector([named]),
+            'kubernetes.io/metadata.name in (team-a,team-b),team in (d)',
+        )
+        self.assertEqual(namespace_watch_selector([team_b, named]), 'team in (b,c,d)')
+
+        # Prefixes, name patterns and label-less ClusterSecrets can match any label.
+        self.assertIsNone(namespace_watch_selector([team_a, {'matchNamespace': ['team-']}]))
+        self.assertIsNone(namespace_watch_selector([team_a, {'namespaceSelector': {'matchLabels': {'other': 'x'}}}]))
+        self.assertIsNone(namespace_watch_selector([]))
@@ -0,0 +1,83 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from kubernetes.client import V1ObjectMeta, V1Secret
+
+from log_utils import Count, Redacted, SampledRepeatsFilter, log_level
+
+
+class TestRedacted(unittest.TestCase):
+
+    def test_redacts_data(self):
+        """The secret values must never reach the formatted record, the rest of the body must.
+        """
+        body = {
+            "metadata": {"name": "mysecret"},
+            "data": {"password": "c2VjcmV0"},
+            "items": [{"stringData": {"token": "plain"}}],
+        }
+        formatted = str(Redacted(body))
+
+        self.assertIn("mysecret", formatted)
+        self.assertIn("password", formatted)
+        self.assertNotIn("c2VjcmV0", formatted)
+        self.assertNotIn("plain", formatted)
+        # The logged body is left untouched.
+        self.assertEqual(body["data"], {"password": "c2VjcmV0"})
+
+    def test_redacts_models(self):
+        secret = V1Secret(metadata=V1ObjectMeta(name="mysecret"), data={"password": "c2VjcmV0"})
+        self.assertNotIn("c2VjcmV0", str(Redacted(secret)))
+
+    def test_formats_lazily(self):
+        """Nothing is formatted when the level is disabled.
+        """
+        logger = logging.getLogger("test_log_utils.lazy")
+        logger.setLevel(logging.INFO)
+        with patch("log_utils.redact") as redact:
+            logger.debug("body %s", Redacted({"data": {}}))
+        redact.assert_not_called()
+
+    def test_count(self):
+        self.assertEqual(str(Count(["b", "a"])), "2 [a, b]")
+        self.assertEqual(str(Count([f"ns{i}" for i in range(7)], limit=2)), "7 [ns0, ns1, ...]")
+
+
+class TestLogLevel(unittest.TestCase):
+
+    def test_log_level(self):
+        self.assertEqual(log_level("WARNING"), logging.WARNING)
+        self.assertEqual(log_level("info"), logging.INFO)
+        self.assertEqual(log_level("30"), 30)
+        with self.assertRaises(ValueError):
+            log_level("LOUD")
+
+
+class TestSampledRepeatsFilter(unittest.TestCase):
+
+    def record(self, msg="Cloning secret %s", args=("mysecret",)):
+        return logging.LogRecord("kopf.objects", logging.INFO, __file__, 1, msg, args, None)
+
+    def test_samples_repeats(self):
+        """Only the first records of a message pass, the next window reports the dropped ones.
+        """
+        sampling = SampledRepeatsFilter(burst=2, window=60)
+        with patch("log_utils.time.monotonic", return_value=0):
+            passed = [sampling.filter(self.record()) for _ in range(5)]
+            self.assertTrue(sampling.filter(self.record(msg="Another message")))
+        self.assertEqual(passed, [True, True, False, False, False])
+
+        with patch("log_utils.time.monotonic", return_value=60):
+            record = self.record()
+            self.assertTrue(sampling.filter(record))
+        self.assertIn("repeated 3 more times", record.getMessage())
+
+    def test_keeps_warnings(self):
+        """Warnings and errors of different objects share templates, none of them is dropped.
+        """
+        sampling = SampledRepeatsFilter(burst=1, window=60)
+        record = self.record(msg="Failed to sync %s")
+        record.levelno = logging.ERROR
+        with patch("log_utils.time.monotonic", return_value=0):
+            self.assertEqual([sampling.filter(record) for _ in range(3)], [True, True, True])
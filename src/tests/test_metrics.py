@@ -0,0 +1,24 @@
+import unittest
+
+from metrics import Registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_render(self):
+        registry = Registry()
+        registry.describe("requests_total", "counter", "Requests.")
+        registry.describe("latency_seconds", "summary", "Latency.")
+        registry.inc("requests_total", resource="namespaces")
+        registry.inc("requests_total", 2, resource="namespaces")
+        registry.observe("latency_seconds", 0.5, resource='a"b')
+
+        self.assertEqual(registry.render(), "\n".join([
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds summary",
+            'latency_seconds_sum{resource="a\\"b"} 0.5',
+            'latency_seconds_count{resource="a\\"b"} 1',
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{resource="namespaces"} 3',
+        ]) + "\n")
@@ -0,0 +1,41 @@
+import unittest
+
+from patterns import PatternError, compile_pattern, literal_name, match_names, validate_patterns
+
+
+class TestPatterns(unittest.TestCase):
+
+    def test_valid_patterns(self):
+        for pattern in ['.*', 'example-*', 'team-(a|b)-.+', 'prod-[0-9]{1,3}$', '^kube-']:
+            self.assertIsNotNone(compile_pattern(pattern), msg=pattern)
+
+    def test_compiled_once(self):
+        self.assertIs(compile_pattern('example-.*'), compile_pattern('example-.*'))
+
+    def test_rejected_patterns(self):
+        cases = {
+            'Invalid regex': 'example-(',
+            'Nested quantifier': '(a+)+$',
+            'Nested quantifier in alternation': '(x|(ab*)*)c',
+            'Too long': 'a' * 1000,
+            'Not a string': 42,
+        }
+        for name, pattern in cases.items():
+            with self.assertRaises(PatternError, msg=name):
+                compile_pattern(pattern)
+
+    def test_validate_patterns(self):
+        validate_patterns({'matchNamespace': ['example-*'], 'avoidNamespaces': ['example-0']})
+        with self.assertRaises(PatternError):
+            validate_patterns({'matchNamespace': ['example-*'], 'avoidNamespaces': ['(.*)*x']})
+
+    def test_match_names(self):
+        names = [f'example-{index}' for index in range(1000)]
+        self.assertEqual(match_names('example-[0-9]$', names), [f'example-{index}' for index in range(10)])
+        self.assertEqual(len(match_names('example-', names)), 1000)
+
+    def test_literal_name(self):
+        self.assertEqual(literal_name('^team-a$'), 'team-a')
+        self.assertEqual(literal_name('team-a$'), 'team-a')
+        for pattern in ['team-a', 'team-.*$', 'team-(a|b)$', 42]:
+            self.assertIsNone(literal_name(pattern), msg=pattern)
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from consts import ALIAS_LABEL, CREATE_BY_ANNOTATION
+from kubernetes_utils import versioned_name
+from planner import SnapshotApi, format_plans, load_cache, load_items, plan
+
+logger = logging.getLogger("test_planner")
+
+
+def namespace(name, labels=None):
+    return {"metadata": {"name": name, "labels": labels or {}}}
+
+
+def secret(name, ns, annotations=None):
+    return {"metadata": {"name": name, "namespace": ns, "annotations": annotations}, "data": {"key": "dmFsdWU="}}
+
+
+def versioned_secret(name, ns, labels, created):
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": ns,
+            "annotations": {CREATE_BY_ANNOTATION: "ClusterSecrets"},
+            "labels": labels,
+            "creationTimestamp": created,
+        },
+        "data": {"key": "dmFsdWU="},
+    }
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.v1 = SnapshotApi(
+            namespaces=[namespace("team-a"), namespace("team-b"), namespace("team-c"), namespace("other")],
+            secrets=[
+                secret("mysecret", "team-a", {CREATE_BY_ANNOTATION: "ClusterSecrets"}),
+                secret("mysecret", "team-b"),
+            ],
+        )
+        self.cluster_secret = {
+            "metadata": {"name": "mysecret", "uid": "mysecretuid"},
+            "matchNamespace": ["team-.*"],
+            "data": {"key": "dmFsdWU="},
+            "status": {"create_fn": {"syncedns": ["team-a", "other"]}},
+        }
+
+    def test_plan_live_set(self):
+        """Managed secrets are replaced, unmanaged ones skipped, missing ones created, stale ones deleted.
+        """
+        plans = plan(logger, load_cache([self.cluster_secret]), self.v1)
+
+        self.assertEqual(plans[0]["namespaces"], {
+            "team-a": "replace",
+            "team-b": "skip",
+            "team-c": "create",
+            "other": "delete",
+        })
+        self.assertEqual(plans[0]["actions"], {"replace": 1, "skip": 1, "create": 1, "delete": 1})
+        # list + 2 + 1 + 2 + 1 + status patch
+        self.assertEqual(plans[0]["api_calls"], 8)
+
+    def test_plan_manifest(self):
+        """A manifest is planned against the synced namespaces of the ClusterSecret of the same name.
+        """
+        manifest = {"metadata": {"name": "mysecret"}, "matchNamespace": ["team-a"], "data": {"key": "dmFsdWU="}}
+        plans = plan(logger, load_cache([self.cluster_secret]), self.v1, [manifest])
+
+        self.assertEqual(plans[0]["namespaces"], {"team-a": "replace", "other": "delete"})
+        self.assertIn("2 namespaces (delete 1, replace 1), 5 API calls", format_plans(plans))
+
+    def test_plan_immutable(self):
+        """An immutable ClusterSecret is planned on its current version, pruning the older ones.
+        """
+        child_name = versioned_name("mysecret", {"key": "dmFsdWU="})
+        labels = {ALIAS_LABEL: "mysecret"}
+        v1 = SnapshotApi(
+            namespaces=[namespace("team-a"), namespace("team-b"), namespace("other")],
+            secrets=[
+                versioned_secret(child_name, "team-a", labels, "2024-01-03T00:00:00Z"),
+                versioned_secret("mysecret-old1", "team-b", labels, "2024-01-01T00:00:00Z"),
+                versioned_secret("mysecret-old2", "team-b", labels, "2024-01-02T00:00:00Z"),
+                versioned_secret("mysecret-old1", "other", labels, "2024-01-01T00:00:00Z"),
+            ],
+        )
+        self.cluster_secret["immutable"] = True
+        plans = plan(logger, load_cache([self.cluster_secret]), v1)
+
+        self.assertEqual(plans[0]["secretName"], child_name)
+        self.assertEqual(plans[0]["namespaces"], {"team-a": "skip", "team-b": "create", "other": "delete"})
+        # The most recent previous version is kept, and all of them from the namespaces left.
+        self.assertEqual(plans[0]["pruned"], {"team-b": ["mysecret-old1"], "other": ["mysecret-old1"]})
+        # list + 1 + (2 + list + 1) + (list + 1) + status patch
+        self.assertEqual(plans[0]["api_calls"], 9)
+        self.assertIn("prune    team-b/mysecret-old1", format_plans(plans, details=True))
+
+    def test_plan_rejected_pattern(self):
+        manifest = {"metadata": {"name": "bad"}, "matchNamespace": ["(a+)+"], "data": {}}
+        plans = plan(logger, load_cache([]), self.v1, [manifest])
+
+        self.assertIn("error", plans[0])
+        self.assertIn("bad: rejected", format_plans(plans))
+
+    def test_load_items(self):
+        """kubectl lists are flattened."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "namespaces.json")
+            with open(path, "w") as f:
+                json.dump({"kind": "NamespaceList", "items": [namespace("a"), namespace("b")]}, f)
+            self.assertEqual([item["metadata"]["name"] for item in load_items(path)], ["a", "b"])
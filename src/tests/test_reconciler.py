@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import ANY, Mock, patch
+
+from kubernetes.client import ApiException
+
+from cache import MemoryCache, MemoryChildSecretCache, MemoryNamespaceCache
+from consts import CREATE_BY_ANNOTATION, CREATE_BY_AUTHOR
+from kubernetes_utils import child_digest, create_secret_body
+from models import BaseClusterSecret
+from reconciler import Reconciler
+from slim_api import SecretRecord
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.csecs_cache = MemoryCache()
+        self.namespaces_cache = MemoryNamespaceCache()
+        self.mock_v1 = Mock()
+        self.mock_custom_objects_api = Mock()
+        self.reconciler = Reconciler(
+            csecs_cache=self.csecs_cache,
+            namespaces_cache=self.namespaces_cache,
+            v1=self.mock_v1,
+            custom_objects_api=self.mock_custom_objects_api,
+            interval=60,
+            qps=0,
+        )
+
+    def child_secret(self, namespace, data):
+        return SecretRecord("mysecret", namespace, {CREATE_BY_ANNOTATION: CREATE_BY_AUTHOR}, data)
+
+    def test_reconcile_discrepancies(self):
+        """Only the drifted, missing and extra child secrets must be corrected.
+        """
+
+        for ns in ["uptodate", "drifted", "missing", "avoided"]:
+            self.namespaces_cache.set_namespace(ns, {})
+
+        children = {
+            "uptodate": self.child_secret("uptodate", {"key": "value"}),
+            "drifted": self.child_secret("drifted", {"key": "oldvalue"}),
+        }
+
+        def read_namespaced_secret_record(name, namespace, **kwargs):
+            if namespace not in children:
+                raise ApiException(status=404, reason="Not Found")
+            return children[namespace]
+
+        self.mock_v1.read_namespaced_secret_record = read_namespaced_secret_record
+
+        csec = BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "data": {"key": "value"}, "avoidNamespaces": ["avoided"]},
+            synced_namespace=["uptodate", "drifted", "avoided", "gone"],
+        )
+        self.csecs_cache.set_cluster_secret(csec)
+
+        with patch("reconciler.sync_secret") as sync_secret, \
+             patch("reconciler.patch_clustersecret_status") as patch_clustersecret_status:
+            asyncio.run(self.reconciler.sweep(self.logger))
+
+        self.assertCountEqual(
+            [call.args[1] for call in sync_secret.call_args_list],
+            ["drifted", "missing"],
+        )
+        self.mock_v1.delete_namespaced_secret.assert_called_once_with("mysecret", "avoided")
+        patch_clustersecret_status.assert_called_once_with(
+            logger=self.logger,
+            name="mysecret",
+            new_status={'create_fn': {'syncedns': ANY}},
+            custom_objects_api=ANY,
+        )
+        self.assertCountEqual(
+            self.csecs_cache.get_cluster_secret("mysecretuid").synced_namespace,
+            ["uptodate", "drifted", "missing"],
+        )
+
+    def test_reconcile_in_sync(self):
+        """A ClusterSecret in sync must not issue any write.
+        """
+
+        self.namespaces_cache.set_namespace("myns", {})
+        self.mock_v1.read_namespaced_secret_record.return_value = self.child_secret("myns", {"key": "value"})
+
+        csec = BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "data": {"key": "value"}},
+            synced_namespace=["myns"],
+        )
+        self.csecs_cache.set_cluster_secret(csec)
+
+        with patch("reconciler.sync_secret") as sync_secret, \
+             patch("reconciler.patch_clustersecret_status") as patch_clustersecret_status:
+            asyncio.run(self.reconciler.sweep(self.logger))
+
+        sync_secret.assert_not_called()
+        patch_clustersecret_status.assert_not_called()
+        self.mock_v1.delete_namespaced_secret.assert_not_called()
+
+    def test_reconcile_children_cache(self):
+        """Child secrets in the synced watch cache must be compared without reading them, the others read.
+        """
+
+        for ns in ["uptodate", "drifted", "missing"]:
+            self.namespaces_cache.set_namespace(ns, {})
+
+        body = {"metadata": {"name": "mysecret"}, "data": {"key": "value"}}
+        secret_body = create_secret_body(self.logger, body, self.mock_v1)
+        children_cache = MemoryChildSecretCache()
+        children_cache.set_digest("uptodate", "mysecret", child_digest(secret_body))
+        children_cache.set_digest("drifted", "mysecret", child_digest({**secret_body, "data": {"key": "oldvalue"}}))
+        self.reconciler.children_cache = children_cache
+        self.reconciler.children_synced = lambda: True
+        self.mock_v1.read_namespaced_secret_record.side_effect = ApiException(status=404, reason="Not Found")
+
+        self.csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body=body,
+            synced_namespace=["uptodate", "drifted"],
+        ))
+
+        with patch("reconciler.sync_secret") as sync_secret, patch("reconciler.patch_clustersecret_status"):
+            asyncio.run(self.reconciler.sweep(self.logger))
+
+        self.mock_v1.read_namespaced_secret_record.assert_called_once_with("mysecret", "missing")
+        self.assertCountEqual(
+            [call.args[1] for call in sync_secret.call_args_list],
+            ["drifted", "missing"],
+        )
+
+    def test_reconcile_rejected_patterns(self):
+        """A ClusterSecret with rejected patterns must be skipped, not unsynced from every namespace.
+        """
+
+        self.namespaces_cache.set_namespace("myns", {})
+        self.csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "matchNamespace": ["(a+)+"], "data": {"key": "value"}},
+            synced_namespace=["myns"],
+        ))
+
+        with patch("reconciler.sync_secret") as sync_secret, \
+             patch("reconciler.patch_clustersecret_status") as patch_clustersecret_status:
+            asyncio.run(self.reconciler.sweep(self.logger))
+
+        sync_secret.assert_not_called()
+        patch_clustersecret_status.assert_not_called()
+        self.mock_v1.delete_namespaced_secret.assert_not_called()
+        self.assertEqual(self.csecs_cache.get_cluster_secret("mysecretuid").synced_namespace, ["myns"])
+
+    def test_reconcile_type(self):
+        """A changed type must be corrected whether the child is read or taken from the watch cache.
+        """
+
+        self.namespaces_cache.set_namespace("myns", {})
+        body = {"metadata": {"name": "mysecret"}, "type": "kubernetes.io/tls", "data": {"key": "value"}}
+        self.csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid", name="mysecret", body=body, synced_namespace=["myns"],
+        ))
+        self.mock_v1.read_namespaced_secret_record.return_value = self.child_secret("myns", {"key": "value"})
+
+        children_cache = MemoryChildSecretCache()
+        secret_body = create_secret_body(self.logger, body, self.mock_v1)
+        children_cache.set_digest("myns", "mysecret", child_digest({**secret_body, "type": "Opaque"}))
+
+        for synced in [False, True]:
+            self.reconciler.children_cache = children_cache
+            self.reconciler.children_synced = lambda: synced
+            with patch("reconciler.sync_secret") as sync_secret, patch("reconciler.patch_clustersecret_status"):
+                asyncio.run(self.reconciler.sweep(self.logger))
+            sync_secret.assert_called_once()
+
+    def test_sweep_shed(self):
+        """An overloaded operator must skip the sweep.
+        """
+
+        self.namespaces_cache.set_namespace("myns", {})
+        self.csecs_cache.set_cluster_secret(BaseClusterSecret(
+            uid="mysecretuid",
+            name="mysecret",
+            body={"metadata": {"name": "mysecret"}, "data": {"key": "value"}},
+            synced_namespace=[],
+        ))
+        self.reconciler.shed = Mock(return_value=True)
+
+        with patch("reconciler.sync_secret") as sync_secret:
+            asyncio.run(self.reconciler.sweep(self.logger))
+
+        self.reconciler.shed.assert_called_once_with("resync")
+        sync_secret.assert_not_called()
+        self.mock_v1.read_namespaced_secret_record.assert_not_called()
@@ -0,0 +1,60 @@
+import logging
+import unittest
+from unittest.mock import Mock
+
+from consts import ROLLOUT_PAUSED_ANNOTATION
+from rollout import PausedAnnotationHook, Rollout
+
+logger = logging.getLogger("test_rollout")
+
+
+class TestRollout(unittest.TestCase):
+
+    def test_split(self):
+        namespaces = [f"ns{i}" for i in range(100)]
+        waves = Rollout(waves=[0.05, 0.25, 1]).split(namespaces)
+        self.assertEqual([len(wave) for wave in waves], [5, 20, 75])
+        self.assertEqual(sum(waves, []), namespaces)
+
+    def test_split_small(self):
+        """The first wave gets a namespace even when its fraction rounds to none, empty waves are dropped.
+        """
+        rollout = Rollout(waves=[0.01, 0.02, 0.5])
+        self.assertEqual(rollout.split(["a", "b", "c"]), [["a"], ["b"], ["c"]])
+        self.assertEqual(rollout.split(["a"]), [["a"]])
+        self.assertEqual(rollout.split([]), [])
+
+    def test_run(self):
+        """Hooks run between the waves, with the results of the previous ones.
+        """
+        calls = []
+        hook = Mock(side_effect=lambda _, index, results: calls.append((index, sorted(results))))
+        rollout = Rollout(waves=[0.25, 0.5], concurrency=4, hooks=[hook])
+
+        results = rollout.run(logger, "mysecret", ["a", "b", "c", "d"], lambda ns: f"patched {ns}")
+
+        self.assertEqual(results, {ns: f"patched {ns}" for ns in "abcd"})
+        self.assertEqual(calls, [(1, ["a"]), (2, ["a", "b"])])
+
+    def test_run_stopped_by_hook(self):
+        def stop(*_):
+            raise RuntimeError("stop")
+
+        apply = Mock(return_value="patched")
+        rollout = Rollout(waves=[0.5], hooks=[stop])
+        with self.assertRaises(RuntimeError):
+            rollout.run(logger, "mysecret", ["a", "b"], apply)
+        apply.assert_called_once_with("a")
+
+
+class TestPausedAnnotationHook(unittest.TestCase):
+
+    def test_waits_until_resumed(self):
+        paused = {"metadata": {"annotations": {ROLLOUT_PAUSED_ANNOTATION: "true"}}}
+        resumed = {"metadata": {"annotations": {}}}
+        custom_objects_api = Mock()
+        custom_objects_api.get_cluster_custom_object.side_effect = [paused, paused, resumed]
+
+        PausedAnnotationHook("mysecret", custom_objects_api, poll=0)(logger, 1, {})
+
+        self.assertEqual(custom_objects_api.get_cluster_custom_object.call_count, 3)
@@ -0,0 +1,44 @@
+import importlib
+import json
+import sys
+import unittest
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import runtime
+from runtime import JSON_MODULES, apply_profile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class TestApplyProfile(unittest.TestCase):
+
+    def test_standard(self):
+        with patch.dict(sys.modules):
+            self.assertEqual(apply_profile("standard"), [])
+            with self.assertRaises(ImportError):
+                import uvloop  # noqa: F401
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_fast(self):
+        """The modules encoding and decoding the API payloads get orjson
+        """
+        modules = [importlib.import_module(name) for name in JSON_MODULES]
+        with ExitStack() as stack:
+            for module in modules:
+                stack.enter_context(patch.object(module, "json", json))
+            stack.enter_context(patch.object(runtime, "install_uvloop", return_value=True))
+
+            self.assertEqual(apply_profile("fast"), ["uvloop", "orjson"])
+
+            rest = sys.modules["kubernetes.client.rest"]
+            self.assertEqual(json.loads(rest.json.dumps({"data": {"key": "dmFsdWU="}})), {"data": {"key": "dmFsdWU="}})
+            self.assertEqual(modules[0].json.loads('{"type": "ADDED"}'), {"type": "ADDED"})
+            self.assertIsNot(modules[0].json, json)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            apply_profile("turbo")
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+from kubernetes.client import ApiException, V1Lease, V1LeaseSpec
+
+from sharding import HashRing, LeaderElector, ShardManager
+
+UIDS = [f'uid-{index}' for index in range(1000)]
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_spread(self):
+        ring = HashRing({'a', 'b', 'c'})
+        owners = [ring.owner(uid) for uid in UIDS]
+        for member in ['a', 'b', 'c']:
+            # Roughly a third each.
+            self.assertGreater(owners.count(member), 200)
+
+    def test_minimal_moves(self):
+        """Only the keys of a leaving member must move."""
+        before = HashRing({'a', 'b', 'c'})
+        after = HashRing({'a', 'b'})
+        for uid in UIDS:
+            if before.owner(uid) != 'c':
+                self.assertEqual(before.owner(uid), after.owner(uid))
+
+    def test_empty(self):
+        self.assertIsNone(HashRing(set()).owner('uid'))
+
+
+class TestShardManager(unittest.TestCase):
+
+    def lease(self, identity, renewed_ago):
+        return V1Lease(spec=V1LeaseSpec(
+            holder_identity=identity,
+            lease_duration_seconds=15,
+            renew_time=datetime.now(timezone.utc) - timedelta(seconds=renewed_ago),
+        ))
+
+    def test_heartbeat(self):
+        coordination_api = Mock()
+        coordination_api.replace_namespaced_lease.side_effect = ApiException(status=404, reason="Not Found")
+        coordination_api.list_namespaced_lease.return_value.items = [
+            self.lease('pod-a', 1),
+            self.lease('pod-b', 5),
+            self.lease('pod-gone', 60),
+        ]
+
+        shards = ShardManager('pod-a', 'clustersecret', coordination_api)
+
+        previous = shards.heartbeat()
+        self.assertEqual(previous.members, frozenset())
+        self.assertEqual(shards.ring.members, {'pod-a', 'pod-b'})
+        coordination_api.create_namespaced_lease.assert_called_once()
+
+        # Same members: no rebalance.
+        self.assertIsNone(shards.heartbeat())
+
+        owned = [uid for uid in UIDS if shards.owns(uid)]
+        self.assertTrue(0 < len(owned) < len(UIDS))
+
+    def test_expire(self):
+        """A replica failing to renew its Lease owns nothing once its lease duration is over."""
+        coordination_api = Mock()
+        coordination_api.list_namespaced_lease.return_value.items = []
+
+        shards = ShardManager('pod-a', 'clustersecret', coordination_api, lease_duration=15)
+        shards.heartbeat()
+        self.assertIsNone(shards.expire())
+        self.assertTrue(shards.owns('uid'))
+
+        shards.renewed -= 20
+        self.assertEqual(shards.expire().members, {'pod-a'})
+        self.assertFalse(shards.owns('uid'))
+
+        # Renewed again: a rebalance takes everything back.
+        self.assertEqual(shards.heartbeat().members, frozenset())
+        self.assertTrue(shards.owns('uid'))
+
+    def test_run_retries_rebalance(self):
+        """A failed rebalance keeps the heartbeat going, and is retried on the next one."""
+        coordination_api = Mock()
+        coordination_api.list_namespaced_lease.return_value.items = [self.lease('pod-b', 1)]
+        shards = ShardManager('pod-a', 'clustersecret', coordination_api, lease_duration=0)
+        rebalances = []
+
+        async def on_rebalance(previous):
+            rebalances.append(previous.members)
+            if len(rebalances) == 1:
+                raise RuntimeError('API down')
+
+        async def run():
+            task = asyncio.create_task(shards.run(logging.getLogger(__name__), on_rebalance))
+            while len(rebalances) < 2:
+                await asyncio.sleep(0.01)
+            task.cancel()
+
+        asyncio.run(asyncio.wait_for(run(), 5))
+        self.assertEqual(rebalances, [frozenset(), frozenset()])
+        self.assertEqual(shards.ring.members, {'pod-a', 'pod-b'})
+
+
+class TestLeaderElector(unittest.TestCase):
+
+    def lease(self, identity, renewed_ago):
+        return V1Lease(spec=V1LeaseSpec(
+            holder_identity=identity,
+            lease_duration_seconds=15,
+            renew_time=datetime.now(timezone.utc) - timedelta(seconds=renewed_ago),
+        ))
+
+    def test_acquire(self):
+        coordination_api = Mock()
+        coordination_api.read_namespaced_lease.side_effect = ApiException(status=404, reason="Not Found")
+
+        leader = LeaderElector('pod-a', 'clustersecret', coordination_api)
+
+        self.assertTrue(leader.heartbeat())
+        self.assertTrue(leader.leading)
+        coordination_api.create_namespaced_lease.assert_called_once()
+
+        # Renewed: still leading, no change.
+        coordination_api.read_namespaced_lease.side_effect = None
+        coordination_api.read_namespaced_lease.return_value = self.lease('pod-a', 5)
+        self.assertFalse(leader.heartbeat())
+        self.assertTrue(leader.leading)
+
+    def test_standby(self):
+        coordination_api = Mock()
+        coordination_api.read_namespaced_lease.return_value = self.lease('pod-b', 5)
+
+        leader = LeaderElector('pod-a', 'clustersecret', coordination_api)
+
+        self.assertFalse(leader.heartbeat())
+        self.assertFalse(leader.leading)
+        self.assertEqual(leader.holder, 'pod-b')
+        coordination_api.replace_namespaced_lease.assert_not_called()
+
+    def test_takeover(self):
+        """An expired Lease is taken over, unless another replica wrote it first."""
+        coordination_api = Mock()
+        coordination_api.read_namespaced_lease.return_value = self.lease('pod-b', 60)
+        coordination_api.replace_namespaced_lease.side_effect = ApiException(status=409, reason="Conflict")
+
+        leader = LeaderElector('pod-a', 'clustersecret', coordination_api)
+        self.assertFalse(leader.heartbeat())
+        self.assertFalse(leader.leading)
+
+        coordination_api.read_namespaced_lease.return_value = self.lease('pod-b', 60)
+        coordination_api.replace_namespaced_lease.side_effect = None
+        self.assertTrue(leader.heartbeat())
+        self.assertTrue(leader.leading)
+        lease = coordination_api.replace_namespaced_lease.call_args.args[2]
+        self.assertEqual(lease.spec.holder_identity, 'pod-a')
+        self.assertEqual(lease.spec.lease_transitions, 1)
+
+    def test_expire(self):
+        """A leader failing to renew steps down once its lease duration is over."""
+        coordination_api = Mock()
+        coordination_api.read_namespaced_lease.side_effect = ApiException(status=404, reason="Not Found")
+
+        leader = LeaderElector('pod-a', 'clustersecret', coordination_api, lease_duration=15)
+        leader.heartbeat()
+        self.assertFalse(leader.expire())
+
+        leader.renewed -= 20
+        self.assertTrue(leader.expire())
+        self.assertFalse(leader.leading)
@@ -0,0 +1,101 @@
+import logging
+import unittest
+from unittest.mock import Mock
+
+from aiohttp.test_utils import TestClient, TestServer
+from kubernetes.client import ApiException
+
+from metrics import Registry
+from shedding import LoadMonitor, ReadinessServer, StatusFlusher
+
+
+class TestLoadMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.load = LoadMonitor(shed_backlog=2, ready_backlog=3, registry=self.registry)
+
+    def test_fan_out(self):
+        """Every namespace leaves the backlog once synced, the rest at the end, even after a failure
+        """
+        sync = Mock(side_effect=["created", "created", Exception("boom")])
+        with self.assertRaises(Exception):
+            with self.load.fan_out(sync, 4) as tracked:
+                self.assertEqual(self.load.backlog, 4)
+                self.assertTrue(self.load.overloaded())
+                tracked("a")
+                tracked("b")
+                self.assertEqual(self.load.backlog, 2)
+                tracked("c")
+        self.assertEqual(self.load.backlog, 0)
+        self.assertEqual(self.registry.get("clustersecret_backlog"), 0)
+
+    def test_shed(self):
+        self.assertFalse(self.load.shed("resync"))
+        self.load.add(2)
+        self.assertTrue(self.load.shed("resync"))
+        self.assertEqual(self.registry.get("clustersecret_shed_total", work="resync"), 1)
+
+        self.load.shed_backlog = 0
+        self.assertFalse(self.load.shed("resync"))
+
+    def test_readiness(self):
+        self.assertEqual(self.load.readiness(), (False, {"synced": False, "backlog": 0, "shedding": False}))
+        self.load.synced = True
+        self.assertEqual(self.load.readiness()[0], True)
+        self.load.add(3)
+        self.assertEqual(self.load.readiness(), (False, {"synced": True, "backlog": 3, "shedding": True}))
+
+
+class TestStatusFlusher(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.load = LoadMonitor(shed_backlog=1, registry=Registry())
+        self.patch = Mock()
+        self.flusher = StatusFlusher(self.load, self.patch)
+
+    def test_not_overloaded(self):
+        self.assertFalse(self.flusher.defer("mysecret", {"create_fn": {"syncedns": ["a"]}}))
+        self.assertEqual(self.flusher.pending, {})
+
+    def test_deferred_then_flushed(self):
+        """Only the last status of each ClusterSecret is flushed, once the load dropped
+        """
+        self.load.add(1)
+        self.assertTrue(self.flusher.defer("mysecret", {"create_fn": {"syncedns": ["a"]}}))
+        self.assertTrue(self.flusher.defer("mysecret", {"create_fn": {"syncedns": ["a", "b"]}}))
+        self.assertTrue(self.flusher.defer("gone", {"create_fn": {"syncedns": []}}))
+        self.assertEqual(self.flusher.flush(self.logger), 0)
+
+        self.load.add(-1)
+        self.patch.side_effect = [None, ApiException(status=404)]
+        self.assertEqual(self.flusher.flush(self.logger), 2)
+        self.patch.assert_any_call(self.logger, "mysecret", {"create_fn": {"syncedns": ["a", "b"]}})
+        self.assertEqual(self.flusher.pending, {})
+
+    def test_discard(self):
+        self.load.add(1)
+        self.flusher.defer("mysecret", {"create_fn": {"syncedns": ["a"]}})
+        self.flusher.discard("mysecret")
+        self.load.add(-1)
+        self.assertEqual(self.flusher.flush(self.logger), 0)
+        self.patch.assert_not_called()
+
+
+class TestReadinessServer(unittest.IsolatedAsyncioTestCase):
+
+    async def test_readyz(self):
+        load = LoadMonitor(registry=Registry())
+        client = TestClient(TestServer(ReadinessServer(load).make_app()))
+        await client.start_server()
+        try:
+            response = await client.get("/readyz")
+            self.assertEqual(response.status, 503)
+
+            load.synced = True
+            response = await client.get("/readyz")
+            self.assertEqual(response.status, 200)
+            self.assertEqual(await response.json(), {"synced": True, "backlog": 0, "shedding": False})
+        finally:
+            await client.close()
@@ -0,0 +1,82 @@
+import json
+import unittest
+from unittest.mock import Mock
+
+from kubernetes.client import ApiClient
+
+from slim_api import METADATA_ACCEPT, METADATA_LIST_ACCEPT, NamespaceRecord, SecretMetadata, SecretRecord, \
+    SlimCoreV1Api
+
+
+def api_returning(payload):
+    api_client = Mock(spec=ApiClient)
+    api_client.call_api.return_value = Mock(data=json.dumps(payload).encode())
+    return SlimCoreV1Api(api_client=api_client), api_client
+
+
+class TestSlimCoreV1Api(unittest.TestCase):
+
+    def test_list_namespace_metadata(self):
+        v1, api_client = api_returning({
+            "kind": "PartialObjectMetadataList",
+            "items": [
+                {"metadata": {"name": "default", "labels": {"team": "a"}}},
+                {"metadata": {"name": "kube-system"}},
+            ],
+        })
+
+        self.assertEqual(v1.list_namespace_metadata(label_selector="team=a"), [
+            NamespaceRecord("default", {"team": "a"}),
+            NamespaceRecord("kube-system", {}),
+        ])
+
+        args, kwargs = api_client.call_api.call_args
+        self.assertEqual(args, ("/api/v1/namespaces", "GET"))
+        self.assertEqual(kwargs["header_params"], {"Accept": METADATA_LIST_ACCEPT})
+        self.assertEqual(kwargs["query_params"], [("labelSelector", "team=a")])
+        self.assertFalse(kwargs["_preload_content"])
+
+    def test_read_namespaced_secret_metadata(self):
+        v1, api_client = api_returning({
+            "kind": "PartialObjectMetadata",
+            "metadata": {"name": "mysecret", "namespace": "myns", "annotations": {"a": "b"}},
+        })
+
+        self.assertEqual(
+            v1.read_namespaced_secret_metadata("mysecret", "myns"),
+            SecretMetadata("mysecret", "myns", {"a": "b"}, None),
+        )
+
+        args, kwargs = api_client.call_api.call_args
+        self.assertEqual(args, ("/api/v1/namespaces/myns/secrets/mysecret", "GET"))
+        self.assertEqual(kwargs["header_params"], {"Accept": METADATA_ACCEPT})
+        self.assertEqual(kwargs["query_params"], [])
+
+    def test_read_namespaced_secret_record(self):
+        v1, api_client = api_returning({
+            "kind": "Secret",
+            "metadata": {"name": "mysecret", "namespace": "myns", "annotations": {"a": "b"}},
+            "data": {"key": "dmFsdWU="},
+        })
+
+        self.assertEqual(
+            v1.read_namespaced_secret_record("mysecret", "myns"),
+            SecretRecord("mysecret", "myns", {"a": "b"}, {"key": "dmFsdWU="}),
+        )
+        self.assertEqual(api_client.call_api.call_args.kwargs["header_params"], {"Accept": "application/json"})
+
+    def test_writes_drained(self):
+        """The responses of the secret writes are drained without being decoded.
+        """
+        response = Mock(spec=["drain_conn", "release_conn"])
+        api_client = ApiClient()
+        api_client.call_api = Mock(return_value=response)
+        v1 = SlimCoreV1Api(api_client=api_client)
+
+        self.assertIsNone(v1.replace_namespaced_secret("mysecret", "myns", {"data": {}}))
+        self.assertIsNone(v1.delete_namespaced_secret("mysecret", "myns"))
+
+        self.assertEqual(response.drain_conn.call_count, 2)
+        self.assertEqual(response.release_conn.call_count, 2)
+        for call in api_client.call_api.call_args_list:
+            self.assertFalse(call.kwargs["_preload_content"])
@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client import ApiException
+
+from tracing import TracedApi, span, traced
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:
+    TracerProvider = None
+
+
+class TestTracingDisabled(unittest.TestCase):
+
+    def test_noop(self):
+        """Without a tracer, spans and proxies must be transparent."""
+        with patch("tracing.tracer", None):
+            with span("anything", attribute="value") as current:
+                self.assertIsNone(current)
+
+            api = Mock()
+            api.read_namespaced_secret.return_value = "secret"
+            self.assertEqual(TracedApi(api).read_namespaced_secret("name", "ns"), "secret")
+
+
+@unittest.skipIf(TracerProvider is None, "opentelemetry-sdk is not installed")
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        patcher = patch("tracing.tracer", provider.get_tracer(__name__))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_handler_and_api_spans(self):
+        """API calls must be child spans of the handler span, with namespace and outcome."""
+        api = Mock()
+        api.patch_namespaced_secret.side_effect = [None, ApiException(status=404, reason="Not Found")]
+        traced_api = TracedApi(api)
+
+        @traced
+        async def handler(name, uid, **_):
+            traced_api.patch_namespaced_secret(name=name, namespace="ns1", body={})
+            try:
+                traced_api.patch_namespaced_secret(name, "ns2", {})
+            except ApiException:
+                pass
+
+        asyncio.run(handler(name="mysecret", uid="mysecretuid", reason="update"))
+
+        spans = {s.name + ":" + str(s.attributes.get("k8s.namespace")): s for s in self.exporter.get_finished_spans()}
+        root = spans["handler handler:None"]
+        ok = spans["k8s patch_namespaced_secret:ns1"]
+        not_found = spans["k8s patch_namespaced_secret:ns2"]
+
+        self.assertEqual(root.attributes["k8s.uid"], "mysecretuid")
+        self.assertEqual(root.attributes["kopf.reason"], "update")
+        self.assertEqual(ok.parent.span_id, root.context.span_id)
+        self.assertEqual(ok.attributes["outcome"], "ok")
+        self.assertEqual(not_found.attributes["k8s.name"], "mysecret")
+        self.assertEqual(not_found.attributes["outcome"], 404)
@@ -0,0 +1,48 @@
+import threading
+import time
+from typing import Any
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting calls to ``qps`` per second.
+
+    A ``qps`` of 0 or less disables the limit.
+    """
+
+    def __init__(self, qps: float, burst: int = 1) -> None:
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.qps <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.qps if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ThrottledApi:
+    """Proxy of a Kubernetes API client acquiring the rate limiter before each call."""
+
+    def __init__(self, api: Any, limiter: RateLimiter) -> None:
+        self.api = api
+        self.limiter = limiter
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.api, name)
+        if not callable(attribute):
+            return attribute
+
+        def throttled(*args, **kwargs):
+            self.limiter.acquire()
+            return attribute(*args, **kwargs)
+
+        return throttled
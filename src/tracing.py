@@ -0,0 +1,112 @@
+"""
+Optional OpenTelemetry tracing.
+
+Without the opentelemetry packages, or when tracing is not enabled, every
+helper here is a no-op. The packages are only imported once tracing is set up.
+"""
+import functools
+import inspect
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+tracer: Optional[Any] = None
+
+
+def setup_tracing(logger: logging.Logger, service_name: str = 'clustersecret') -> bool:
+    """Install a tracer exporting spans with OTLP, configured by the usual OTEL_EXPORTER_OTLP_* variables
+    """
+    global tracer
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning('Tracing is enabled but the opentelemetry packages are not installed')
+        return False
+
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({'service.name': service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer(__name__)
+    return True
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Any]]:
+    """Child span of the current one, recording the exception and an outcome attribute
+    """
+    if tracer is None:
+        yield None
+        return
+
+    with tracer.start_as_current_span(name, record_exception=False, set_status_on_exception=False) as current:
+        for key, value in attributes.items():
+            if value is not None:
+                current.set_attribute(key, value)
+        try:
+            yield current
+        except Exception as e:
+            from opentelemetry.trace import Status, StatusCode
+            current.set_attribute('outcome', getattr(e, 'status', None) or type(e).__name__)
+            current.record_exception(e)
+            current.set_status(Status(StatusCode.ERROR, str(e)))
+            raise
+        current.set_attribute('outcome', 'ok')
+
+
+def _handler_attributes(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    attributes = {'k8s.name': kwargs.get('name'), 'k8s.uid': kwargs.get('uid')}
+    if 'reason' in kwargs:
+        attributes['kopf.reason'] = str(kwargs['reason'])
+    if 'retry' in kwargs:
+        attributes['kopf.retry'] = kwargs['retry']
+    return attributes
+
+
+def traced(fn: Callable) -> Callable:
+    """Root span around a kopf handler, named after it
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with span(f'handler {fn.__name__}', **_handler_attributes(kwargs)):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(f'handler {fn.__name__}', **_handler_attributes(kwargs)):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _call_attributes(method: str, args: tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Namespace and name of a Kubernetes API call, whether passed by position or keyword"""
+    positional = ['namespace', 'body'] if method.startswith('create_') else ['name', 'namespace']
+    if 'namespaced' not in method:
+        positional = positional[:1] if method.startswith(('read_', 'replace_', 'patch_', 'delete_')) else []
+    values = dict(zip(positional, args))
+    values.update(kwargs)
+    return {'k8s.namespace': values.get('namespace'), 'k8s.name': values.get('name')}
+
+
+class TracedApi:
+    """Proxy of a Kubernetes API client running each call in its own span."""
+
+    def __init__(self, api: Any) -> None:
+        self.api = api
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.api, name)
+        if not callable(attribute):
+            return attribute
+
+        def traced_call(*args, **kwargs):
+            with span(f'k8s {name}', **_call_attributes(name, args, kwargs)):
+                return attribute(*args, **kwargs)
+
+        return traced_call